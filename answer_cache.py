@@ -0,0 +1,182 @@
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_query(query):
+    """
+    Normalizes a query so that trivially different phrasings share a cache key.
+
+    Args:
+        query (str): The natural language query.
+
+    Returns:
+        str: The lower-cased query with collapsed whitespace and no trailing punctuation.
+    """
+    normalized = re.sub(r"\s+", " ", query.strip().lower())
+    return normalized.rstrip("?!. ")
+
+
+def cosine_similarity(a, b):
+    """
+    Computes the cosine similarity between two vectors.
+
+    Args:
+        a (list): The first vector.
+        b (list): The second vector.
+
+    Returns:
+        float: The cosine similarity, or 0.0 if either vector is empty.
+    """
+    dot = sum(x * y for x, y in zip(a, b))
+    norm_a = math.sqrt(sum(x * x for x in a))
+    norm_b = math.sqrt(sum(y * y for y in b))
+    if norm_a == 0 or norm_b == 0:
+        return 0.0
+    return dot / (norm_a * norm_b)
+
+
+class AnswerCache:
+    """
+    In-process LRU cache of answers keyed by normalized query text.
+
+    Lookups first try an exact match on the normalized query. If an embedding
+    function and a similarity threshold are configured, a miss falls back to
+    the most similar cached query above the threshold. Entries expire after
+    `ttl_seconds` and the whole cache is dropped when the knowledge base ID changes.
+    """
+
+    def __init__(self, max_entries=256, ttl_seconds=3600, embed_fn=None, similarity_threshold=None):
+        """
+        Args:
+            max_entries (int): Maximum number of cached answers before the least recently used is evicted.
+            ttl_seconds (float): Lifetime of a cached answer in seconds.
+            embed_fn (callable): Optional function mapping text to an embedding vector.
+            similarity_threshold (float): Minimum cosine similarity for a similarity hit (e.g. 0.95).
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()
+        self._kb_id = None
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "similar_hits": 0, "misses": 0, "saved_seconds": 0.0}
+
+    @property
+    def similarity_enabled(self):
+        return self.embed_fn is not None and self.similarity_threshold is not None
+
+    def _check_kb_id(self, kb_id):
+        # Answers from another knowledge base are stale, drop everything
+        if kb_id != self._kb_id:
+            self._entries.clear()
+            self._kb_id = kb_id
+
+    def _live_entry(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if now - entry["created"] > self.ttl_seconds:
+            del self._entries[key]
+            return None
+        return entry
+
+    def _record_hit(self, key, entry, kind):
+        self._entries.move_to_end(key)
+        self._stats[kind] += 1
+        self._stats["saved_seconds"] += entry["cost_seconds"]
+        return entry["answer"]
+
+    def get(self, query, kb_id):
+        """
+        Looks up a cached answer for a query.
+
+        Args:
+            query (str): The natural language query.
+            kb_id (str): The knowledge base ID the answer must come from.
+
+        Returns:
+            tuple: The cached answer (or None on a miss) and the query embedding computed
+            for the similarity tier (or None), which can be passed back to `put`.
+        """
+        key = normalize_query(query)
+        now = time.monotonic()
+        with self._lock:
+            self._check_kb_id(kb_id)
+            entry = self._live_entry(key, now)
+            if entry is not None:
+                return self._record_hit(key, entry, "exact_hits"), None
+
+        if not self.similarity_enabled:
+            with self._lock:
+                self._stats["misses"] += 1
+            return None, None
+
+        # Embed outside the lock, it is a network call
+        embedding = self.embed_fn(key)
+        with self._lock:
+            best_key, best_score = None, self.similarity_threshold
+            for cached_key in list(self._entries):
+                entry = self._live_entry(cached_key, now)
+                if entry is None or entry["embedding"] is None:
+                    continue
+                score = cosine_similarity(embedding, entry["embedding"])
+                if score >= best_score:
+                    best_key, best_score = cached_key, score
+            if best_key is not None:
+                return self._record_hit(best_key, self._entries[best_key], "similar_hits"), embedding
+            self._stats["misses"] += 1
+        return None, embedding
+
+    def put(self, query, kb_id, answer, cost_seconds=0.0, embedding=None):
+        """
+        Stores an answer for a query.
+
+        Args:
+            query (str): The natural language query.
+            kb_id (str): The knowledge base ID the answer came from.
+            answer (str): The answer to cache.
+            cost_seconds (float): Time it took to produce the answer, credited back on every hit.
+            embedding (list): The query embedding returned by `get`, if any.
+        """
+        key = normalize_query(query)
+        if embedding is None and self.similarity_enabled:
+            embedding = self.embed_fn(key)
+        with self._lock:
+            self._check_kb_id(kb_id)
+            self._entries[key] = {
+                "answer": answer,
+                "embedding": embedding,
+                "created": time.monotonic(),
+                "cost_seconds": cost_seconds,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """
+        Drops every cached answer.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns hit and miss counters for the cache.
+
+        Returns:
+            dict: Exact hits, similarity hits, misses, hit rate, current size and the
+            model/retrieval seconds saved by hits.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        hits = stats["exact_hits"] + stats["similar_hits"]
+        lookups = hits + stats["misses"]
+        stats["hits"] = hits
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,846 @@
+import json
+import os
+import threading
+import time
+
+import deadline
+import tracing
+from deadline import DeadlineExceeded
+
+# Shared settings for every boto3 client created by this module
+REGION = os.environ.get("BEDROCK_REGION", "us-west-2")
+MAX_POOL_CONNECTIONS = int(os.environ.get("BEDROCK_MAX_POOL_CONNECTIONS", "50"))
+MAX_ATTEMPTS = int(os.environ.get("BEDROCK_MAX_ATTEMPTS", "8"))
+READ_TIMEOUT = int(os.environ.get("BEDROCK_READ_TIMEOUT", "300"))
+
+SONNET_MODEL_ID = "anthropic.claude-3-sonnet-20240229-v1:0"
+HAIKU_MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
+CLAUDE_V2_MODEL_ID = "anthropic.claude-v2"
+TITAN_TEXT_MODEL_ID = "amazon.titan-text-lite-v1"
+TITAN_EMBED_MODEL_ID = "amazon.titan-embed-text-v1"
+
+# Client-side quotas per model, in requests and tokens per minute. Models that
+# are not listed are not rate limited. Adjust to the quotas of your account.
+MODEL_QUOTAS = {
+    SONNET_MODEL_ID: {"rpm": 200, "tpm": 400000},
+    HAIKU_MODEL_ID: {"rpm": 400, "tpm": 600000},
+    CLAUDE_V2_MODEL_ID: {"rpm": 200, "tpm": 400000},
+    TITAN_TEXT_MODEL_ID: {"rpm": 400, "tpm": 300000},
+    TITAN_EMBED_MODEL_ID: {"rpm": 2000, "tpm": 300000},
+}
+
+# On-demand prices in USD per 1,000 input and output tokens, for cost accounting
+MODEL_PRICES = {
+    SONNET_MODEL_ID: (0.003, 0.015),
+    HAIKU_MODEL_ID: (0.00025, 0.00125),
+    CLAUDE_V2_MODEL_ID: (0.008, 0.024),
+    TITAN_TEXT_MODEL_ID: (0.00015, 0.0002),
+    TITAN_EMBED_MODEL_ID: (0.0001, 0.0),
+}
+
+_clients = {}
+_limiters = {}
+_stats = {}
+_lock = threading.Lock()
+
+
+def client_config():
+    """
+    Builds the botocore configuration shared by all clients.
+
+    Adaptive retry mode retries throttling and transient errors with
+    exponential backoff and jitter, and slows the client down when the
+    service keeps throttling, instead of firing retry storms.
+
+    Returns:
+        Config: The botocore client configuration.
+    """
+    from botocore.config import Config
+
+    return Config(
+        region_name=REGION,
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        read_timeout=READ_TIMEOUT,
+        retries={"mode": "adaptive", "max_attempts": MAX_ATTEMPTS},
+        tcp_keepalive=True,
+    )
+
+
+def get_client(service_name):
+    """
+    Returns the process-wide boto3 client for a service, creating it on first use.
+    boto3 itself is only imported here, so importing this module stays cheap on cold starts.
+
+    Setting `<SERVICE>_ENDPOINT_URL` (e.g. BEDROCK_RUNTIME_ENDPOINT_URL) points the
+    client at a local stub instead of AWS.
+
+    Args:
+        service_name (str): The boto3 service name, e.g. 'bedrock-runtime'.
+
+    Returns:
+        The boto3 client.
+    """
+    client = _clients.get(service_name)
+    if client is not None:
+        return client
+    with _lock:
+        if service_name not in _clients:
+            import boto3
+
+            endpoint_env = service_name.upper().replace("-", "_") + "_ENDPOINT_URL"
+            client = boto3.client(
+                service_name,
+                config=client_config(),
+                endpoint_url=os.environ.get(endpoint_env),
+            )
+            # Every API call of the client becomes a span, e.g. aws.s3.GetObject
+            tracing.instrument_client(client)
+            _clients[service_name] = client
+        return _clients[service_name]
+
+
+def set_client(service_name, client):
+    """
+    Replaces the client used for a service, e.g. with a local stub.
+
+    Args:
+        service_name (str): The boto3 service name.
+        client: The client to use, or None to create a new one on next use.
+    """
+    with _lock:
+        if client is None:
+            _clients.pop(service_name, None)
+        else:
+            _clients[service_name] = client
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `rate_per_minute`, holding at most one minute of capacity.
+    """
+
+    def __init__(self, rate_per_minute):
+        self.capacity = float(rate_per_minute)
+        self.tokens = float(rate_per_minute)
+        self.fill_rate = rate_per_minute / 60.0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+        self.updated = now
+
+    def acquire(self, amount, timeout=None):
+        """
+        Takes tokens from the bucket, waiting until enough are available.
+
+        Args:
+            amount (float): Number of tokens to take. Requests larger than the capacity take the whole bucket.
+            timeout (float): Maximum seconds to wait, or None to wait as long as needed.
+
+        Returns:
+            float: Seconds spent waiting.
+
+        Raises:
+            TimeoutError: If the tokens would not be available within the timeout. Nothing is taken.
+        """
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                wait = (amount - self.tokens) / self.fill_rate
+            if timeout is not None and waited + wait > timeout:
+                raise TimeoutError(f"Rate limit would delay the call by {waited + wait:.1f}s")
+            time.sleep(wait)
+            waited += wait
+
+    def release(self, amount):
+        """
+        Returns unused tokens to the bucket.
+
+        Args:
+            amount (float): Number of tokens to return.
+        """
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class ModelRateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limiter for one model.
+
+    Each call reserves its estimated input tokens plus `max_tokens` and
+    returns the unused part of the reservation once the real usage is known.
+    """
+
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+    def acquire(self, reserved_tokens, timeout=None):
+        waited = self.requests.acquire(1, timeout)
+        try:
+            return waited + self.tokens.acquire(reserved_tokens, None if timeout is None else timeout - waited)
+        except TimeoutError:
+            self.requests.release(1)
+            raise
+
+    def settle(self, reserved_tokens, used_tokens):
+        if used_tokens < reserved_tokens:
+            self.tokens.release(reserved_tokens - used_tokens)
+
+
+def set_quota(model_id, rpm, tpm):
+    """
+    Sets the client-side quota of a model.
+
+    Args:
+        model_id (str): The Bedrock model ID.
+        rpm (int): Requests per minute, or None to disable rate limiting for the model.
+        tpm (int): Tokens per minute.
+    """
+    with _lock:
+        if rpm is None:
+            MODEL_QUOTAS.pop(model_id, None)
+        else:
+            MODEL_QUOTAS[model_id] = {"rpm": rpm, "tpm": tpm}
+        _limiters.pop(model_id, None)
+
+
+def get_limiter(model_id):
+    with _lock:
+        limiter = _limiters.get(model_id)
+        if limiter is None and model_id in MODEL_QUOTAS:
+            quota = MODEL_QUOTAS[model_id]
+            limiter = _limiters[model_id] = ModelRateLimiter(quota["rpm"], quota["tpm"])
+        return limiter
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English text and code
+    return len(text) // 4 + 1
+
+
+def estimate_input_tokens(body):
+    """
+    Estimates the input tokens of a request body without calling the model.
+
+    Args:
+        body (dict): The model-specific request body.
+
+    Returns:
+        int: The estimated number of input tokens.
+    """
+    if "messages" not in body:
+        return estimate_tokens(body.get("prompt") or body.get("inputText") or "")
+    tokens = estimate_tokens(body.get("system", ""))
+    for message in body["messages"]:
+        content = message["content"]
+        if isinstance(content, str):
+            tokens += estimate_tokens(content)
+            continue
+        for block in content:
+            if block.get("type") == "image":
+                # Claude resizes images to at most ~1600 tokens, the base64 size is irrelevant
+                tokens += 1600
+            else:
+                tokens += estimate_tokens(block.get("text", ""))
+    return tokens
+
+
+def max_output_tokens(body):
+    for key in ("max_tokens", "max_tokens_to_sample"):
+        if key in body:
+            return body[key]
+    return body.get("textGenerationConfig", {}).get("maxTokenCount", 0)
+
+
+def fit_to_deadline(body):
+    """
+    Prepares a request for the time left in the current invocation.
+
+    The maximum number of output tokens is capped to what can be generated
+    before the deadline. Outside of a deadline the body is returned as it is.
+
+    Args:
+        body (dict): The model-specific request body.
+
+    Returns:
+        dict: The request body to send, a copy if it was changed.
+
+    Raises:
+        DeadlineExceeded: If there is no time left for a useful answer.
+    """
+    requested = max_output_tokens(body)
+    if not requested or deadline.remaining() is None:
+        return body
+    allowed = deadline.fit_max_tokens(requested)
+    if allowed == requested:
+        return body
+    body = dict(body)
+    for key in ("max_tokens", "max_tokens_to_sample"):
+        if key in body:
+            body[key] = allowed
+            return body
+    body["textGenerationConfig"] = dict(body["textGenerationConfig"], maxTokenCount=allowed)
+    return body
+
+
+def acquire_quota(model_id, reserved):
+    # Waits for the client-side quota, but never past the deadline of the invocation
+    limiter = get_limiter(model_id)
+    if limiter is None:
+        return None, 0.0
+    try:
+        return limiter, limiter.acquire(reserved, deadline.budget(stage="rate limiter"))
+    except TimeoutError as e:
+        if isinstance(e, DeadlineExceeded):
+            raise
+        raise DeadlineExceeded("rate limiter")
+
+
+def record_call(model_id, latency, input_tokens, output_tokens, error=None, throttled_seconds=0.0, first_token=None):
+    """
+    Records latency and token usage of one model call, in the process-wide stats and as a
+    'model.invoke' span of the current trace.
+
+    Args:
+        model_id (str): The Bedrock model ID.
+        latency (float): Seconds from request to last byte.
+        input_tokens (int): Input tokens reported by Bedrock.
+        output_tokens (int): Output tokens reported by Bedrock.
+        error (str): Error code if the call failed.
+        throttled_seconds (float): Seconds spent waiting on the client-side rate limiter.
+        first_token (float): Seconds to the first streamed chunk, for streaming calls.
+    """
+    with _lock:
+        stats = _stats.setdefault(model_id, {
+            "calls": 0,
+            "errors": 0,
+            "total_latency": 0.0,
+            "max_latency": 0.0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "throttled_seconds": 0.0,
+        })
+        stats["calls"] += 1
+        stats["total_latency"] += latency
+        stats["max_latency"] = max(stats["max_latency"], latency)
+        stats["input_tokens"] += input_tokens
+        stats["output_tokens"] += output_tokens
+        stats["throttled_seconds"] += throttled_seconds
+        if error is not None:
+            stats["errors"] += 1
+    attributes = {"model_id": model_id, "input_tokens": input_tokens, "output_tokens": output_tokens}
+    if throttled_seconds:
+        attributes["throttled_seconds"] = round(throttled_seconds, 3)
+    if first_token is not None:
+        attributes["first_token_ms"] = round(first_token * 1000, 3)
+    if error is not None:
+        attributes["error"] = error
+    tracing.record_span("model.invoke", latency, **attributes)
+
+
+def get_stats():
+    """
+    Returns per-model call statistics.
+
+    Returns:
+        dict: Per model ID, call and error counts, total/average/max latency in seconds,
+        input and output tokens, their cost in USD, and time spent waiting on the rate limiter.
+    """
+    with _lock:
+        stats = {model_id: dict(values) for model_id, values in _stats.items()}
+    for model_id, values in stats.items():
+        values["avg_latency"] = values["total_latency"] / values["calls"] if values["calls"] else 0.0
+        values["cost"] = model_cost(model_id, values["input_tokens"], values["output_tokens"])
+    return stats
+
+
+def model_cost(model_id, input_tokens, output_tokens):
+    """
+    Computes the on-demand cost of a model call from MODEL_PRICES.
+
+    Args:
+        model_id (str): The Bedrock model ID.
+        input_tokens (int): Input tokens.
+        output_tokens (int): Output tokens.
+
+    Returns:
+        float: The cost in USD, 0 for models without a price.
+    """
+    input_price, output_price = MODEL_PRICES.get(model_id, (0.0, 0.0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1000
+
+
+def reset_stats():
+    with _lock:
+        _stats.clear()
+
+
+def error_code(error):
+    response = getattr(error, "response", None) or {}
+    return response.get("Error", {}).get("Code", type(error).__name__)
+
+
+# Error events of a response stream; they arrive instead of a chunk once the stream has started
+STREAM_ERROR_EVENTS = (
+    "internalServerException",
+    "modelStreamErrorException",
+    "modelTimeoutException",
+    "serviceUnavailableException",
+    "throttlingException",
+    "validationException",
+)
+
+
+def stream_error(event):
+    """
+    Turns an error event of a response stream into the ClientError botocore raises for the same error.
+
+    Args:
+        event (dict): The stream event.
+
+    Returns:
+        ClientError: The error, with e.g. 'ThrottlingException' as its code, or None if the event is no error.
+    """
+    from botocore.exceptions import ClientError
+
+    for name in STREAM_ERROR_EVENTS:
+        if name in event:
+            error = event[name] or {}
+            return ClientError(
+                {"Error": {"Code": name[0].upper() + name[1:], "Message": error.get("message", "")}},
+                "InvokeModelWithResponseStream",
+            )
+    return None
+
+
+def invoke_model(model_id, body, usage=None):
+    """
+    Invokes a Bedrock model and returns the parsed response body.
+
+    Args:
+        model_id (str): The Bedrock model ID.
+        body (dict): The model-specific request body.
+        usage (dict): If given, filled with the input_tokens and output_tokens reported by Bedrock.
+
+    Returns:
+        dict: The parsed response body.
+    """
+    body = fit_to_deadline(body)
+    body_json = json.dumps(body)
+    reserved = estimate_input_tokens(body) + max_output_tokens(body)
+    limiter, throttled = acquire_quota(model_id, reserved)
+
+    start = time.monotonic()
+    input_tokens = output_tokens = 0
+    try:
+        response = get_client("bedrock-runtime").invoke_model(
+            body=body_json, modelId=model_id, accept="application/json", contentType="application/json"
+        )
+        response_body = json.loads(response.get("body").read())
+    except Exception as e:
+        record_call(model_id, time.monotonic() - start, 0, 0, error=error_code(e), throttled_seconds=throttled)
+        if limiter:
+            limiter.settle(reserved, 0)
+        raise
+    headers = response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+    input_tokens = int(headers.get("x-amzn-bedrock-input-token-count", 0))
+    output_tokens = int(headers.get("x-amzn-bedrock-output-token-count", 0))
+    record_call(model_id, time.monotonic() - start, input_tokens, output_tokens, throttled_seconds=throttled)
+    if limiter:
+        limiter.settle(reserved, input_tokens + output_tokens)
+    if usage is not None:
+        usage.update(input_tokens=input_tokens, output_tokens=output_tokens)
+    return response_body
+
+
+def invoke_model_stream(model_id, body, usage=None):
+    """
+    Invokes a Bedrock model with a streaming response.
+
+    Args:
+        model_id (str): The Bedrock model ID.
+        body (dict): The model-specific request body.
+        usage (dict): If given, filled with the input_tokens and output_tokens reported by Bedrock
+            in the last chunk of the stream.
+
+    Yields:
+        dict: The parsed response chunks.
+
+    Raises:
+        DeadlineExceeded: If the invocation deadline passes while the response is streaming.
+        ClientError: If the stream ends with an error event, e.g. a ThrottlingException.
+    """
+    body = fit_to_deadline(body)
+    body_json = json.dumps(body)
+    reserved = estimate_input_tokens(body) + max_output_tokens(body)
+    limiter, throttled = acquire_quota(model_id, reserved)
+
+    start = time.monotonic()
+    input_tokens = output_tokens = 0
+    first_byte = None
+    try:
+        response = get_client("bedrock-runtime").invoke_model_with_response_stream(
+            body=body_json, modelId=model_id, accept="application/json", contentType="application/json"
+        )
+        for event in response.get("body"):
+            if "chunk" not in event:
+                error = stream_error(event)
+                if error is not None:
+                    raise error
+                continue
+            chunk = json.loads(event["chunk"]["bytes"])
+            if first_byte is None:
+                first_byte = time.monotonic() - start
+            metrics = chunk.get("amazon-bedrock-invocationMetrics")
+            if metrics:
+                input_tokens = metrics.get("inputTokenCount", 0)
+                output_tokens = metrics.get("outputTokenCount", 0)
+                if usage is not None:
+                    usage.update(input_tokens=input_tokens, output_tokens=output_tokens)
+            deadline.check("model stream")
+            yield chunk
+    except GeneratorExit:
+        # The caller stopped reading, e.g. after a client disconnect
+        record_call(model_id, time.monotonic() - start, input_tokens, output_tokens,
+                    error="Cancelled", throttled_seconds=throttled, first_token=first_byte)
+        if limiter:
+            limiter.settle(reserved, input_tokens + output_tokens)
+        raise
+    except Exception as e:
+        record_call(model_id, time.monotonic() - start, input_tokens, output_tokens,
+                    error=error_code(e), throttled_seconds=throttled, first_token=first_byte)
+        if limiter:
+            limiter.settle(reserved, input_tokens + output_tokens)
+        raise
+    record_call(model_id, time.monotonic() - start, input_tokens, output_tokens,
+                throttled_seconds=throttled, first_token=first_byte)
+    if limiter:
+        limiter.settle(reserved, input_tokens + output_tokens)
+
+
+def claude_messages_config(prompt, max_tokens=4096, **params):
+    """
+    Builds a Claude Messages API request body for a single text prompt.
+
+    Args:
+        prompt (str): The prompt to send to the model.
+        max_tokens (int): Maximum number of tokens to generate.
+        **params: Extra request parameters such as temperature or system.
+
+    Returns:
+        dict: The request body.
+    """
+    prompt_config = {
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": max_tokens,
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                ],
+            }
+        ],
+    }
+    prompt_config.update(params)
+    return prompt_config
+
+
+def stream_claude_messages(prompt_config, model_id=SONNET_MODEL_ID):
+    """
+    Streams the text of a Claude Messages API response as it is generated.
+
+    Args:
+        prompt_config (dict): The Messages API request body.
+        model_id (str): The Bedrock model ID.
+
+    Yields:
+        str: Text chunks in the order the model produces them.
+    """
+    body_format = MessagesFormat()
+    for chunk in invoke_model_stream(model_id, prompt_config):
+        text = body_format.chunk_text(chunk)
+        if text:
+            yield text
+
+
+def call_claude_messages(prompt_config, model_id=SONNET_MODEL_ID):
+    """
+    Calls a Claude Messages API model and returns the text of the response.
+
+    Args:
+        prompt_config (dict): The Messages API request body.
+        model_id (str): The Bedrock model ID.
+
+    Returns:
+        str: The response from the model.
+    """
+    return MessagesFormat().text(invoke_model(model_id, prompt_config))
+
+
+def collect_stream(chunks):
+    """
+    Buffers a stream of text chunks into a single string.
+
+    Args:
+        chunks (iterable): The text chunks.
+
+    Returns:
+        str: The concatenated text.
+
+    Raises:
+        DeadlineExceeded: If the stream ran out of time, with the text received so far as `partial`.
+    """
+    collected = []
+    try:
+        for chunk in chunks:
+            collected.append(chunk)
+    except DeadlineExceeded as e:
+        e.partial = e.partial or "".join(collected)
+        raise
+    return "".join(collected)
+
+
+def stream_claude_sonnet(prompt, max_tokens=4096):
+    """
+    Calls the Claude 3 Sonnet model with a given prompt and streams the response.
+
+    Args:
+        prompt (str): The prompt to send to the model.
+        max_tokens (int): Maximum number of tokens to generate.
+
+    Yields:
+        str: Text chunks of the response from the model.
+    """
+    return stream_claude_messages(claude_messages_config(prompt, max_tokens))
+
+
+def call_claude_sonnet(prompt, max_tokens=4096):
+    """
+    Calls the Claude 3 Sonnet model with a given prompt.
+
+    Args:
+        prompt (str): The prompt to send to the model.
+        max_tokens (int): Maximum number of tokens to generate.
+
+    Returns:
+        str: The response from the model.
+    """
+    return collect_stream(stream_claude_sonnet(prompt, max_tokens))
+
+
+def claude_prompt_format(prompt: str) -> str:
+    """
+    Formats the prompt for the legacy Claude completion API.
+
+    Args:
+        prompt (str): The original prompt.
+
+    Returns:
+        str: The formatted prompt.
+    """
+    return f"\n\nHuman: {prompt}\n\nAssistant:"
+
+
+class MessagesFormat:
+    """
+    Request and response format of the Claude 3 Messages API.
+    """
+
+    def request(self, prompt, max_tokens, temperature=None, top_p=None, stop_sequences=None, system=None, **params):
+        body = claude_messages_config(prompt, max_tokens, **params)
+        for key, value in (("temperature", temperature), ("top_p", top_p),
+                           ("stop_sequences", stop_sequences), ("system", system)):
+            if value is not None:
+                body[key] = value
+        return body
+
+    def text(self, response_body):
+        return "".join(block.get("text", "") for block in response_body.get("content", []))
+
+    def truncated(self, response_body):
+        return response_body.get("stop_reason") == "max_tokens"
+
+    def chunk_text(self, chunk):
+        if chunk.get("type") == "content_block_delta":
+            return chunk["delta"].get("text")
+        return None
+
+    def chunk_truncated(self, chunk):
+        return chunk.get("type") == "message_delta" and chunk["delta"].get("stop_reason") == "max_tokens"
+
+
+class CompletionFormat:
+    """
+    Request and response format of the legacy Claude text completion API.
+    """
+
+    def request(self, prompt, max_tokens, temperature=None, top_p=None, stop_sequences=None, system=None, **params):
+        if system:
+            prompt = system + "\n\n" + prompt
+        body = {"prompt": claude_prompt_format(prompt), "max_tokens_to_sample": max_tokens}
+        for key, value in (("temperature", temperature), ("top_p", top_p), ("stop_sequences", stop_sequences)):
+            if value is not None:
+                body[key] = value
+        body.update(params)
+        return body
+
+    def text(self, response_body):
+        return response_body.get("completion", "")
+
+    def truncated(self, response_body):
+        return response_body.get("stop_reason") == "max_tokens"
+
+    def chunk_text(self, chunk):
+        return chunk.get("completion")
+
+    def chunk_truncated(self, chunk):
+        return chunk.get("stop_reason") == "max_tokens"
+
+
+class TitanFormat:
+    """
+    Request and response format of the Amazon Titan Text models.
+    """
+
+    def request(self, prompt, max_tokens, temperature=None, top_p=None, stop_sequences=None, system=None, **params):
+        if system:
+            prompt = system + "\n\n" + prompt
+        config = {"maxTokenCount": max_tokens}
+        for key, value in (("temperature", temperature), ("topP", top_p), ("stopSequences", stop_sequences)):
+            if value is not None:
+                config[key] = value
+        config.update(params)
+        return {"inputText": prompt, "textGenerationConfig": config}
+
+    def text(self, response_body):
+        return "".join(result.get("outputText", "") for result in response_body.get("results", []))
+
+    def truncated(self, response_body):
+        return any(result.get("completionReason") == "LENGTH" for result in response_body.get("results", []))
+
+    def chunk_text(self, chunk):
+        return chunk.get("outputText")
+
+    def chunk_truncated(self, chunk):
+        return chunk.get("completionReason") == "LENGTH"
+
+
+def model_format(model_id):
+    """
+    Returns the request and response format of a text model.
+
+    Args:
+        model_id (str): The Bedrock model ID.
+
+    Returns:
+        MessagesFormat, CompletionFormat or TitanFormat.
+
+    Raises:
+        ValueError: If the model family is not supported.
+    """
+    if model_id.startswith("anthropic.claude-3"):
+        return MessagesFormat()
+    if model_id.startswith("anthropic.claude"):
+        return CompletionFormat()
+    if model_id.startswith("amazon.titan-text"):
+        return TitanFormat()
+    raise ValueError(f"Unsupported text model: {model_id}")
+
+
+def generate(model_id, prompt, max_tokens=4096, **params):
+    """
+    Calls any supported text model with a single prompt, hiding its request and response format.
+
+    Args:
+        model_id (str): The Bedrock model ID.
+        prompt (str): The prompt to send to the model.
+        max_tokens (int): Maximum number of tokens to generate.
+        **params: temperature, top_p, stop_sequences and system work for every model;
+            other parameters are passed to the model as they are.
+
+    Returns:
+        dict: The response `text`, whether it was `truncated` at max_tokens, and its
+        `input_tokens` and `output_tokens`.
+    """
+    body_format = model_format(model_id)
+    usage = {"input_tokens": 0, "output_tokens": 0}
+    response_body = invoke_model(model_id, body_format.request(prompt, max_tokens, **params), usage)
+    return {
+        "text": body_format.text(response_body),
+        "truncated": body_format.truncated(response_body),
+        **usage,
+    }
+
+
+def stream_generate(model_id, prompt, max_tokens=4096, usage=None, **params):
+    """
+    Streaming version of generate.
+
+    Args:
+        model_id (str): The Bedrock model ID.
+        prompt (str): The prompt to send to the model.
+        max_tokens (int): Maximum number of tokens to generate.
+        usage (dict): If given, filled with the input_tokens and output_tokens of the call,
+            and with `truncated` once the response stops at max_tokens.
+        **params: Request parameters, see generate.
+
+    Yields:
+        str: Text chunks in the order the model produces them.
+    """
+    body_format = model_format(model_id)
+    for chunk in invoke_model_stream(model_id, body_format.request(prompt, max_tokens, **params), usage):
+        if usage is not None and body_format.chunk_truncated(chunk):
+            usage["truncated"] = True
+        text = body_format.chunk_text(chunk)
+        if text:
+            yield text
+
+
+def call_claude(prompt):
+    """
+    Calls the Claude v2 model with a formatted prompt.
+
+    Args:
+        prompt (str): The prompt to send to the model.
+
+    Returns:
+        str: The response from the model.
+    """
+    return generate(CLAUDE_V2_MODEL_ID, prompt, 4096, temperature=0.7, top_p=0.5, stop_sequences=[], top_k=250)["text"]
+
+
+def call_titan(prompt):
+    """
+    Calls the Amazon Titan Text Lite model with a given prompt.
+
+    Args:
+        prompt (str): The prompt to send to the model.
+
+    Returns:
+        str: The response from the model.
+    """
+    return generate(TITAN_TEXT_MODEL_ID, prompt, 4096, temperature=0.7, top_p=1, stop_sequences=[])["text"]
+
+
+def call_titan_embeddings(text):
+    """
+    Embeds a text with the Amazon Titan embeddings model.
+
+    Args:
+        text (str): The text to embed.
+
+    Returns:
+        list: The embedding vector.
+    """
+    response_body = invoke_model(TITAN_EMBED_MODEL_ID, {"inputText": text})
+    return response_body["embedding"]
@@ -0,0 +1,191 @@
+"""
+Cold-start benchmark for the agent action group handlers.
+
+Every sample runs in a fresh Python process and measures, per route:
+
+- import: time to `import index` (and everything it imports)
+- first: time of the first handler invocation, including lazy imports and index loads
+- warm: time of a second invocation in the same process
+
+Bedrock, Knowledge Bases, S3 and the Infracost CLI are replaced with the stubs
+in stubs.py with zero latency, so the numbers only contain the work done by
+our own code and its dependencies. boto3 client creation is not included
+because the stubs replace the clients.
+
+Usage:
+    python benchmarks/cold_start.py --runs 5
+    python benchmarks/cold_start.py --runs 5 --save-baseline benchmarks/cold_start_baseline.json
+    python benchmarks/cold_start.py --runs 5 --baseline benchmarks/cold_start_baseline.json --tolerance 0.25
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+
+HANDLER_DIRS = {
+    "root": ROOT_DIR,
+    "infracost": os.path.join(ROOT_DIR, "infracost"),
+}
+
+ROUTES = [
+    ("root", "/answer_query", "How do I build an e-commerce website on AWS?"),
+    ("root", "/iac_gen", "Serverless e-commerce website with a MySQL database."),
+    ("root", "/iac_estimate_tool", "Estimate costs."),
+    ("infracost", "/query_well_arch_framework", "What is RDS Proxy?"),
+    ("infracost", "/gen_code", "Write a Python function that uploads a file to S3."),
+]
+
+RESULT_PREFIX = "COLD_START_RESULT "
+
+
+def run_child(handler, api_path, query, workdir):
+    """
+    Measures one cold start inside the current process. Called in a fresh subprocess.
+    """
+    sys.path.insert(0, HANDLER_DIRS[handler])
+    # Shared modules, which the Lambda builds copy next to each handler
+    sys.path.append(ROOT_DIR)
+    os.chdir(workdir)
+    # Every sample gets empty on-disk caches of its own, or the ones after the first
+    # would measure cache hits and the developer's caches under /tmp would fill up
+    cache_dir = tempfile.mkdtemp(prefix="caches-", dir=workdir)
+    os.environ["QUERY_EMBEDDING_CACHE_PATH"] = os.path.join(cache_dir, "embedding-cache.sqlite")
+
+    start = time.perf_counter()
+    import index
+    import_seconds = time.perf_counter() - start
+
+    if hasattr(index.tools, "cost_cache"):
+        index.tools.cost_cache.local_dir = os.path.join(cache_dir, "infracost-cache")
+
+    sys.path.append(BENCHMARK_DIR)
+    import stubs
+
+    clients = stubs.install()
+    stubs.seed_terraform(clients["s3"])
+    stubs.install_fake_infracost(os.path.join(workdir, "bin"))
+    event = stubs.agent_event(api_path, query)
+
+    start = time.perf_counter()
+    response = index.handler(event, None)
+    first_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index.handler(event, None)
+    warm_seconds = time.perf_counter() - start
+
+    result = {
+        "import": import_seconds,
+        "first": first_seconds,
+        "warm": warm_seconds,
+        "status": response["response"]["httpStatusCode"],
+    }
+    print(RESULT_PREFIX + json.dumps(result))
+
+
+def measure(handler, api_path, query, workdir):
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", handler, api_path, query, workdir],
+        capture_output=True,
+        text=True,
+    )
+    for line in completed.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    raise RuntimeError(f"{handler} {api_path} failed:\n{completed.stderr}")
+
+
+def run_benchmark(runs):
+    """
+    Runs every route `runs` times in fresh processes.
+
+    Args:
+        runs (int): Number of cold starts per route.
+
+    Returns:
+        dict: Per route, the median import, first-invocation and warm-invocation seconds.
+    """
+    sys.path.append(BENCHMARK_DIR)
+    import stubs
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        stubs.build_stub_index(os.path.join(workdir, "local_index"))
+        for handler, api_path, query in ROUTES:
+            samples = [measure(handler, api_path, query, workdir) for _ in range(runs)]
+            if any(sample["status"] != 200 for sample in samples):
+                raise RuntimeError(f"{handler} {api_path} returned {samples[0]['status']}")
+            results[f"{handler}:{api_path}"] = {
+                key: statistics.median(sample[key] for sample in samples)
+                for key in ("import", "first", "warm")
+            }
+    return results
+
+
+def compare(results, baseline, tolerance, min_delta=0.005):
+    """
+    Compares results against a baseline.
+
+    Args:
+        results (dict): Results of run_benchmark.
+        baseline (dict): Previously saved results.
+        tolerance (float): Allowed relative slowdown of import + first invocation, e.g. 0.25.
+        min_delta (float): Slowdowns smaller than this many seconds are treated as noise.
+
+    Returns:
+        list: Descriptions of the routes that regressed.
+    """
+    regressions = []
+    for route, values in results.items():
+        if route not in baseline:
+            continue
+        cold = values["import"] + values["first"]
+        baseline_cold = baseline[route]["import"] + baseline[route]["first"]
+        if cold > baseline_cold * (1 + tolerance) and cold - baseline_cold > min_delta:
+            regressions.append(f"{route}: {cold * 1000:.1f} ms vs baseline {baseline_cold * 1000:.1f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="cold starts per route")
+    parser.add_argument("--baseline", help="baseline JSON file to compare against")
+    parser.add_argument("--save-baseline", help="write the results to this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="ignore regressions smaller than this")
+    parser.add_argument("--child", nargs=4, metavar=("HANDLER", "API_PATH", "QUERY", "WORKDIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child)
+        return
+
+    results = run_benchmark(args.runs)
+    print(f"{'route':45} {'import ms':>10} {'first ms':>10} {'warm ms':>10}")
+    for route, values in results.items():
+        print(f"{route:45} {values['import'] * 1000:10.1f} {values['first'] * 1000:10.1f} {values['warm'] * 1000:10.1f}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms / 1000)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""
+Replay benchmark for the agent action group handlers.
+
+Bedrock Agent events are replayed against `index.handler` and
+`infracost/index.handler` with a thread pool, the way concurrent agent
+sessions hit a warm Lambda container. Events come from a JSONL file with one
+recorded event per line, or are generated for every path of
+agent_aws_openapi.json plus the infracost routes.
+
+Bedrock, Knowledge Bases, S3 and the Infracost CLI are replaced with the stubs
+in stubs.py, with configurable latencies, so the benchmark runs offline.
+Each handler runs in its own process and reports, per route, p50/p95/p99
+latency and errors, and per handler the throughput and the peak RSS.
+
+Usage:
+    python benchmarks/replay.py --iterations 20 --concurrency 4 --model-latency 0.2
+    python benchmarks/replay.py --events events.jsonl --concurrency 8
+    python benchmarks/replay.py --save-baseline benchmarks/replay_baseline.json
+    python benchmarks/replay.py --baseline benchmarks/replay_baseline.json --tolerance 0.25
+"""
+import argparse
+import contextlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+
+HANDLER_DIRS = {
+    "root": ROOT_DIR,
+    "infracost": os.path.join(ROOT_DIR, "infracost"),
+}
+
+OPENAPI_PATH = os.path.join(ROOT_DIR, "agent_aws_openapi.json")
+
+# Routes of infracost/index.py, which has no OpenAPI schema in the repository
+INFRACOST_PATHS = ("/query_well_arch_framework", "/gen_code")
+
+# Queries used to generate events, cycled per route
+SAMPLE_QUERIES = {
+    "/answer_query": [
+        "How do I build an e-commerce website on AWS?",
+        "What is RDS Proxy?",
+        "How do SCPs restrict member accounts?",
+    ],
+    "/iac_gen": [
+        "Serverless e-commerce website with a MySQL database.",
+        "Three-tier web application with an Application Load Balancer and RDS.",
+    ],
+    "/iac_estimate_tool": ["Estimate costs."],
+    "/query_well_arch_framework": ["What is RDS Proxy?", "How do I design for reliability?"],
+    "/gen_code": ["Write a Python function that uploads a file to S3."],
+}
+
+RESULT_PREFIX = "REPLAY_RESULT "
+
+
+def handler_for(api_path):
+    return "infracost" if api_path in INFRACOST_PATHS else "root"
+
+
+def generate_events(iterations, distinct=True, openapi_path=OPENAPI_PATH):
+    """
+    Generates agent events for every route of the OpenAPI schema and the infracost handler.
+
+    Args:
+        iterations (int): Events per route.
+        distinct (bool): Make every query unique so that answer caches do not serve repeats.
+        openapi_path (str): The agent OpenAPI schema.
+
+    Returns:
+        list: The events, routes interleaved.
+    """
+    sys.path.append(BENCHMARK_DIR)
+    import stubs
+
+    with open(openapi_path) as f:
+        paths = list(json.load(f)["paths"]) + list(INFRACOST_PATHS)
+    events = []
+    for i in range(iterations):
+        for api_path in paths:
+            queries = SAMPLE_QUERIES.get(api_path, ["Benchmark query."])
+            query = queries[i % len(queries)]
+            if distinct:
+                query = f"{query} (request {i})"
+            events.append(stubs.agent_event(api_path, query, session_id=f"replay-session-{i}"))
+    return events
+
+
+def load_events(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))]
+
+
+def run_child(handler, events_path, workdir, options_json):
+    """
+    Replays events against one handler inside the current process. Called in a fresh subprocess.
+    """
+    options = json.loads(options_json)
+    sys.path.insert(0, HANDLER_DIRS[handler])
+    # Shared modules, which the Lambda builds copy next to each handler
+    sys.path.append(ROOT_DIR)
+    os.chdir(workdir)
+    # Keep the on-disk caches of the handlers inside this run, earlier runs would turn misses into hits
+    os.environ["QUERY_EMBEDDING_CACHE_PATH"] = os.path.join(workdir, f"{handler}-embedding-cache.sqlite")
+    import index
+
+    if hasattr(index.tools, "cost_cache"):
+        index.tools.cost_cache.local_dir = os.path.join(workdir, "infracost-cache")
+
+    sys.path.append(BENCHMARK_DIR)
+    import stubs
+
+    clients = stubs.install(
+        model_latency=options["model_latency"],
+        chunk_latency=options["chunk_latency"],
+        kb_latency=options["kb_latency"],
+        s3_latency=options["s3_latency"],
+    )
+    events = load_events(events_path)
+    stubs.seed_terraform(clients["s3"], session_ids={event.get("sessionId") for event in events if event.get("sessionId")})
+    stubs.install_fake_infracost(os.path.join(workdir, "bin"), latency=options["infracost_latency"])
+
+    def invoke(event):
+        start = time.perf_counter()
+        try:
+            status = index.handler(event, None)["response"]["httpStatusCode"]
+        except Exception as e:
+            status = f"{type(e).__name__}: {e}"
+        return event["apiPath"], time.perf_counter() - start, status
+
+    # Handler logs go nowhere, they would otherwise dominate the timings
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        warmed = {}
+        for event in events:
+            if warmed.get(event["apiPath"], 0) < options["warmup"]:
+                warmed[event["apiPath"]] = warmed.get(event["apiPath"], 0) + 1
+                invoke(event)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            samples = list(executor.map(invoke, events))
+        elapsed = time.perf_counter() - start
+
+    result = {
+        "samples": samples,
+        "elapsed": elapsed,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+    print(RESULT_PREFIX + json.dumps(result))
+
+
+def replay(handler, events, workdir, options):
+    events_path = os.path.join(workdir, f"events-{handler}.jsonl")
+    with open(events_path, "w") as f:
+        for event in events:
+            f.write(json.dumps(event) + "\n")
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", handler, events_path, workdir, json.dumps(options)],
+        capture_output=True,
+        text=True,
+    )
+    for line in completed.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    raise RuntimeError(f"{handler} replay failed:\n{completed.stderr}")
+
+
+def run_benchmark(events, options):
+    """
+    Replays events against both handlers, each in its own process.
+
+    Args:
+        events (list): Agent events; each goes to the handler that serves its API path.
+        options (dict): Stub latencies in seconds, concurrency and warm-up settings.
+
+    Returns:
+        dict: 'routes' with count, errors and p50/p95/p99 seconds per route, and 'handlers'
+        with requests, throughput in requests per second and peak RSS bytes per handler.
+    """
+    sys.path.append(BENCHMARK_DIR)
+    import stubs
+
+    by_handler = {}
+    for event in events:
+        by_handler.setdefault(handler_for(event["apiPath"]), []).append(event)
+
+    results = {"routes": {}, "handlers": {}}
+    with tempfile.TemporaryDirectory() as workdir:
+        stubs.build_stub_index(os.path.join(workdir, "local_index"))
+        for handler, handler_events in by_handler.items():
+            result = replay(handler, handler_events, workdir, options)
+            latencies = {}
+            errors = {}
+            for api_path, seconds, status in result["samples"]:
+                route = f"{handler}:{api_path}"
+                latencies.setdefault(route, []).append(seconds)
+                errors[route] = errors.get(route, 0) + (status != 200)
+            for route, values in latencies.items():
+                values.sort()
+                results["routes"][route] = {
+                    "count": len(values),
+                    "errors": errors[route],
+                    "p50": percentile(values, 0.50),
+                    "p95": percentile(values, 0.95),
+                    "p99": percentile(values, 0.99),
+                }
+            results["handlers"][handler] = {
+                "requests": len(result["samples"]),
+                "throughput": len(result["samples"]) / result["elapsed"] if result["elapsed"] else 0.0,
+                "peak_rss_bytes": result["peak_rss_bytes"],
+            }
+    return results
+
+
+def compare(results, baseline, tolerance, min_delta=0.005):
+    """
+    Compares results against a baseline.
+
+    Args:
+        results (dict): Results of run_benchmark.
+        baseline (dict): Previously saved results.
+        tolerance (float): Allowed relative regression of p95 latency, throughput and peak memory, e.g. 0.25.
+        min_delta (float): p95 slowdowns smaller than this many seconds are treated as noise.
+
+    Returns:
+        list: Descriptions of the regressions.
+    """
+    regressions = []
+    for route, values in results["routes"].items():
+        base = baseline.get("routes", {}).get(route)
+        if base is None:
+            continue
+        if values["p95"] > base["p95"] * (1 + tolerance) and values["p95"] - base["p95"] > min_delta:
+            regressions.append(f"{route}: p95 {values['p95'] * 1000:.1f} ms vs baseline {base['p95'] * 1000:.1f} ms")
+        if values["errors"] > base["errors"]:
+            regressions.append(f"{route}: {values['errors']} errors vs baseline {base['errors']}")
+    for handler, values in results["handlers"].items():
+        base = baseline.get("handlers", {}).get(handler)
+        if base is None:
+            continue
+        if values["throughput"] < base["throughput"] / (1 + tolerance):
+            regressions.append(
+                f"{handler}: {values['throughput']:.1f} req/s vs baseline {base['throughput']:.1f} req/s"
+            )
+        if values["peak_rss_bytes"] > base["peak_rss_bytes"] * (1 + tolerance):
+            regressions.append(
+                f"{handler}: peak RSS {values['peak_rss_bytes'] / 2**20:.0f} MiB "
+                f"vs baseline {base['peak_rss_bytes'] / 2**20:.0f} MiB"
+            )
+    return regressions
+
+
+def print_results(results):
+    print(f"{'route':45} {'count':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for route, values in results["routes"].items():
+        print(
+            f"{route:45} {values['count']:6d} {values['errors']:6d} {values['p50'] * 1000:9.1f} "
+            f"{values['p95'] * 1000:9.1f} {values['p99'] * 1000:9.1f}"
+        )
+    print(f"{'handler':45} {'requests':>8} {'req/s':>9} {'peak RSS MiB':>13}")
+    for handler, values in results["handlers"].items():
+        print(
+            f"{handler:45} {values['requests']:8d} {values['throughput']:9.1f} "
+            f"{values['peak_rss_bytes'] / 2**20:13.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", help="JSONL file of recorded agent events; generated when omitted")
+    parser.add_argument("--iterations", type=int, default=10, help="generated events per route")
+    parser.add_argument("--repeat-queries", action="store_true", help="reuse generated queries so caches can hit")
+    parser.add_argument("--concurrency", type=int, default=4, help="concurrent invocations per handler")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed invocations per route before replaying")
+    parser.add_argument("--model-latency", type=float, default=0.0, help="seconds to the first model token")
+    parser.add_argument("--chunk-latency", type=float, default=0.0, help="seconds between streamed chunks")
+    parser.add_argument("--kb-latency", type=float, default=0.0, help="seconds per Knowledge Base retrieve")
+    parser.add_argument("--s3-latency", type=float, default=0.0, help="seconds per S3 request")
+    parser.add_argument("--infracost-latency", type=float, default=0.0, help="seconds per Infracost run")
+    parser.add_argument("--baseline", help="baseline JSON file to compare against")
+    parser.add_argument("--save-baseline", help="write the results to this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="ignore p95 regressions smaller than this")
+    parser.add_argument("--child", nargs=4, metavar=("HANDLER", "EVENTS", "WORKDIR", "OPTIONS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child)
+        return
+
+    events = load_events(args.events) if args.events else generate_events(args.iterations, not args.repeat_queries)
+    options = {
+        "concurrency": args.concurrency,
+        "warmup": args.warmup,
+        "model_latency": args.model_latency,
+        "chunk_latency": args.chunk_latency,
+        "kb_latency": args.kb_latency,
+        "s3_latency": args.s3_latency,
+        "infracost_latency": args.infracost_latency,
+    }
+    results = run_benchmark(events, options)
+    print_results(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms / 1000)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Recall and latency benchmark for the aws_well_arch_tool retrieval modes.
+
+A FAISS index is built from a fixed set of passages, each answering one query
+of a fixed query set, padded with generated filler passages that reuse the
+same AWS vocabulary. Every mode ('vector', 'lexical', 'hybrid', with and
+without MMR) is scored on recall@k, i.e. the fraction of queries whose
+answering passage is among the k results, and on per-query latency.
+
+Embeddings come from the stub Bedrock client (hashed bag of words), so vector
+recall here is only a rough proxy for Titan; the lexical latency is real.
+
+Usage:
+    python benchmarks/retrieval.py --filler 5000 --k 4
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "infracost"))
+sys.path.append(BENCHMARK_DIR)
+
+import stubs  # noqa: E402
+
+# (query, passage answering it)
+QUERY_SET = [
+    ("What is RDS Proxy?", "Amazon RDS Proxy pools and shares database connections so that applications scale without exhausting the database."),
+    ("How do SCPs restrict accounts?", "Service control policies (SCPs) set the maximum available permissions for member accounts in AWS Organizations."),
+    ("When should I use ElastiCache?", "Amazon ElastiCache keeps frequently read data in memory with Redis or Memcached to reduce read latency."),
+    ("What does the reliability pillar cover?", "The reliability pillar covers the ability of a workload to recover from failures and meet demand."),
+    ("How can I protect my API from bots with WAF?", "AWS WAF rate-based rules and bot control managed rules block abusive traffic in front of API Gateway."),
+    ("How do I encrypt S3 buckets with KMS?", "Default bucket encryption with SSE-KMS encrypts new S3 objects with a customer managed KMS key."),
+    ("What is a NAT gateway used for?", "A NAT gateway lets instances in private subnets reach the internet while blocking inbound connections."),
+    ("How to reduce Lambda cold starts?", "Provisioned concurrency keeps Lambda execution environments initialized to remove cold start latency."),
+    ("How does DynamoDB on-demand pricing work?", "DynamoDB on-demand capacity bills per read and write request unit without capacity planning."),
+    ("What is the purpose of CloudFront origin shield?", "CloudFront Origin Shield adds a central caching layer that reduces the load on the origin."),
+]
+
+FILLER_VOCABULARY = (
+    "aws workload architecture security reliability performance cost operational excellence sustainability "
+    "database storage network compute serverless container cluster instance region availability zone "
+    "monitoring logging backup recovery scaling latency throughput encryption identity access policy "
+    "account organization pillar best practice design review service data application traffic load"
+).split()
+
+
+def filler_passages(count, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(FILLER_VOCABULARY) for _ in range(rng.randint(20, 60))) for _ in range(count)]
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))]
+
+
+def evaluate(index, k, mode, mmr_lambda, repeats):
+    hits = 0
+    latencies = []
+    for query, answer in QUERY_SET:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            docs = index.search(query, k=k, mode=mode, mmr_lambda=mmr_lambda)
+            latencies.append(time.perf_counter() - start)
+        hits += any(doc.page_content == answer for doc in docs)
+    latencies.sort()
+    return {
+        "recall": hits / len(QUERY_SET),
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filler", type=int, default=2000, help="number of filler passages")
+    parser.add_argument("--k", type=int, default=4, help="documents returned per query")
+    parser.add_argument("--repeats", type=int, default=5, help="timed searches per query")
+    args = parser.parse_args()
+
+    stubs.install()
+    with tempfile.TemporaryDirectory() as path:
+        texts = [answer for _, answer in QUERY_SET] + filler_passages(args.filler)
+        start = time.perf_counter()
+        stubs.build_stub_index(path, texts)
+        from tools import load_faiss_index
+
+        index = load_faiss_index(path)
+        print(f"Indexed {len(texts)} passages in {time.perf_counter() - start:.1f}s")
+
+    lexical = []
+    for query, _ in QUERY_SET:
+        start = time.perf_counter()
+        index.lexical.search(query, 20)
+        lexical.append(time.perf_counter() - start)
+    lexical.sort()
+    print(f"BM25 only: p50 {percentile(lexical, 0.5) * 1000:.2f} ms, p95 {percentile(lexical, 0.95) * 1000:.2f} ms")
+
+    print(f"{'mode':<16}{'recall@' + str(args.k):>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for mode, mmr_lambda in [("vector", None), ("lexical", None), ("hybrid", None), ("hybrid", 0.5)]:
+        result = evaluate(index, args.k, mode, mmr_lambda, args.repeats)
+        label = mode + ("+mmr" if mmr_lambda is not None else "")
+        print(f"{label:<16}{result['recall']:>10.2f}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,520 @@
+"""
+Offline stand-ins for Bedrock, Knowledge Bases, S3 and the Infracost CLI.
+
+The stubs implement just enough of the boto3 client interfaces used by the
+tools modules, with configurable latencies, so that the handlers can be
+benchmarked without AWS credentials or network access.
+"""
+import hashlib
+import io
+import json
+import math
+import os
+import re
+import stat
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+import bedrock_client
+
+# Bucket and prefix used by iac_gen_tool and iac_estimate_tool
+IAC_BUCKET = "bedrock-agent-generate-iac-estimate-cost"
+IAC_CODE_PREFIX = "iac-code/"
+IAC_MANIFEST_PREFIX = "iac-manifest/"
+
+STUB_TERRAFORM = """resource "aws_instance" "web" {
+  ami           = "ami-0c55b159cbfafe1f0"
+  instance_type = "t3.medium"
+}
+
+resource "aws_db_instance" "db" {
+  engine            = "mysql"
+  instance_class    = "db.t3.medium"
+  allocated_storage = 100
+}
+"""
+
+STUB_ANSWER = (
+    "Use Amazon CloudFront in front of an Application Load Balancer, run the web tier on "
+    "Amazon EC2 Auto Scaling groups across two Availability Zones, and store data in Amazon "
+    "RDS Multi-AZ. Cache sessions in Amazon ElastiCache and keep static assets in Amazon S3."
+)
+
+
+def deterministic_embedding(text, dim=64):
+    """
+    Hashes the words of a text into a normalized vector, so that texts sharing words are similar.
+
+    Args:
+        text (str): The text to embed.
+        dim (int): Number of dimensions.
+
+    Returns:
+        list: The embedding vector.
+    """
+    vector = [0.0] * dim
+    for word in re.findall(r"\w+", text.lower()):
+        digest = hashlib.md5(word.encode("utf-8")).digest()
+        vector[digest[0] % dim] += 1.0 if digest[1] % 2 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def response_text_for(prompt):
+    # Terraform for generation prompts, prose for everything else
+    if "Terraform" in prompt or "terraform" in prompt:
+        return STUB_TERRAFORM
+    return STUB_ANSWER
+
+
+def prompt_text(body):
+    if "messages" in body:
+        parts = []
+        for message in body["messages"]:
+            content = message["content"]
+            if isinstance(content, str):
+                parts.append(content)
+                continue
+            parts.extend(block.get("text", "") for block in content)
+        return "\n".join(parts)
+    return body.get("prompt") or body.get("inputText") or ""
+
+
+class StubBody:
+    def __init__(self, payload):
+        self._buffer = io.BytesIO(payload)
+
+    def read(self, *args):
+        return self._buffer.read(*args)
+
+
+class StubBedrockRuntime:
+    """
+    Stand-in for the bedrock-runtime client.
+
+    Args:
+        latency (float): Seconds before the first byte of every response.
+        chunk_latency (float): Seconds between streamed chunks.
+        response_text (str): Fixed text to return instead of the prompt-dependent default.
+    """
+
+    def __init__(self, latency=0.0, chunk_latency=0.0, response_text=None):
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+        self.response_text = response_text
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _count(self):
+        with self._lock:
+            self.calls += 1
+
+    def _text(self, body):
+        return self.response_text if self.response_text is not None else response_text_for(prompt_text(body))
+
+    def invoke_model(self, body, modelId, accept=None, contentType=None, **kwargs):
+        self._count()
+        time.sleep(self.latency)
+        request = json.loads(body)
+        text = self._text(request)
+        input_tokens = bedrock_client.estimate_input_tokens(request)
+        output_tokens = bedrock_client.estimate_tokens(text)
+        if "textGenerationConfig" in request:
+            response = {"results": [{"outputText": text}]}
+        elif "inputText" in request:
+            response = {"embedding": deterministic_embedding(request["inputText"])}
+            output_tokens = 0
+        elif "messages" in request:
+            response = {
+                "content": [{"type": "text", "text": text}],
+                "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens},
+            }
+        else:
+            response = {"completion": text}
+        headers = {
+            "x-amzn-bedrock-input-token-count": str(input_tokens),
+            "x-amzn-bedrock-output-token-count": str(output_tokens),
+        }
+        return {"body": StubBody(json.dumps(response).encode("utf-8")), "ResponseMetadata": {"HTTPHeaders": headers}}
+
+    def invoke_model_with_response_stream(self, body, modelId, accept=None, contentType=None, **kwargs):
+        self._count()
+        time.sleep(self.latency)
+        request = json.loads(body)
+        text = self._text(request)
+        return {"body": self._events(request, text)}
+
+    def _events(self, request, text):
+        # Responses longer than max_tokens are cut off, as Bedrock does
+        max_tokens = bedrock_client.max_output_tokens(request)
+        truncated = bool(max_tokens) and bedrock_client.estimate_tokens(text) > max_tokens
+        if truncated:
+            text = text[:max_tokens * 4]
+        words = re.findall(r"\S+\s*", text)
+        yield self._event({"type": "message_start"})
+        for i in range(0, len(words), 4):
+            if i:
+                time.sleep(self.chunk_latency)
+            yield self._event({"type": "content_block_delta", "delta": {"type": "text_delta", "text": "".join(words[i:i + 4])}})
+        yield self._event({"type": "message_delta", "delta": {"stop_reason": "max_tokens" if truncated else "end_turn"}})
+        yield self._event({
+            "type": "message_stop",
+            "amazon-bedrock-invocationMetrics": {
+                "inputTokenCount": bedrock_client.estimate_input_tokens(request),
+                "outputTokenCount": bedrock_client.estimate_tokens(text),
+            },
+        })
+
+    @staticmethod
+    def _event(payload):
+        return {"chunk": {"bytes": json.dumps(payload).encode("utf-8")}}
+
+
+class StubAgentRuntime:
+    """
+    Stand-in for the bedrock-agent-runtime client.
+
+    Args:
+        latency (float): Seconds per retrieve call.
+        passages (list): Passages returned by retrieve, in score order.
+    """
+
+    def __init__(self, latency=0.0, passages=None):
+        self.latency = latency
+        self.passages = passages or [
+            STUB_ANSWER,
+            "The AWS Well-Architected Framework describes six pillars: operational excellence, security, "
+            "reliability, performance efficiency, cost optimization and sustainability.",
+            "Amazon RDS Proxy pools database connections to improve application scalability.",
+            "Service control policies (SCPs) set the maximum permissions for accounts in an organization.",
+            "Amazon ElastiCache improves latency by caching frequently accessed data in memory.",
+        ]
+        self.calls = 0
+
+    def retrieve(self, retrievalQuery, knowledgeBaseId, retrievalConfiguration=None, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        limit = (retrievalConfiguration or {}).get("vectorSearchConfiguration", {}).get("numberOfResults", 5)
+        results = [
+            {
+                "content": {"text": passage},
+                "score": round(1.0 - i * 0.05, 4),
+                "location": {"type": "S3", "s3Location": {"uri": f"s3://stub-kb/doc-{i}.pdf"}},
+            }
+            for i, passage in enumerate(self.passages[:limit])
+        ]
+        return {"retrievalResults": results}
+
+
+class StubS3:
+    """
+    In-memory stand-in for the s3 client.
+
+    Args:
+        latency (float): Seconds per request.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.objects = {}
+        self.uploads = {}
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def _request(self, operation):
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        time.sleep(self.latency)
+
+    def _store(self, bucket, key, data):
+        with self._lock:
+            self.objects[(bucket, key)] = {
+                "Body": data,
+                "LastModified": datetime.now(timezone.utc),
+                "ETag": '"' + hashlib.md5(data).hexdigest() + '"',
+            }
+
+    def _get(self, bucket, key):
+        from botocore.exceptions import ClientError
+
+        obj = self.objects.get((bucket, key))
+        if obj is None:
+            raise ClientError({"Error": {"Code": "NoSuchKey", "Message": key}}, "GetObject")
+        return obj
+
+    def put_object(self, Bucket, Key, Body=b"", **kwargs):
+        self._request("PutObject")
+        self._store(Bucket, Key, Body.encode("utf-8") if isinstance(Body, str) else Body)
+        return {"ETag": self.objects[(Bucket, Key)]["ETag"]}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self._request("GetObject")
+        obj = self._get(Bucket, Key)
+        return {
+            "Body": StubBody(obj["Body"]),
+            "ContentLength": len(obj["Body"]),
+            "ETag": obj["ETag"],
+            "LastModified": obj["LastModified"],
+        }
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self._request("HeadObject")
+        obj = self._get(Bucket, Key)
+        return {"ContentLength": len(obj["Body"]), "ETag": obj["ETag"], "LastModified": obj["LastModified"]}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self._request("DeleteObject")
+        with self._lock:
+            self.objects.pop((Bucket, Key), None)
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix="", MaxKeys=1000, ContinuationToken=None, **kwargs):
+        self._request("ListObjectsV2")
+        keys = sorted(key for bucket, key in self.objects if bucket == Bucket and key.startswith(Prefix))
+        start = int(ContinuationToken) if ContinuationToken else 0
+        page = keys[start:start + MaxKeys]
+        response = {"KeyCount": len(page), "IsTruncated": start + MaxKeys < len(keys)}
+        if page:
+            response["Contents"] = [
+                {
+                    "Key": key,
+                    "Size": len(self.objects[(Bucket, key)]["Body"]),
+                    "ETag": self.objects[(Bucket, key)]["ETag"],
+                    "LastModified": self.objects[(Bucket, key)]["LastModified"],
+                }
+                for key in page
+            ]
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = str(start + MaxKeys)
+        return response
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self._request("CreateMultipartUpload")
+        upload_id = hashlib.md5(f"{Bucket}/{Key}/{time.time()}".encode("utf-8")).hexdigest()
+        with self._lock:
+            self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        self._request("UploadPart")
+        with self._lock:
+            self.uploads[UploadId][PartNumber] = Body
+        return {"ETag": '"' + hashlib.md5(Body).hexdigest() + '"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        self._request("CompleteMultipartUpload")
+        with self._lock:
+            parts = self.uploads.pop(UploadId)
+        data = b"".join(parts[part["PartNumber"]] for part in MultipartUpload["Parts"])
+        self._store(Bucket, Key, data)
+        return {"ETag": self.objects[(Bucket, Key)]["ETag"]}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self._request("AbortMultipartUpload")
+        with self._lock:
+            self.uploads.pop(UploadId, None)
+        return {}
+
+    def get_paginator(self, operation_name):
+        return StubPaginator(getattr(self, operation_name))
+
+    def download_file(self, Bucket, Key, Filename, **kwargs):
+        self._request("GetObject")
+        obj = self._get(Bucket, Key)
+        with open(Filename, "wb") as f:
+            f.write(obj["Body"])
+
+    def upload_file(self, Filename, Bucket, Key, **kwargs):
+        self._request("PutObject")
+        with open(Filename, "rb") as f:
+            self._store(Bucket, Key, f.read())
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, **kwargs):
+        self._request("PutObject")
+        self._store(Bucket, Key, Fileobj.read())
+
+
+class StubPaginator:
+    def __init__(self, method):
+        self.method = method
+
+    def paginate(self, **kwargs):
+        token = None
+        while True:
+            if token:
+                kwargs["ContinuationToken"] = token
+            page = self.method(**kwargs)
+            yield page
+            token = page.get("NextContinuationToken")
+            if not token:
+                return
+
+
+FAKE_INFRACOST_TABLE = """Project: main
+
+ Name                                                   Monthly Qty  Unit   Monthly Cost
+
+ aws_db_instance.db
+ ├─ Database instance (on-demand, Single-AZ, db.t3.medium)   730  hours        $49.64
+ └─ Storage (general purpose SSD, gp2)                       100  GB           $11.50
+
+ aws_instance.web
+ ├─ Instance usage (Linux/UNIX, on-demand, t3.medium)        730  hours        $30.37
+ └─ root_block_device
+    └─ Storage (general purpose SSD, gp2)                      8  GB            $0.80
+
+ OVERALL TOTAL                                                                 $92.31
+"""
+
+FAKE_INFRACOST_BREAKDOWN = {
+    "version": "0.2",
+    "currency": "USD",
+    "projects": [
+        {
+            "name": "main",
+            "breakdown": {
+                "resources": [
+                    {
+                        "name": "aws_db_instance.db",
+                        "resourceType": "aws_db_instance",
+                        "monthlyCost": "61.14",
+                        "costComponents": [
+                            {"name": "Database instance (on-demand, Single-AZ, db.t3.medium)", "monthlyCost": "49.64"},
+                            {"name": "Storage (general purpose SSD, gp2)", "monthlyCost": "11.5"},
+                        ],
+                    },
+                    {
+                        "name": "aws_instance.web",
+                        "resourceType": "aws_instance",
+                        "monthlyCost": "31.17",
+                        "costComponents": [
+                            {"name": "Instance usage (Linux/UNIX, on-demand, t3.medium)", "monthlyCost": "30.37"},
+                        ],
+                        "subresources": [
+                            {"name": "root_block_device", "monthlyCost": "0.8"},
+                        ],
+                    },
+                ],
+                "totalMonthlyCost": "92.31",
+            },
+        }
+    ],
+    "totalMonthlyCost": "92.31",
+}
+
+FAKE_INFRACOST = '''#!{python}
+import sys
+import time
+
+time.sleep({latency})
+if "json" in sys.argv:
+    print({breakdown!r})
+else:
+    print({table!r})
+'''
+
+
+def install_fake_infracost(bin_dir, latency=0.0):
+    """
+    Writes a fake `infracost` executable and puts it first on PATH.
+
+    Args:
+        bin_dir (str): Directory to write the executable to.
+        latency (float): Seconds the fake command takes to run.
+
+    Returns:
+        str: Path of the fake executable.
+    """
+    os.makedirs(bin_dir, exist_ok=True)
+    path = os.path.join(bin_dir, "infracost")
+    with open(path, "w") as f:
+        f.write(FAKE_INFRACOST.format(
+            python=sys.executable,
+            latency=latency,
+            breakdown=json.dumps(FAKE_INFRACOST_BREAKDOWN),
+            table=FAKE_INFRACOST_TABLE,
+        ))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ.get("PATH", "")
+    return path
+
+
+def agent_event(api_path, query, action_group="benchmark", session_id="benchmark-session"):
+    """
+    Builds a Bedrock Agent action group event for a route.
+
+    Args:
+        api_path (str): The API path, e.g. '/answer_query'.
+        query (str): The value of the query parameter.
+        action_group (str): The action group name.
+        session_id (str): The agent session ID.
+
+    Returns:
+        dict: The event passed to index.handler.
+    """
+    return {
+        "messageVersion": "1.0",
+        "actionGroup": action_group,
+        "apiPath": api_path,
+        "httpMethod": "GET",
+        "parameters": [{"name": "query", "type": "string", "value": query}],
+        "inputText": query,
+        "sessionId": session_id,
+    }
+
+
+def seed_terraform(s3, key="iac_stub.tf", body=STUB_TERRAFORM, session_ids=("benchmark-session",)):
+    """
+    Stores a generated Terraform file in the stub S3 bucket, as iac_gen_tool would.
+
+    Args:
+        s3 (StubS3): The stub client.
+        key (str): File name under the iac-code prefix.
+        body (str): The Terraform code.
+        session_ids (iterable): Sessions whose manifest points at the file, since
+            estimates only ever read the Terraform code of their own session.
+    """
+    s3.put_object(Bucket=IAC_BUCKET, Key=IAC_CODE_PREFIX + key, Body=body)
+    manifest = json.dumps({"key": IAC_CODE_PREFIX + key, "sha256": None}).encode("utf-8")
+    for session_id in session_ids:
+        s3.put_object(Bucket=IAC_BUCKET, Key=f"{IAC_MANIFEST_PREFIX}{session_id}.json", Body=manifest)
+
+
+def install(model_latency=0.0, chunk_latency=0.0, kb_latency=0.0, s3_latency=0.0):
+    """
+    Replaces the Bedrock, Knowledge Base and S3 clients of bedrock_client with stubs.
+
+    Returns:
+        dict: The installed stubs by service name.
+    """
+    clients = {
+        "bedrock-runtime": StubBedrockRuntime(model_latency, chunk_latency),
+        "bedrock-agent-runtime": StubAgentRuntime(kb_latency),
+        "s3": StubS3(s3_latency),
+    }
+    for service_name, client in clients.items():
+        bedrock_client.set_client(service_name, client)
+    return clients
+
+
+def build_stub_index(path, texts=None):
+    """
+    Builds a small FAISS index with stub embeddings, in the layout `aws_well_arch_tool` loads.
+
+    Args:
+        path (str): The index directory to write.
+        texts (list): Passages to index. Defaults to the stub Knowledge Base passages.
+    """
+    from langchain_community.embeddings import BedrockEmbeddings
+    from langchain_community.vectorstores import FAISS
+
+    texts = texts or StubAgentRuntime().passages
+    embeddings = BedrockEmbeddings(client=StubBedrockRuntime())
+    metadatas = [{"source": f"stub-doc-{i}.pdf"} for i in range(len(texts))]
+    FAISS.from_texts(texts, embeddings, metadatas=metadatas).save_local(path)
@@ -0,0 +1,144 @@
+import re
+import threading
+
+from bedrock_client import estimate_tokens
+
+_WORD = re.compile(r"\w+")
+
+
+def shingles(text, size=3):
+    """
+    Splits text into overlapping word n-grams for near-duplicate detection.
+
+    Args:
+        text (str): The passage text.
+        size (int): Number of words per shingle.
+
+    Returns:
+        set: The shingles of the lower-cased text.
+    """
+    words = _WORD.findall(text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def pack_contexts(passages, max_tokens, similarity_threshold=0.8):
+    """
+    Selects retrieved passages for a prompt within a token budget.
+
+    Passages are taken in descending score order. A passage whose shingles
+    overlap an already selected passage by at least `similarity_threshold`
+    (Jaccard) is dropped as a near-duplicate, and passages that no longer fit
+    the budget are skipped so that a smaller, lower-scored one can still be used.
+
+    Args:
+        passages (list): Dicts with the passage `text` and its retrieval `score`.
+        max_tokens (int): Token budget for the packed passages.
+        similarity_threshold (float): Overlap above which two passages are considered the same.
+
+    Returns:
+        tuple: The selected passages, in score order, and the number of duplicates and
+        over-budget passages that were dropped.
+    """
+    ordered = sorted(passages, key=lambda p: p.get("score") or 0.0, reverse=True)
+    selected = []
+    selected_shingles = []
+    used = 0
+    duplicates = 0
+    over_budget = 0
+    for passage in ordered:
+        text = passage["text"].strip()
+        if not text:
+            continue
+        passage_shingles = shingles(text)
+        if any(jaccard(passage_shingles, seen) >= similarity_threshold for seen in selected_shingles):
+            duplicates += 1
+            continue
+        tokens = estimate_tokens(text)
+        if used + tokens > max_tokens:
+            over_budget += 1
+            continue
+        selected.append(dict(passage, text=text))
+        selected_shingles.append(passage_shingles)
+        used += tokens
+    return selected, duplicates, over_budget
+
+
+def format_contexts(passages):
+    """
+    Formats packed passages for the prompt, one numbered <passage> block each.
+
+    Args:
+        passages (list): Passages returned by pack_contexts.
+
+    Returns:
+        str: The passages as plain text, without Python quoting or escaping.
+    """
+    return "\n".join(f'<passage index="{i}">\n{p["text"]}\n</passage>' for i, p in enumerate(passages, 1))
+
+
+class ContextPacker:
+    """
+    Packs retrieved passages into prompt context and keeps a running count of
+    the input tokens saved compared to pasting the repr of every passage.
+    """
+
+    def __init__(self, max_tokens=2000, similarity_threshold=0.8):
+        """
+        Args:
+            max_tokens (int): Token budget for the packed passages.
+            similarity_threshold (float): Jaccard overlap above which passages are considered duplicates.
+        """
+        self.max_tokens = max_tokens
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "tokens_before": 0, "tokens_after": 0, "duplicates": 0, "over_budget": 0}
+
+    def pack(self, passages):
+        """
+        Packs passages and records the tokens saved by the request.
+
+        Args:
+            passages (list): Dicts with the passage `text` and its retrieval `score`.
+
+        Returns:
+            tuple: The formatted context string and a dict with the token counts of this request.
+        """
+        selected, duplicates, over_budget = pack_contexts(passages, self.max_tokens, self.similarity_threshold)
+        context = format_contexts(selected)
+        tokens_before = estimate_tokens(repr([p["text"] for p in passages]))
+        tokens_after = estimate_tokens(context)
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["tokens_before"] += tokens_before
+            self._stats["tokens_after"] += tokens_after
+            self._stats["duplicates"] += duplicates
+            self._stats["over_budget"] += over_budget
+        return context, {
+            "passages": len(passages),
+            "packed": len(selected),
+            "duplicates": duplicates,
+            "over_budget": over_budget,
+            "tokens_before": tokens_before,
+            "tokens_after": tokens_after,
+            "tokens_saved": tokens_before - tokens_after,
+        }
+
+    def stats(self):
+        """
+        Returns running totals across all packed requests.
+
+        Returns:
+            dict: Requests, estimated tokens before and after packing, tokens saved, and dropped passages.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats["tokens_saved"] = stats["tokens_before"] - stats["tokens_after"]
+        return stats
@@ -0,0 +1,222 @@
+import json
+import subprocess
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+
+import deadline
+import tracing
+
+# Terraform resource type prefixes mapped to the AWS service they are billed under.
+# Longer prefixes win, so "aws_db_proxy" can be told apart from "aws_db_".
+SERVICE_PREFIXES = {
+    "aws_instance": "Amazon EC2",
+    "aws_autoscaling_": "Amazon EC2",
+    "aws_launch_": "Amazon EC2",
+    "aws_ebs_": "Amazon EBS",
+    "aws_eip": "Amazon VPC",
+    "aws_nat_gateway": "Amazon VPC",
+    "aws_vpc_endpoint": "Amazon VPC",
+    "aws_vpn_": "Amazon VPC",
+    "aws_ec2_transit_gateway": "AWS Transit Gateway",
+    "aws_lb": "Elastic Load Balancing",
+    "aws_alb": "Elastic Load Balancing",
+    "aws_elb": "Elastic Load Balancing",
+    "aws_db_": "Amazon RDS",
+    "aws_rds_": "Amazon RDS",
+    "aws_db_proxy": "Amazon RDS Proxy",
+    "aws_dynamodb_": "Amazon DynamoDB",
+    "aws_elasticache_": "Amazon ElastiCache",
+    "aws_s3_": "Amazon S3",
+    "aws_cloudfront_": "Amazon CloudFront",
+    "aws_lambda_": "AWS Lambda",
+    "aws_api_gateway": "Amazon API Gateway",
+    "aws_apigatewayv2_": "Amazon API Gateway",
+    "aws_ecs_": "Amazon ECS",
+    "aws_eks_": "Amazon EKS",
+    "aws_ecr_": "Amazon ECR",
+    "aws_efs_": "Amazon EFS",
+    "aws_cloudwatch_": "Amazon CloudWatch",
+    "aws_route53_": "Amazon Route 53",
+    "aws_sqs_": "Amazon SQS",
+    "aws_sns_": "Amazon SNS",
+    "aws_kinesis_": "Amazon Kinesis",
+    "aws_opensearch_": "Amazon OpenSearch Service",
+    "aws_elasticsearch_": "Amazon OpenSearch Service",
+    "aws_kms_": "AWS KMS",
+    "aws_secretsmanager_": "AWS Secrets Manager",
+    "aws_wafv2_": "AWS WAF",
+    "aws_waf_": "AWS WAF",
+    "aws_redshift_": "Amazon Redshift",
+    "aws_msk_": "Amazon MSK",
+    "aws_sfn_": "AWS Step Functions",
+}
+
+
+def service_for_resource_type(resource_type):
+    """
+    Maps a Terraform resource type to the AWS service it is billed under.
+
+    Args:
+        resource_type (str): The Terraform resource type, e.g. 'aws_db_instance'.
+
+    Returns:
+        str: The service name, or the resource type itself if it is not known.
+    """
+    best = None
+    for prefix in SERVICE_PREFIXES:
+        if resource_type.startswith(prefix) and (best is None or len(prefix) > len(best)):
+            best = prefix
+    return SERVICE_PREFIXES[best] if best else resource_type
+
+
+def parse_money(value):
+    """
+    Parses an Infracost cost value.
+
+    Args:
+        value (str): The cost as a decimal string, or None for usage-based costs without usage data.
+
+    Returns:
+        Decimal: The cost, or None if it is not priced.
+    """
+    if value is None:
+        return None
+    try:
+        return Decimal(str(value))
+    except InvalidOperation:
+        return None
+
+
+def iter_resources(breakdown):
+    """
+    Yields every resource of an Infracost JSON breakdown, one at a time.
+
+    Args:
+        breakdown (dict): The parsed output of `infracost breakdown --format json`.
+
+    Yields:
+        tuple: The project name and the resource.
+    """
+    for project in breakdown.get("projects") or []:
+        for resource in (project.get("breakdown") or {}).get("resources") or []:
+            yield project.get("name", ""), resource
+
+
+def aggregate_breakdown(breakdown):
+    """
+    Aggregates the monthly cost of an Infracost JSON breakdown per AWS service.
+
+    Args:
+        breakdown (dict): The parsed output of `infracost breakdown --format json`.
+
+    Returns:
+        dict: The currency, monthly cost per service (highest first), the total monthly
+        cost and the number of resources without a price (usage-based, no usage data).
+    """
+    services = {}
+    total = Decimal("0")
+    unpriced = 0
+    for _, resource in iter_resources(breakdown):
+        cost = parse_money(resource.get("monthlyCost"))
+        if cost is None:
+            unpriced += 1
+            continue
+        service = service_for_resource_type(resource.get("resourceType") or resource.get("name", "").split(".")[0])
+        services[service] = services.get(service, Decimal("0")) + cost
+        total += cost
+
+    # Prefer the total reported by Infracost, it is computed from the same resources
+    reported_total = parse_money(breakdown.get("totalMonthlyCost"))
+    if reported_total is not None:
+        total = reported_total
+
+    ordered = OrderedDict(sorted(services.items(), key=lambda item: (-item[1], item[0])))
+    return {
+        "currency": breakdown.get("currency", "USD"),
+        "services": ordered,
+        "total": total,
+        "unpriced": unpriced,
+    }
+
+
+def format_cost_summary(summary):
+    """
+    Formats an aggregated breakdown as a list of services and their monthly cost.
+
+    Args:
+        summary (dict): The result of aggregate_breakdown.
+
+    Returns:
+        str: One line per service followed by the total monthly cost.
+    """
+    currency = summary["currency"]
+    lines = ["Estimated monthly cost per service:"]
+    for service, cost in summary["services"].items():
+        lines.append(f"- {service}: {cost.quantize(Decimal('0.01'))} {currency}")
+    lines.append(f"Total monthly cost: {summary['total'].quantize(Decimal('0.01'))} {currency}")
+    if summary["unpriced"]:
+        lines.append(f"{summary['unpriced']} usage-based resources are not included because they have no usage data.")
+    return "\n".join(lines)
+
+
+def run_infracost_json(path, timeout=None):
+    """
+    Runs `infracost breakdown` with JSON output and parses it.
+
+    The JSON is read from stdout once the command has finished, with no intermediate
+    file. The output of one Terraform file is small, so it is buffered in memory.
+
+    Args:
+        path (str): The Terraform directory to estimate.
+        timeout (float): Seconds the command may take, capped by the invocation deadline.
+
+    Returns:
+        tuple: The parsed breakdown and the raw JSON text.
+
+    Raises:
+        DeadlineExceeded: If the command did not finish in time. It is killed.
+        RuntimeError: If Infracost failed, did not return JSON or reported errors for
+            a project. Its output can still parse then, but is not a usable estimate.
+    """
+    with tracing.span("infracost.run") as span:
+        try:
+            completed = subprocess.run(
+                ["infracost", "breakdown", "--path", path, "--format", "json", "--no-color"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                timeout=deadline.budget(timeout, "infracost"),
+            )
+        except subprocess.TimeoutExpired:
+            raise deadline.DeadlineExceeded("infracost")
+        span.set(returncode=completed.returncode)
+    if completed.returncode != 0:
+        tracing.log("Infracost command failed", returncode=completed.returncode,
+                    payload={"stderr": completed.stderr[-2000:]})
+        raise RuntimeError(f"Infracost exited with code {completed.returncode}")
+    try:
+        breakdown = json.loads(completed.stdout)
+    except ValueError:
+        raise RuntimeError(f"Infracost did not return JSON: {completed.stderr.strip()}")
+    errors = project_errors(breakdown)
+    if errors:
+        tracing.log("Infracost project errors", errors=errors)
+        raise RuntimeError(f"Infracost could not estimate the project: {'; '.join(errors)}")
+    return breakdown, completed.stdout
+
+
+def project_errors(breakdown):
+    """
+    Returns the errors Infracost reported in the metadata of its projects.
+
+    Args:
+        breakdown (dict): The parsed `infracost breakdown --format json` output.
+
+    Returns:
+        list: The error messages, empty if every project was estimated.
+    """
+    errors = []
+    for project in breakdown.get("projects") or []:
+        for error in (project.get("metadata") or {}).get("errors") or []:
+            errors.append(str(error.get("message") or error) if isinstance(error, dict) else str(error))
+    return errors
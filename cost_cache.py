@@ -0,0 +1,224 @@
+import functools
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+import threading
+
+
+def normalize_terraform(text):
+    """
+    Normalizes Terraform code so that formatting-only changes hash the same.
+
+    Line endings, trailing whitespace, blank lines and full-line comments are
+    dropped. Anything that could change the meaning of the code is kept.
+
+    Args:
+        text (str): The Terraform code.
+
+    Returns:
+        str: The normalized code.
+    """
+    lines = []
+    for line in text.replace("\r\n", "\n").split("\n"):
+        stripped = line.rstrip()
+        if not stripped.strip():
+            continue
+        if stripped.lstrip().startswith(("#", "//")):
+            continue
+        lines.append(stripped)
+    return "\n".join(lines)
+
+
+def terraform_content_hash(text):
+    """
+    Hashes normalized Terraform code.
+
+    Args:
+        text (str): The Terraform code.
+
+    Returns:
+        str: The SHA-256 hex digest of the normalized code.
+    """
+    return hashlib.sha256(normalize_terraform(text).encode("utf-8")).hexdigest()
+
+
+class TerraformHasher:
+    """
+    Incremental version of terraform_content_hash for code that arrives in chunks.
+    """
+
+    def __init__(self):
+        self._sha = hashlib.sha256()
+        self._pending = ""
+        self._first = True
+
+    def _add_line(self, line):
+        normalized = normalize_terraform(line)
+        if not normalized:
+            return
+        self._sha.update(normalized.encode("utf-8") if self._first else ("\n" + normalized).encode("utf-8"))
+        self._first = False
+
+    def update(self, text):
+        lines = (self._pending + text).split("\n")
+        self._pending = lines.pop()
+        for line in lines:
+            self._add_line(line)
+
+    def hexdigest(self):
+        sha = self._sha.copy()
+        pending = normalize_terraform(self._pending)
+        if pending:
+            sha.update(pending.encode("utf-8") if self._first else ("\n" + pending).encode("utf-8"))
+        return sha.hexdigest()
+
+
+@functools.lru_cache(maxsize=1)
+def infracost_version():
+    """
+    Returns the version of the Infracost CLI, queried once per process.
+
+    Returns:
+        str: The version string, or 'unknown' if it cannot be determined.
+    """
+    try:
+        completed = subprocess.run(["infracost", "--version"], capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        return "unknown"
+    return completed.stdout.strip() or "unknown"
+
+
+def cost_cache_key(content_hash, version):
+    """
+    Builds the cache key of a cost estimate.
+
+    Args:
+        content_hash (str): The hash of the normalized Terraform code.
+        version (str): The Infracost version, since prices and coverage change between releases.
+
+    Returns:
+        str: The cache key.
+    """
+    return hashlib.sha256(f"{version}\n{content_hash}".encode("utf-8")).hexdigest()
+
+
+class CostCache:
+    """
+    Cache of Infracost results, stored as JSON files locally and optionally in S3.
+
+    Local files live in `/tmp` and survive across warm invocations; the S3 tier
+    shares results between containers. Each entry keeps the time the Infracost
+    run took, which is credited as saved time on every hit.
+    """
+
+    def __init__(self, local_dir="/tmp/infracost-cache", s3_getter=None, bucket=None, prefix=None):
+        """
+        Args:
+            local_dir (str): Directory for the local cache files.
+            s3_getter (callable): Optional function returning an S3 client, enables the S3 tier.
+            bucket (str): The S3 bucket of the S3 tier.
+            prefix (str): The key prefix of the S3 tier.
+        """
+        self.local_dir = local_dir
+        self.s3_getter = s3_getter
+        self.bucket = bucket
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._stats = {"local_hits": 0, "s3_hits": 0, "misses": 0, "saved_seconds": 0.0}
+
+    def _local_path(self, key):
+        return os.path.join(self.local_dir, f"{key}.json")
+
+    def _read_local(self, key):
+        try:
+            with open(self._local_path(key), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_local(self, key, entry):
+        os.makedirs(self.local_dir, exist_ok=True)
+        # A temp file of its own per writer, so concurrent writers of a key never replace
+        # the entry with another writer's half-written file
+        with tempfile.NamedTemporaryFile("w", dir=self.local_dir, prefix=f"{key}.", suffix=".tmp", delete=False) as f:
+            json.dump(entry, f)
+        try:
+            os.replace(f.name, self._local_path(key))
+        except OSError:
+            os.remove(f.name)
+            raise
+
+    def _read_s3(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            response = self.s3_getter().get_object(Bucket=self.bucket, Key=f"{self.prefix}{key}.json")
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None
+            raise
+        return json.loads(response["Body"].read())
+
+    def _hit(self, kind, entry):
+        with self._lock:
+            self._stats[kind] += 1
+            self._stats["saved_seconds"] += entry.get("infracost_seconds", 0.0)
+        return entry
+
+    def get(self, key):
+        """
+        Looks up a cached cost estimate.
+
+        Args:
+            key (str): The cache key from cost_cache_key.
+
+        Returns:
+            dict: The cached entry, or None on a miss.
+        """
+        entry = self._read_local(key)
+        if entry is not None:
+            return self._hit("local_hits", entry)
+        if self.s3_getter is not None:
+            entry = self._read_s3(key)
+            if entry is not None:
+                self._write_local(key, entry)
+                return self._hit("s3_hits", entry)
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, key, breakdown_json, infracost_seconds):
+        """
+        Stores a cost estimate.
+
+        Args:
+            key (str): The cache key from cost_cache_key.
+            breakdown_json (str): The Infracost JSON output.
+            infracost_seconds (float): How long the Infracost run took.
+        """
+        entry = {"breakdown_json": breakdown_json, "infracost_seconds": infracost_seconds}
+        self._write_local(key, entry)
+        if self.s3_getter is not None:
+            self.s3_getter().put_object(
+                Bucket=self.bucket,
+                Key=f"{self.prefix}{key}.json",
+                Body=json.dumps(entry).encode("utf-8"),
+                ContentType="application/json",
+            )
+
+    def stats(self):
+        """
+        Returns hit and miss counters for the cache.
+
+        Returns:
+            dict: Local and S3 hits, misses, hit rate and the Infracost seconds saved by hits.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        hits = stats["local_hits"] + stats["s3_hits"]
+        lookups = hits + stats["misses"]
+        stats["hits"] = hits
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,344 @@
+import hashlib
+import re
+from decimal import Decimal
+
+from cost_breakdown import iter_resources, parse_money, service_for_resource_type
+from cost_cache import normalize_terraform
+
+# Re-estimate everything once more than this fraction of the resources changed;
+# the partial run would cost about as much as a full one
+INCREMENTAL_MAX_CHANGED_FRACTION = 0.5
+
+_HEADER = re.compile(r'([A-Za-z_][\w-]*)((?:[ \t]+(?:"[^"\n]*"|[A-Za-z_][\w-]*))*)[ \t]*\{')
+_LABEL = re.compile(r'"([^"\n]*)"|([A-Za-z_][\w-]*)')
+_HEREDOC = re.compile(r'<<-?([A-Za-z_]\w*)[ \t]*\n')
+_REFERENCE = re.compile(r'\b([a-z][a-z0-9_]*\.[A-Za-z_][\w-]*)\b')
+_INDEX = re.compile(r'\[[^\]]*\]$')
+
+
+def _skip_space(text, i):
+    # Skips whitespace and comments between top-level blocks
+    n = len(text)
+    while i < n:
+        if text[i].isspace():
+            i += 1
+        elif text[i] == "#" or text.startswith("//", i):
+            end = text.find("\n", i)
+            i = n if end < 0 else end + 1
+        elif text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+        else:
+            break
+    return i
+
+
+def _block_end(text, i):
+    """
+    Finds the end of a block body, skipping braces inside strings, interpolations,
+    comments and heredocs.
+
+    Args:
+        text (str): The Terraform code.
+        i (int): Index just after the opening brace.
+
+    Returns:
+        int: Index just after the closing brace, or None if the block is not closed.
+    """
+    n = len(text)
+    stack = ["{"]
+    while i < n and stack:
+        mode = stack[-1]
+        if mode == '"':
+            if text[i] == "\\":
+                i += 2
+            elif text[i] == '"':
+                stack.pop()
+                i += 1
+            elif text.startswith(("${", "%{"), i):
+                stack.append("{")
+                i += 2
+            else:
+                i += 1
+            continue
+        c = text[i]
+        if c == '"':
+            stack.append('"')
+        elif c == "#" or text.startswith("//", i):
+            end = text.find("\n", i)
+            i = n if end < 0 else end
+            continue
+        elif text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+            continue
+        elif text.startswith("<<", i):
+            heredoc = _HEREDOC.match(text, i)
+            if heredoc:
+                terminator = re.compile(r'^[ \t]*' + re.escape(heredoc.group(1)) + r'[ \t]*$', re.MULTILINE)
+                end = terminator.search(text, heredoc.end())
+                i = n if end is None else end.end()
+                continue
+        elif c == "{":
+            stack.append("{")
+        elif c == "}":
+            stack.pop()
+        i += 1
+    return i if not stack else None
+
+
+def split_blocks(text):
+    """
+    Splits Terraform code into its top-level blocks.
+
+    Args:
+        text (str): The Terraform code.
+
+    Returns:
+        list: Dicts with the block `type`, its `labels` and its `text`, in file order.
+        None if the code cannot be split, e.g. because a brace is not closed.
+    """
+    blocks = []
+    i = _skip_space(text, 0)
+    while i < len(text):
+        header = _HEADER.match(text, i)
+        if header is None:
+            return None
+        end = _block_end(text, header.end())
+        if end is None:
+            return None
+        labels = [quoted or bare for quoted, bare in _LABEL.findall(header.group(2))]
+        blocks.append({"type": header.group(1), "labels": labels, "text": text[i:end]})
+        i = _skip_space(text, end)
+    return blocks
+
+
+def parse_terraform(text):
+    """
+    Separates the resource blocks of Terraform code from everything they share.
+
+    Args:
+        text (str): The Terraform code.
+
+    Returns:
+        dict: `resources`, the text of each resource block by address ('aws_instance.web'),
+        `shared`, the text of all other blocks (providers, variables, locals, data, modules),
+        and `shared_hash`, a hash of the normalized shared text. None if the code cannot be split.
+    """
+    blocks = split_blocks(text)
+    if blocks is None:
+        return None
+    resources = {}
+    shared = []
+    for block in blocks:
+        if block["type"] == "resource" and len(block["labels"]) == 2:
+            resources[".".join(block["labels"])] = block["text"]
+        else:
+            shared.append(block["text"])
+    shared_text = "\n\n".join(shared)
+    return {
+        "resources": resources,
+        "shared": shared_text,
+        "shared_hash": hashlib.sha256(normalize_terraform(shared_text).encode("utf-8")).hexdigest(),
+    }
+
+
+def references(block_text, addresses):
+    # Resource addresses a block refers to, e.g. aws_subnet.private in `subnet_id = aws_subnet.private.id`
+    return {match for match in _REFERENCE.findall(block_text) if match in addresses}
+
+
+def plan_incremental(old_text, new_text, max_changed_fraction=INCREMENTAL_MAX_CHANGED_FRACTION):
+    """
+    Works out which resources of a new Terraform revision have to be estimated again.
+
+    Only resource blocks may differ: a change to a provider, variable, local, data
+    source or module can change the cost of any resource, so it needs a full estimate.
+    Resources that refer to a changed resource, directly or through others, count as
+    changed too. Resources referenced by a changed resource are estimated along with
+    it, so that its references resolve, but their costs are taken from the baseline.
+
+    Args:
+        old_text (str): The Terraform code of the baseline estimate.
+        new_text (str): The Terraform code of the new revision.
+        max_changed_fraction (float): Above this fraction of changed resources a full estimate is needed.
+
+    Returns:
+        dict: The `changed` (including added and dependent) and `removed` resource addresses, the
+        `context` addresses estimated only for their references, the reduced `terraform`
+        code to estimate, and the number of `resources` in the new revision.
+        None if the new revision needs a full estimate.
+    """
+    old = parse_terraform(old_text)
+    new = parse_terraform(new_text)
+    if old is None or new is None or old["shared_hash"] != new["shared_hash"]:
+        return None
+    changed = {
+        address for address, text in new["resources"].items()
+        if normalize_terraform(old["resources"].get(address, "")) != normalize_terraform(text)
+    }
+    removed = set(old["resources"]) - set(new["resources"])
+
+    # A resource referring to a changed one can change cost with it, e.g. an autoscaling
+    # group of a changed launch template, so it is estimated again as well
+    addresses = set(new["resources"])
+    referenced = {address: references(text, addresses) for address, text in new["resources"].items()}
+    pending = list(changed)
+    while pending:
+        address = pending.pop()
+        for dependent, targets in referenced.items():
+            if address in targets and dependent not in changed:
+                changed.add(dependent)
+                pending.append(dependent)
+    if len(changed) > max_changed_fraction * max(len(new["resources"]), 1):
+        return None
+
+    context = set()
+    pending = list(changed)
+    while pending:
+        for address in referenced[pending.pop()]:
+            if address not in changed and address not in context:
+                context.add(address)
+                pending.append(address)
+
+    blocks = [new["shared"]] + [new["resources"][address] for address in sorted(changed | context)]
+    return {
+        "changed": sorted(changed),
+        "removed": sorted(removed),
+        "context": sorted(context),
+        "terraform": "\n\n".join(block for block in blocks if block) + "\n",
+        "resources": len(new["resources"]),
+    }
+
+
+def resource_address(name):
+    # 'aws_instance.web[0]' -> 'aws_instance.web'
+    return _INDEX.sub("", name)
+
+
+def merge_breakdowns(baseline, partial, plan):
+    """
+    Builds the breakdown of a new revision from the baseline and the estimate of its changed resources.
+
+    Args:
+        baseline (dict): The Infracost JSON breakdown of the baseline revision.
+        partial (dict): The Infracost JSON breakdown of the reduced code from plan_incremental, or None if no resource changed.
+        plan (dict): The result of plan_incremental.
+
+    Returns:
+        dict: A breakdown in Infracost JSON layout, with a single project holding every resource.
+    """
+    changed = set(plan["changed"])
+    dropped = changed | set(plan["removed"])
+    resources = [
+        resource for _, resource in iter_resources(baseline)
+        if resource_address(resource.get("name", "")) not in dropped
+    ]
+    resources += [
+        resource for _, resource in iter_resources(partial or {})
+        if resource_address(resource.get("name", "")) in changed
+    ]
+    total = sum((parse_money(resource.get("monthlyCost")) or Decimal("0") for resource in resources), Decimal("0"))
+    projects = baseline.get("projects") or [{}]
+    return {
+        "currency": baseline.get("currency", "USD"),
+        "projects": [{"name": projects[0].get("name", ""), "breakdown": {"resources": resources, "totalMonthlyCost": str(total)}}],
+        "totalMonthlyCost": str(total),
+    }
+
+
+def resource_costs(breakdown):
+    # Monthly cost per resource name; unpriced resources count as 0
+    costs = {}
+    for _, resource in iter_resources(breakdown):
+        name = resource.get("name", "")
+        costs[name] = costs.get(name, Decimal("0")) + (parse_money(resource.get("monthlyCost")) or Decimal("0"))
+    return costs
+
+
+def diff_breakdowns(old, new):
+    """
+    Compares the breakdowns of two revisions resource by resource.
+
+    Args:
+        old (dict): The Infracost JSON breakdown of the baseline revision.
+        new (dict): The Infracost JSON breakdown of the new revision.
+
+    Returns:
+        dict: The currency, `added` and `removed` resources with their cost, `changed`
+        resources with their old and new cost, the cost change per service, and the
+        old and new totals and their difference.
+    """
+    old_costs = resource_costs(old)
+    new_costs = resource_costs(new)
+    added = [(name, new_costs[name]) for name in sorted(set(new_costs) - set(old_costs))]
+    removed = [(name, old_costs[name]) for name in sorted(set(old_costs) - set(new_costs))]
+    changed = [
+        (name, old_costs[name], new_costs[name])
+        for name in sorted(set(old_costs) & set(new_costs))
+        if old_costs[name] != new_costs[name]
+    ]
+
+    services = {}
+    for name, old_cost, new_cost in [(n, Decimal("0"), c) for n, c in added] + [(n, c, Decimal("0")) for n, c in removed] + changed:
+        service = service_for_resource_type(resource_address(name).split(".")[-2] if "." in name else name)
+        services[service] = services.get(service, Decimal("0")) + new_cost - old_cost
+
+    old_total = parse_money(old.get("totalMonthlyCost"))
+    new_total = parse_money(new.get("totalMonthlyCost"))
+    old_total = sum(old_costs.values(), Decimal("0")) if old_total is None else old_total
+    new_total = sum(new_costs.values(), Decimal("0")) if new_total is None else new_total
+    return {
+        "currency": new.get("currency", "USD"),
+        "added": added,
+        "removed": removed,
+        "changed": changed,
+        "services": {service: delta for service, delta in sorted(services.items()) if delta},
+        "old_total": old_total,
+        "new_total": new_total,
+        "delta": new_total - old_total,
+    }
+
+
+def _money(value):
+    return value.quantize(Decimal("0.01"))
+
+
+def _signed(value):
+    return f"{'+' if value >= 0 else '-'}{_money(abs(value))}"
+
+
+def format_cost_diff(diff):
+    """
+    Formats a cost diff: the change of the total, then the resources and services that changed.
+
+    Args:
+        diff (dict): The result of diff_breakdowns.
+
+    Returns:
+        str: The cost change and the new total monthly cost.
+    """
+    currency = diff["currency"]
+    if not (diff["added"] or diff["removed"] or diff["changed"]):
+        return f"No cost change since the last estimate. Total monthly cost: {_money(diff['new_total'])} {currency}"
+    lines = [
+        f"Monthly cost change since the last estimate: {_signed(diff['delta'])} {currency} "
+        f"({_money(diff['old_total'])} -> {_money(diff['new_total'])} {currency})"
+    ]
+    if diff["changed"]:
+        lines.append("Changed resources:")
+        lines += [
+            f"- {name}: {_money(old)} -> {_money(new)} {currency} ({_signed(new - old)})"
+            for name, old, new in diff["changed"]
+        ]
+    if diff["added"]:
+        lines.append("Added resources:")
+        lines += [f"- {name}: {_money(cost)} {currency}" for name, cost in diff["added"]]
+    if diff["removed"]:
+        lines.append("Removed resources:")
+        lines += [f"- {name}: {_money(cost)} {currency}" for name, cost in diff["removed"]]
+    if diff["services"]:
+        lines.append("Change per service:")
+        lines += [f"- {service}: {_signed(delta)} {currency}" for service, delta in diff["services"].items()]
+    lines.append(f"Total monthly cost: {_money(diff['new_total'])} {currency}")
+    return "\n".join(lines)
@@ -0,0 +1,216 @@
+import contextlib
+import os
+import threading
+import time
+
+# Time kept back from the Lambda timeout to build and return the response
+DEADLINE_RESERVE_SECONDS = float(os.environ.get("DEADLINE_RESERVE_SECONDS", "3"))
+
+# Below this many seconds a request is short on time: retrieval fetches fewer
+# results and model output is capped to what can still be generated
+DEADLINE_LOW_SECONDS = float(os.environ.get("DEADLINE_LOW_SECONDS", "30"))
+
+# Conservative generation speed and first-token latency, used to cap max_tokens
+DEADLINE_TOKENS_PER_SECOND = float(os.environ.get("DEADLINE_TOKENS_PER_SECOND", "40"))
+DEADLINE_FIRST_TOKEN_SECONDS = float(os.environ.get("DEADLINE_FIRST_TOKEN_SECONDS", "2"))
+
+# Never ask for fewer tokens than this, a shorter answer is not worth the call
+DEADLINE_MIN_OUTPUT_TOKENS = int(os.environ.get("DEADLINE_MIN_OUTPUT_TOKENS", "256"))
+
+_local = threading.local()
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised when a stage cannot finish before the invocation deadline.
+
+    Attributes:
+        stage (str): The stage that ran out of time.
+        partial (str): Output produced before the deadline, if any.
+    """
+
+    def __init__(self, stage, partial=""):
+        super().__init__(f"{stage} ran out of time")
+        self.stage = stage
+        self.partial = partial
+
+
+class Deadline:
+    """
+    A point in time by which the current invocation has to return.
+    """
+
+    def __init__(self, seconds):
+        """
+        Args:
+            seconds (float): Seconds from now until the deadline.
+        """
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+
+def current():
+    return getattr(_local, "deadline", None)
+
+
+def remaining():
+    """
+    Returns the seconds left before the current deadline.
+
+    Returns:
+        float: The remaining seconds, or None outside of a deadline scope.
+    """
+    deadline = current()
+    return deadline.remaining() if deadline is not None else None
+
+
+@contextlib.contextmanager
+def scope(seconds):
+    """
+    Sets the deadline of the code running in this thread.
+
+    Args:
+        seconds (float): Seconds from now until the deadline, or None for no deadline.
+
+    Yields:
+        Deadline: The deadline, or None.
+    """
+    previous = current()
+    _local.deadline = Deadline(seconds) if seconds is not None else None
+    try:
+        yield _local.deadline
+    finally:
+        _local.deadline = previous
+
+
+def bind(fn):
+    """
+    Binds a function to the current deadline, for work handed to another thread.
+
+    Args:
+        fn (callable): The function to run in the other thread.
+
+    Returns:
+        callable: A function that runs fn under the caller's deadline.
+    """
+    bound = current()
+
+    def run(*args, **kwargs):
+        previous = current()
+        _local.deadline = bound
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.deadline = previous
+    return run
+
+
+def scope_from_context(context, reserve=None):
+    """
+    Sets the deadline from a Lambda context, keeping a reserve to return the response.
+
+    Args:
+        context: The Lambda context object, or None outside of Lambda.
+        reserve (float): Seconds kept back, defaults to DEADLINE_RESERVE_SECONDS.
+
+    Returns:
+        A context manager, see scope().
+    """
+    get_remaining = getattr(context, "get_remaining_time_in_millis", None)
+    if get_remaining is None:
+        return scope(None)
+    reserve = DEADLINE_RESERVE_SECONDS if reserve is None else reserve
+    return scope(max(0.0, get_remaining() / 1000.0 - reserve))
+
+
+def budget(seconds=None, stage="stage"):
+    """
+    Returns the time a stage may take: its own limit, capped by the current deadline.
+
+    Args:
+        seconds (float): The stage's own limit, or None for no limit.
+        stage (str): The stage name, used in the error.
+
+    Returns:
+        float: The budget in seconds, or None if neither limit applies.
+
+    Raises:
+        DeadlineExceeded: If the deadline has already passed.
+    """
+    left = remaining()
+    if left is None:
+        return seconds
+    if left <= 0:
+        raise DeadlineExceeded(stage)
+    return left if seconds is None else min(seconds, left)
+
+
+def check(stage):
+    """
+    Raises DeadlineExceeded if the deadline has passed, before starting a stage that cannot be interrupted.
+
+    Args:
+        stage (str): The stage name.
+    """
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(stage)
+
+
+def short_on_time():
+    left = remaining()
+    return left is not None and left < DEADLINE_LOW_SECONDS
+
+
+def scaled(value, low_value):
+    """
+    Picks a smaller setting, e.g. retrieval depth, when the request is short on time.
+
+    Args:
+        value: The normal setting.
+        low_value: The setting used below DEADLINE_LOW_SECONDS.
+
+    Returns:
+        The setting to use.
+    """
+    return low_value if short_on_time() else value
+
+
+def fit_max_tokens(max_tokens):
+    """
+    Caps the number of tokens to generate to what can be generated before the deadline.
+
+    Args:
+        max_tokens (int): The requested maximum.
+
+    Returns:
+        int: The maximum to request.
+
+    Raises:
+        DeadlineExceeded: If there is not even time for DEADLINE_MIN_OUTPUT_TOKENS.
+    """
+    left = remaining()
+    if left is None:
+        return max_tokens
+    fits = int((left - DEADLINE_FIRST_TOKEN_SECONDS) * DEADLINE_TOKENS_PER_SECOND)
+    if fits < min(max_tokens, DEADLINE_MIN_OUTPUT_TOKENS):
+        raise DeadlineExceeded("model call")
+    return min(max_tokens, fits)
+
+
+def partial_answer(error):
+    """
+    Builds the answer returned when a request runs out of time: whatever was generated
+    before the deadline, followed by a note that it is incomplete.
+
+    Args:
+        error (TimeoutError): The error, a DeadlineExceeded carries the partial output.
+
+    Returns:
+        str: The degraded answer.
+    """
+    partial = getattr(error, "partial", "")
+    note = "The request ran out of time before it could be completed, please try again or ask a narrower question."
+    return f"{partial}\n\n[{note}]" if partial else note
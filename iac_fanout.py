@@ -0,0 +1,254 @@
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+
+import deadline
+import tracing
+from cost_diff import split_blocks
+
+# Service modules generated at the same time for one request
+IAC_GEN_CONCURRENCY = int(os.environ.get("IAC_GEN_CONCURRENCY", "4"))
+
+# Plans with more services than this are generated in a single call instead
+IAC_GEN_MAX_SERVICES = int(os.environ.get("IAC_GEN_MAX_SERVICES", "16"))
+
+# Output tokens of the planning call and of each service module
+IAC_PLAN_MAX_TOKENS = int(os.environ.get("IAC_PLAN_MAX_TOKENS", "1024"))
+IAC_MODULE_MAX_TOKENS = int(os.environ.get("IAC_MODULE_MAX_TOKENS", "4096"))
+
+DEFAULT_REGION = "us-east-1"
+
+_REGION = re.compile(r"^[a-z]{2}(-[a-z]+)+-\d$")
+_FENCE = re.compile(r"^[ \t]*```[^\n]*$\n?", re.MULTILINE)
+
+# Written once by the merge, so every module leaves them out
+_HEADER_BLOCKS = ("terraform", "provider")
+
+# Blocks without labels that a stack may hold any number of
+_UNNAMED_BLOCKS = ("locals",)
+
+PLAN_PROMPT = """Act as a DevOps Engineer planning a Terraform stack. Analyze the customer requirements below and list the AWS services the solution needs, in the order they should be provisioned.
+
+Answer with JSON only, without any other text, in this form:
+{{"region": "us-east-1", "services": [{{"name": "network", "description": "VPC with public and private subnets", "resources": ["aws_vpc.main", "aws_subnet.private"], "uses": []}}, {{"name": "database", "description": "RDS PostgreSQL in the private subnets", "resources": ["aws_db_instance.main"], "uses": ["network"]}}]}}
+
+Each service lists the Terraform addresses of the resources it creates and the names of the services whose resources it references. Group small supporting resources, such as IAM roles and security groups, with the service that uses them.
+
+Customer requirements:
+{prompt}"""
+
+MODULE_PROMPT = """Act as a DevOps Engineer. A Terraform stack for the customer requirements below is generated one service at a time, following this plan:
+{plan}
+
+Write the Terraform code of the "{name}" service only: {description}. Create the resources {resources}. Reference resources of other services by the addresses in the plan, for example {example}, and do not define them again. Do not write terraform or provider blocks. Provide only the Terraform code, without any additional comments, explanations, markdown formatting, or special symbols.
+
+Customer requirements:
+{prompt}"""
+
+
+class IncompleteStack(RuntimeError):
+    """
+    Raised when a service module is cut off or conflicts with another module, so that
+    the merged stack would miss resources other modules refer to.
+    """
+
+
+def strip_code_fences(text):
+    # Models wrap code in ```hcl fences now and then despite the prompt
+    return _FENCE.sub("", text)
+
+
+def parse_plan(text, max_services=IAC_GEN_MAX_SERVICES):
+    """
+    Reads the service plan from the response of the planning call.
+
+    Args:
+        text (str): The model response.
+        max_services (int): Plans with more services are rejected.
+
+    Returns:
+        dict: The `region` and the `services`, each with its `name`, `description`,
+        `resources` and `uses`, in plan order. None if the response is not a usable plan.
+    """
+    start, end = text.find("{"), text.rfind("}")
+    try:
+        plan = json.loads(text[start:end + 1]) if start >= 0 else None
+    except ValueError:
+        return None
+    if not isinstance(plan, dict) or not isinstance(plan.get("services"), list):
+        return None
+
+    services = []
+    names = set()
+    for service in plan["services"]:
+        if not isinstance(service, dict) or not str(service.get("name") or "").strip():
+            return None
+        name = str(service["name"]).strip()
+        if name in names:
+            continue
+        names.add(name)
+        services.append({
+            "name": name,
+            "description": str(service.get("description") or name).strip(),
+            "resources": [str(r) for r in service.get("resources") or [] if isinstance(r, str)],
+            "uses": [str(u) for u in service.get("uses") or [] if isinstance(u, str)],
+        })
+    if not services or len(services) > max_services:
+        return None
+    region = str(plan.get("region") or "")
+    return {"region": region if _REGION.match(region) else DEFAULT_REGION, "services": services}
+
+
+def module_prompt(prompt, plan, service):
+    """
+    Builds the prompt generating the Terraform code of one service.
+
+    Args:
+        prompt (str): The customer's request.
+        plan (dict): The result of parse_plan.
+        service (dict): The service of the plan to generate.
+
+    Returns:
+        str: The prompt.
+    """
+    other = [r for s in plan["services"] if s["name"] in service["uses"] for r in s["resources"]]
+    return MODULE_PROMPT.format(
+        plan=json.dumps(plan["services"], indent=1),
+        name=service["name"],
+        description=service["description"],
+        resources=", ".join(service["resources"]) or "it needs",
+        example=f"{other[0]}.id" if other else "aws_vpc.main.id",
+        prompt=prompt,
+    )
+
+
+def merge_modules(plan, modules):
+    """
+    Merges the generated service modules into one Terraform file.
+
+    The result depends only on the plan and the module texts, never on the order the
+    modules finished in. Modules follow in plan order after a single terraform and
+    provider block. A block defined the same way by several modules, such as a shared
+    variable or data source, is kept where it first appears.
+
+    Args:
+        plan (dict): The result of parse_plan.
+        modules (dict): The Terraform code generated per service name.
+
+    Returns:
+        str: The Terraform code of the whole stack.
+
+    Raises:
+        IncompleteStack: If a module cannot be split into blocks, e.g. because it was
+            cut off, or defines a block another module defines differently.
+    """
+    parts = [
+        'terraform {\n  required_providers {\n    aws = {\n      source = "hashicorp/aws"\n    }\n  }\n}',
+        f'provider "aws" {{\n  region = "{plan["region"]}"\n}}',
+    ]
+    seen = {}
+    for service in plan["services"]:
+        blocks = split_blocks(strip_code_fences(modules.get(service["name"], "")))
+        if blocks is None:
+            raise IncompleteStack(f"The Terraform code of service {service['name']} is incomplete")
+        texts = []
+        for block in blocks:
+            if block["type"] in _HEADER_BLOCKS:
+                continue
+            text = " ".join(block["text"].split())
+            if block["type"] in _UNNAMED_BLOCKS:
+                key = (block["type"], text)
+            else:
+                key = (block["type"], tuple(block["labels"]))
+            if key in seen:
+                if seen[key][1] != text:
+                    address = " ".join([block["type"], *block["labels"]])
+                    raise IncompleteStack(f"Services {seen[key][0]} and {service['name']} define {address} differently")
+                continue
+            seen[key] = (service["name"], text)
+            texts.append(block["text"])
+        if texts:
+            parts.append(f"# {service['name']}: {service['description']}\n" + "\n\n".join(texts))
+    return "\n\n".join(parts) + "\n"
+
+
+def generate_stack(prompt, router, concurrency=IAC_GEN_CONCURRENCY, timeout=None):
+    """
+    Generates a Terraform stack in stages: a short planning call lists the services,
+    each service is generated by its own model call, and the modules are merged.
+
+    Service modules are generated concurrently, so the time taken follows the slowest
+    module rather than their sum, and no single response has to hold the whole stack.
+
+    Module calls run under a deadline of their own, `timeout` from the start, so
+    max_tokens and rate limiter waits are fitted to it. Once the generation fails or
+    times out, modules that have not started are cancelled. Module calls in flight
+    cannot be aborted while Bedrock works on them, but they are streamed and stop at
+    their next chunk, which releases their rate limiter reservation.
+
+    Args:
+        prompt (str): The customer's request.
+        router (ModelRouter): Routes the planning call and the module calls.
+        concurrency (int): Service modules generated at the same time.
+        timeout (float): Seconds the module calls may take, or None.
+
+    Returns:
+        str: The Terraform code, or None if the request does not split into several
+        services and is better generated in one call.
+
+    Raises:
+        DeadlineExceeded: If the modules are not generated within the timeout.
+        IncompleteStack: If a module is cut off at max_tokens or conflicts with another.
+    """
+    with tracing.span("iac_gen.plan") as span:
+        plan = parse_plan(router.generate("iac_plan", PLAN_PROMPT.format(prompt=prompt), IAC_PLAN_MAX_TOKENS))
+        span.set(services=len(plan["services"]) if plan else 0)
+    if plan is None or len(plan["services"]) < 2:
+        return None
+
+    expires = None if timeout is None else time.monotonic() + timeout
+    abandoned = threading.Event()
+
+    def stream_module(service):
+        chunks = []
+        usage = {}
+        stream = router.stream("iac_module", module_prompt(prompt, plan, service), IAC_MODULE_MAX_TOKENS, usage=usage)
+        try:
+            for chunk in stream:
+                if abandoned.is_set():
+                    raise deadline.DeadlineExceeded("iac_gen module")
+                chunks.append(chunk)
+        finally:
+            stream.close()
+        if usage.get("truncated"):
+            raise IncompleteStack(f"The Terraform code of service {service['name']} was cut off at max_tokens")
+        return "".join(chunks)
+
+    def generate_module(service):
+        with tracing.span("iac_gen.module", service=service["name"]):
+            if expires is None:
+                return stream_module(service)
+            with deadline.scope(max(0.0, expires - time.monotonic())):
+                return stream_module(service)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(plan["services"]))),
+                                  thread_name_prefix="iac-module")
+    try:
+        futures = {
+            service["name"]: executor.submit(tracing.bind(deadline.bind(generate_module)), service)
+            for service in plan["services"]
+        }
+        done, pending = wait(futures.values(), timeout=timeout, return_when=FIRST_EXCEPTION)
+        if pending:
+            for future in done:
+                future.result()
+            raise deadline.DeadlineExceeded("iac_gen")
+        modules = {name: future.result() for name, future in futures.items()}
+    finally:
+        # Queued modules are cancelled; running ones stop at their next chunk
+        abandoned.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+    return merge_modules(plan, modules)
@@ -37,5 +37,5 @@ if file is not None and (result1 or result2):
     # Temporarily save the uploaded file to pass its path to the function
     with open(file.name, "wb") as f:
         f.write(file.getbuffer())
-    # Call the image_to_text function with the file path and input text
-    st.write(tools.image_to_text(file.name, input_text))
+    # Stream the answer of the image_to_text function so tokens render as they arrive
+    st.write_stream(tools.image_to_text_stream(file.name, input_text))
@@ -0,0 +1,174 @@
+"""
+Batch analysis of architecture diagrams with image_to_text.
+
+Images are read from a directory or a manifest and analyzed concurrently.
+Each result is appended to a JSONL file as soon as it is ready, so an
+interrupted run picks up where it stopped when started again with the same
+output file.
+
+Usage:
+    PYTHONPATH=.. python batch.py diagrams/ --output results.jsonl --workers 4 --rpm 30
+    PYTHONPATH=.. python batch.py manifest.jsonl --output results.jsonl
+
+A manifest is either a text file with one image path per line, or a JSONL file
+with objects like {"image": "path/to/diagram.png", "prompt": "..."}.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Shared with the action group handlers, see "Shared Bedrock Client" in the README
+import bedrock_client
+from image_to_text import image_to_text
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".webp")
+
+DEFAULT_PROMPT = "You are an AWS Solutions Architect. The image you've received is an architecture diagram. Please explain the technical data flow in detail, step-by-step, and identify each AWS service used in the diagram."
+
+
+def load_jobs(source, default_prompt):
+    """
+    Lists the images to analyze.
+
+    Args:
+        source (str): A directory of images or a manifest file.
+        default_prompt (str): The prompt for images without one in the manifest.
+
+    Returns:
+        list: Jobs as dicts with the image path and prompt.
+    """
+    if os.path.isdir(source):
+        names = sorted(name for name in os.listdir(source) if name.lower().endswith(IMAGE_EXTENSIONS))
+        return [{"image": os.path.join(source, name), "prompt": default_prompt} for name in names]
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    jobs = []
+    with open(source, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                entry = json.loads(line)
+                image, prompt = entry["image"], entry.get("prompt", default_prompt)
+            else:
+                image, prompt = line, default_prompt
+            jobs.append({"image": os.path.join(base_dir, image), "prompt": prompt})
+    return jobs
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))]
+
+
+def job_id(job):
+    return f"{job['image']}\n{job['prompt']}"
+
+
+def load_completed(output_path):
+    """
+    Reads the IDs of images that already have a successful result.
+
+    Args:
+        output_path (str): The JSONL results file.
+
+    Returns:
+        set: The IDs of completed jobs.
+    """
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue  # A line cut short by an interrupted run
+            if result.get("status") == "ok":
+                completed.add(job_id(result))
+    return completed
+
+
+def run_batch(jobs, output_path, workers=4, rpm=None):
+    """
+    Analyzes images concurrently and appends one JSON line per result.
+
+    Args:
+        jobs (list): Jobs from load_jobs.
+        output_path (str): The JSONL results file.
+        workers (int): Maximum number of concurrent model calls.
+        rpm (int): Optional maximum number of images started per minute.
+
+    Returns:
+        dict: Number of processed, failed and skipped images, throughput in images per
+        minute and per-image latency percentiles in seconds.
+    """
+    completed = load_completed(output_path)
+    pending = [job for job in jobs if job_id(job) not in completed]
+    limiter = bedrock_client.TokenBucket(rpm) if rpm else None
+    latencies = []
+    failed = 0
+
+    def analyze(job):
+        if limiter:
+            limiter.acquire(1)
+        start = time.perf_counter()
+        try:
+            output = image_to_text(job["image"], job["prompt"])
+            result = {"status": "ok", "output": output}
+        except Exception as e:
+            result = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+        result.update(image=job["image"], prompt=job["prompt"], latency=time.perf_counter() - start)
+        return result
+
+    start = time.perf_counter()
+    with open(output_path, "a") as out, ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(analyze, job) for job in pending]
+        for i, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            # Results are written from this thread only, one flushed line each, so an
+            # interrupted run loses at most the images still in flight
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            if result["status"] == "ok":
+                latencies.append(result["latency"])
+            else:
+                failed += 1
+            print(f"[{i}/{len(pending)}] {result['status']} {result['image']} in {result['latency']:.1f}s")
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "processed": len(pending),
+        "failed": failed,
+        "skipped": len(jobs) - len(pending),
+        "images_per_minute": len(pending) / elapsed * 60 if elapsed else 0.0,
+        "latency_p50": percentile(latencies, 0.50),
+        "latency_p95": percentile(latencies, 0.95),
+        "latency_max": percentile(latencies, 1.0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="directory of images or manifest file")
+    parser.add_argument("--output", default="results.jsonl", help="JSONL file to append results to")
+    parser.add_argument("--workers", type=int, default=4, help="maximum concurrent model calls")
+    parser.add_argument("--rpm", type=int, help="maximum images started per minute")
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT, help="prompt for images without one in the manifest")
+    args = parser.parse_args()
+
+    jobs = load_jobs(args.source, args.prompt)
+    report = run_batch(jobs, args.output, workers=args.workers, rpm=args.rpm)
+    print(json.dumps(report, indent=2))
+    if report["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
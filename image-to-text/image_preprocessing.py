@@ -0,0 +1,103 @@
+import base64
+import hashlib
+import io
+import math
+import os
+
+from PIL import Image
+
+import tracing
+
+# Formats Claude accepts as-is, mapped to their media type
+SUPPORTED_FORMATS = {
+    "PNG": "image/png",
+    "JPEG": "image/jpeg",
+    "GIF": "image/gif",
+    "WEBP": "image/webp",
+}
+
+# Claude downscales anything larger than about 1.15 megapixels before reading it,
+# so sending more pixels only adds payload and latency
+MAX_IMAGE_PIXELS = int(os.environ.get("MAX_IMAGE_PIXELS", "1150000"))
+
+# Bedrock rejects images above 3.75 MB
+MAX_IMAGE_BYTES = int(os.environ.get("MAX_IMAGE_BYTES", str(3750 * 1000)))
+
+
+def image_content_hash(image_bytes):
+    """
+    Hashes the raw bytes of an image.
+
+    Args:
+        image_bytes (bytes): The image file contents.
+
+    Returns:
+        str: The SHA-256 hex digest.
+    """
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def downscale(image, max_pixels):
+    """
+    Resizes an image so that it fits a pixel budget, keeping its aspect ratio.
+
+    Args:
+        image (Image): The opened image.
+        max_pixels (int): The maximum number of pixels.
+
+    Returns:
+        Image: The resized image.
+    """
+    width, height = image.size
+    scale = math.sqrt(max_pixels / (width * height))
+    size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    if image.format == "JPEG":
+        # Let the JPEG decoder skip detail we are about to throw away
+        image.draft(image.mode, size)
+    return image.resize(size, Image.LANCZOS)
+
+
+def prepare_image(image_bytes, max_pixels=MAX_IMAGE_PIXELS, max_bytes=MAX_IMAGE_BYTES):
+    """
+    Prepares an image for the Claude Messages API.
+
+    Supported files within the pixel and size budgets are passed through
+    without decoding or re-encoding; only the header is read. Larger images are
+    downscaled to the pixel budget, and unsupported formats are converted to PNG.
+
+    Args:
+        image_bytes (bytes): The image file contents.
+        max_pixels (int): The maximum number of pixels to send.
+        max_bytes (int): The maximum encoded size to send.
+
+    Returns:
+        tuple: The media type, the base64 encoded image and whether the image was re-encoded.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    width, height = image.size
+    media_type = SUPPORTED_FORMATS.get(image.format)
+    passthrough = media_type is not None and len(image_bytes) <= max_bytes
+    if passthrough and width * height <= max_pixels:
+        return media_type, base64.b64encode(image_bytes).decode("utf-8"), False
+
+    if width * height > max_pixels:
+        image = downscale(image, max_pixels)
+    if media_type is None:
+        media_type = "image/png"
+    output_format = [name for name, value in SUPPORTED_FORMATS.items() if value == media_type][0]
+    if output_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    output = io.BytesIO()
+    image.save(output, format=output_format, optimize=True)
+    while output.tell() > max_bytes:
+        # Still too large to send, halve the pixel count until it fits
+        image = downscale(image, image.size[0] * image.size[1] // 2)
+        output = io.BytesIO()
+        image.save(output, format=output_format, optimize=True)
+    if passthrough and output.tell() >= len(image_bytes):
+        # Flat diagrams can grow when resampled; the model downscales the original itself
+        return media_type, base64.b64encode(image_bytes).decode("utf-8"), False
+    tracing.log("Image re-encoded", width=width, height=height, bytes=len(image_bytes),
+                new_width=image.size[0], new_height=image.size[1], new_bytes=output.tell())
+    return media_type, base64.b64encode(output.getvalue()).decode("utf-8"), True
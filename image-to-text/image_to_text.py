@@ -1,46 +1,89 @@
 import os
-import base64
-import io
-from PIL import Image
-import boto3
-import json
-
-# Initialize Bedrock runtime client
-bedrock_runtime = boto3.client(
-    service_name="bedrock-runtime",
-    region_name="us-west-2",
-)
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Shared with the action group handlers, see "Shared Bedrock Client" in the README
+import bedrock_client
+import tracing
+from image_preprocessing import MAX_IMAGE_PIXELS, image_content_hash, prepare_image
+
+# Results are cached by image content hash and prompt, so asking the same
+# question about the same diagram again does not call the model
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("IMAGE_RESULT_CACHE_MAX_ENTRIES", "128"))
+result_cache = OrderedDict()
+result_cache_lock = threading.Lock()
+result_cache_stats = {"hits": 0, "misses": 0}
+
+def result_cache_key(content_hash, text):
+    """
+    Builds the result cache key of an image and prompt.
+
+    Args:
+        content_hash (str): The hash of the image file contents.
+        text (str): The prompt.
+
+    Returns:
+        str: The cache key.
+    """
+    key = f"{bedrock_client.SONNET_MODEL_ID}\n{MAX_IMAGE_PIXELS}\n{content_hash}\n{text}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+def get_cached_result(key):
+    with result_cache_lock:
+        result = result_cache.get(key)
+        if result is None:
+            result_cache_stats["misses"] += 1
+            return None
+        result_cache.move_to_end(key)
+        result_cache_stats["hits"] += 1
+        return result
+
+def put_cached_result(key, result):
+    with result_cache_lock:
+        result_cache[key] = result
+        result_cache.move_to_end(key)
+        while len(result_cache) > RESULT_CACHE_MAX_ENTRIES:
+            result_cache.popitem(last=False)
 
 def image_base64_encoder(image_name):
     """
     Encode an image file to base64 format.
 
+    Supported files are passed through without re-encoding; images above the
+    pixel budget are downscaled first.
+
     Args:
         image_name (str): The name of the image file.
 
     Returns:
         tuple: A tuple containing the file type and the base64 encoded image.
     """
-    open_image = Image.open(image_name)
-    image_bytes = io.BytesIO()
-    open_image.save(image_bytes, format=open_image.format)
-    image_bytes = image_bytes.getvalue()
-    image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-    file_type = f"image/{open_image.format.lower()}"
+    with open(image_name, 'rb') as f:
+        image_bytes = f.read()
+    file_type, image_base64, _ = prepare_image(image_bytes)
     return file_type, image_base64
 
-def image_to_text(image_name, text) -> str:
+def image_to_text_stream(image_name, text):
     """
-    Convert an image to text using an AI model.
+    Convert an image to text using an AI model, streaming the output as it is generated.
 
     Args:
         image_name (str): The name of the image file.
         text (str): Additional text or instructions for the AI model.
 
-    Returns:
-        str: The output text generated by the AI model.
+    Yields:
+        str: Chunks of the output text in the order the AI model generates them.
     """
-    file_type, image_base64 = image_base64_encoder(image_name)
+    with open(image_name, 'rb') as f:
+        image_bytes = f.read()
+    cache_key = result_cache_key(image_content_hash(image_bytes), text)
+    cached = get_cached_result(cache_key)
+    if cached is not None:
+        tracing.log("Image result cache hit", **result_cache_stats)
+        yield cached
+        return
+    file_type, image_base64, _ = prepare_image(image_bytes)
     
     # Default system prompt if no specific question is provided
     system_prompt = """You are an AWS Solutions Architect. The image you've received is an architecture diagram. Please explain the technical data flow in detail, step-by-step, and identify each AWS service used in the diagram.
@@ -76,24 +119,32 @@ def image_to_text(image_name, text) -> str:
         ]
     }
     
-    json_prompt = json.dumps(prompt)
-    response = bedrock_runtime.invoke_model(
-        body=json_prompt,
-        modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-        accept="application/json",
-        contentType="application/json"
-    )
-    
-    response_body = json.loads(response.get('body').read())
-    llm_output = response_body['content'][0]['text']
-    return llm_output
+    chunks = []
+    for chunk in bedrock_client.stream_claude_messages(prompt, bedrock_client.SONNET_MODEL_ID):
+        chunks.append(chunk)
+        yield chunk
+    put_cached_result(cache_key, "".join(chunks))
+
+def image_to_text(image_name, text) -> str:
+    """
+    Convert an image to text using an AI model.
+
+    Args:
+        image_name (str): The name of the image file.
+        text (str): Additional text or instructions for the AI model.
+
+    Returns:
+        str: The output text generated by the AI model.
+    """
+    return "".join(image_to_text_stream(image_name, text))
 
-# Replace 'path_to_your_image.jpg' with the actual path to your image file
-image_path = 'image.jpeg'
-text_input = "You are an AWS Solutions Architect. The image you've received is an architecture diagram. Please explain the technical data flow in detail, step-by-step, and identify each AWS service used in the diagram."  # You can put specific instructions here if needed
+if __name__ == "__main__":
+    # Replace 'path_to_your_image.jpg' with the actual path to your image file
+    image_path = 'image.jpeg'
+    text_input = "You are an AWS Solutions Architect. The image you've received is an architecture diagram. Please explain the technical data flow in detail, step-by-step, and identify each AWS service used in the diagram."  # You can put specific instructions here if needed
 
-# Call the function
-output_text = image_to_text(image_path, text_input)
+    # Call the function
+    output_text = image_to_text(image_path, text_input)
 
-# Print the result
-print(output_text)
+    # Print the result
+    print(output_text)
@@ -1,4 +1,6 @@
+import deadline
 import tools
+import tracing
 
 def handler(event, context):
     """
@@ -11,9 +13,23 @@ def handler(event, context):
     Returns:
         dict: The response dictionary containing the API response details.
     """
-    # Print the received event to the logs
-    print("Received event: ", event)
+    # Every invocation emits per-stage metrics; sampled invocations also log their spans
+    with tracing.trace(event.get("apiPath"), session_id=event.get("sessionId")):
+        # Stages run against the remaining Lambda time, less a reserve to return the response
+        with deadline.scope_from_context(context):
+            return handle_event(event, context)
 
+def handle_event(event, context):
+    """
+    Routes an API request to the tool function for its API path.
+
+    Args:
+        event (dict): The event data containing API request details.
+        context (object): The context object providing runtime information.
+
+    Returns:
+        dict: The response dictionary containing the API response details.
+    """
     # Initialize response code to None
     response_code = None
 
@@ -23,40 +39,61 @@ def handler(event, context):
     parameters = event["parameters"]
     input_text = event["inputText"]
     http_method = event["httpMethod"]
-
-    print(f"Input Text: {input_text}")
+    session_id = event.get("sessionId")
 
     # Get the query value from the parameters
     query = parameters[0]["value"]
-    print(f"Query: {query}")
 
-    # Check the API path to determine which tool function to call
-    if api_path == "/answer_query":
-        # Call the answer_query function from the tools module with the query
-        body = tools.answer_query(query)
-        # Create a response body with the result
-        response_body = {"application/json": {"body": str(body)}}
-        response_code = 200
-    elif api_path == "/iac_gen":
-        # Call the iac_gen_tool function from the tools module with the query
-        body = tools.iac_gen_tool(query)
-        # Create a response body with the result
-        response_body = {"application/json": {"body": str(body)}}
-        response_code = 200
-    elif api_path == "/iac_estimate_tool":
-        # Call the iac_estimate_tool function from the tools module with the query
-        body = tools.iac_estimate_tool(query)
-        # Create a response body with the result
+    # Log the request without its content unless TRACE_REDACT=false
+    tracing.log("Received event", action_group=action, http_method=http_method,
+                payload={"input_text": input_text, "query": query})
+
+    try:
+        # Check the API path to determine which tool function to call
+        if api_path == "/answer_query":
+            # Call the answer_query function from the tools module with the query
+            body = tools.answer_query(query)
+            # Create a response body with the result
+            response_body = {"application/json": {"body": str(body)}}
+            response_code = 200
+        elif api_path == "/iac_gen":
+            # Call the iac_gen_tool function from the tools module with the query
+            body = tools.iac_gen_tool(query, session_id)
+            # Create a response body with the result
+            response_body = {"application/json": {"body": str(body)}}
+            response_code = 200
+        elif api_path == "/iac_estimate_tool":
+            # Call the iac_estimate_tool function from the tools module with the query
+            body = tools.iac_estimate_tool(query, session_id)
+            # Create a response body with the result
+            response_body = {"application/json": {"body": str(body)}}
+            response_code = 200
+        elif api_path == "/iac_estimate_job":
+            # Start the cost estimation in the background and return its job ID right away
+            body = tools.submit_iac_estimate(query, session_id)
+            # Create a response body with the result
+            response_body = {"application/json": {"body": str(body)}}
+            response_code = 200
+        elif api_path == "/iac_estimate_job_status":
+            # The query is the job ID returned by /iac_estimate_job
+            body = tools.iac_estimate_status(query)
+            # Create a response body with the result
+            response_body = {"application/json": {"body": str(body)}}
+            response_code = 200
+        else:
+            # If the API path is not recognized, return an error message
+            body = f"{action}::{api_path} is not a valid API, try another one."
+            response_code = 400
+            response_body = {"application/json": {"body": str(body)}}
+    except TimeoutError as e:
+        # Out of time: answer with what was generated so far rather than letting Lambda kill the invocation
+        tracing.log("Deadline exceeded", stage=getattr(e, "stage", None), partial_chars=len(getattr(e, "partial", "")))
+        body = deadline.partial_answer(e)
         response_body = {"application/json": {"body": str(body)}}
         response_code = 200
-    else:
-        # If the API path is not recognized, return an error message
-        body = f"{action}::{api_path} is not a valid API, try another one."
-        response_code = 400
-        response_body = {"application/json": {"body": str(body)}}
 
-    # Print the response body to the logs
-    print(f"Response body: {response_body}")
+    # Log the response size, not the generated content
+    tracing.log("Response", status=response_code, payload={"body": body})
 
     # Create a dictionary containing the response details
     action_response = {
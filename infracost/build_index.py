@@ -0,0 +1,311 @@
+"""
+Builds or updates the FAISS `local_index` used by aws_well_arch_tool.
+
+Documents (PDF, Markdown or text) are read one page at a time and split into
+overlapping chunks. Each chunk is embedded with Titan, in batches on a thread
+pool; vectors are cached in SQLite by chunk hash so that unchanged chunks are
+never embedded again, even after a full rebuild. The cache file has the same
+format as the query embedding cache of aws_well_arch_tool and can be shared.
+
+A manifest next to the index records the content hash and chunk IDs of every
+source file. On the next run only new and changed files are chunked and
+embedded, and the chunks of changed and deleted files are removed from the
+index.
+
+Usage:
+    PYTHONPATH=.. python build_index.py docs/ --index local_index
+    PYTHONPATH=.. python build_index.py docs/ --index local_index --workers 8 --rebuild
+
+Reading PDFs requires `pip install pypdf`.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Shared with the action group handlers, see "Shared Bedrock Client" in the README
+import bedrock_client
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+from index_registry import MANIFEST_NAME, index_file_hashes
+
+DOCUMENT_EXTENSIONS = (".pdf", ".md", ".txt")
+DEFAULT_CACHE_PATH = ".embedding-cache.sqlite"
+
+
+def iter_documents(source_dir):
+    """
+    Lists the documents to index, in a stable order.
+
+    Args:
+        source_dir (str): The directory to search recursively.
+
+    Yields:
+        tuple: The path relative to source_dir, used as the `source` of each chunk, and the absolute path.
+    """
+    for root, dirs, files in os.walk(source_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(DOCUMENT_EXTENSIONS):
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, source_dir), path
+
+
+def file_sha256(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def iter_pages(path):
+    """
+    Reads a document one page at a time, so large PDFs are never held in memory as a whole.
+
+    Args:
+        path (str): The document path.
+
+    Yields:
+        tuple: The page number (1-based) and its text.
+    """
+    if path.lower().endswith(".pdf"):
+        from pypdf import PdfReader
+
+        for number, page in enumerate(PdfReader(path).pages, 1):
+            yield number, page.extract_text() or ""
+    else:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            yield 1, f.read()
+
+
+def chunk_text(text, chunk_size=1000, overlap=100):
+    """
+    Splits text into overlapping chunks, preferring paragraph and sentence boundaries.
+
+    Args:
+        text (str): The text to split.
+        chunk_size (int): Maximum characters per chunk.
+        overlap (int): Characters repeated at the start of the next chunk.
+
+    Yields:
+        str: The chunks.
+    """
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            # Cut at the last paragraph, sentence or word break in the second half of the window
+            window = text[start + chunk_size // 2:end]
+            for separator in ("\n\n", ". ", "\n", " "):
+                cut = window.rfind(separator)
+                if cut != -1:
+                    end = start + chunk_size // 2 + cut + len(separator)
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            yield chunk
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+
+
+def iter_chunks(source, path, chunk_size=1000, overlap=100):
+    """
+    Streams the chunks of one document with their metadata.
+
+    Args:
+        source (str): The document name stored as the chunk `source`.
+        path (str): The document path.
+        chunk_size (int): Maximum characters per chunk.
+        overlap (int): Characters repeated at the start of the next chunk.
+
+    Yields:
+        tuple: The chunk text and its metadata.
+    """
+    for page, text in iter_pages(path):
+        for chunk in chunk_text(text, chunk_size, overlap):
+            yield chunk, {"source": source, "page": page}
+
+
+def embed_texts(texts, embeddings, batch_size=32, max_workers=4):
+    """
+    Embeds texts in concurrent batches through a CachedEmbeddings.
+
+    Cached vectors are looked up one batch at a time and only the rest are
+    embedded. Each finished batch is stored right away, so an interrupted build
+    keeps the vectors it already paid for.
+
+    Args:
+        texts (list): The texts to embed.
+        embeddings (CachedEmbeddings): The cached embeddings.
+        batch_size (int): Texts per batch.
+        max_workers (int): Maximum concurrent batches, each making one embedding call at a time.
+
+    Returns:
+        tuple: The vectors in the order of texts, and the number of texts that had to be embedded.
+    """
+    misses = embeddings.stats()["misses"]
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    vectors = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for batch_vectors in executor.map(embeddings.embed_documents, batches):
+            vectors.extend(batch_vectors)
+    return vectors, embeddings.stats()["misses"] - misses
+
+
+def load_manifest(index_dir):
+    try:
+        with open(os.path.join(index_dir, MANIFEST_NAME), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_index(vectorstore, index_dir, manifest):
+    """
+    Writes the index and its manifest, replacing the old files one rename at a time.
+
+    The FAISS files are saved to a temporary directory first, so no file is ever
+    half-written. The manifest is written last and records the hash of each index
+    file: until it is in place the files do not match it, and IndexRegistry keeps
+    serving the previous index instead of mixing the new FAISS index with the old
+    docstore.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=index_dir)
+    try:
+        vectorstore.save_local(tmp_dir)
+        for name in os.listdir(tmp_dir):
+            os.replace(os.path.join(tmp_dir, name), os.path.join(index_dir, name))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    manifest = dict(manifest, index_files=index_file_hashes(index_dir))
+    tmp_path = os.path.join(index_dir, MANIFEST_NAME + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, os.path.join(index_dir, MANIFEST_NAME))
+
+
+def build_index(source_dir, index_dir, cache_path=DEFAULT_CACHE_PATH, chunk_size=1000, overlap=100,
+                batch_size=32, max_workers=4, rebuild=False, embeddings=None):
+    """
+    Builds the index from scratch or updates it with the documents that changed.
+
+    Args:
+        source_dir (str): The directory of source documents.
+        index_dir (str): The FAISS index directory, e.g. 'local_index'.
+        cache_path (str): The SQLite embedding cache.
+        chunk_size (int): Maximum characters per chunk.
+        overlap (int): Characters repeated at the start of the next chunk.
+        batch_size (int): Texts per embedding batch.
+        max_workers (int): Maximum concurrent embedding calls.
+        rebuild (bool): Ignore the existing index and build a new one; cached embeddings are still reused.
+        embeddings: The langchain embeddings to wrap with the cache. Defaults to Titan through BedrockEmbeddings.
+
+    Returns:
+        dict: Counts of added, changed, deleted and unchanged documents, chunks added and
+        removed, chunks embedded (cache misses) and the build time in seconds.
+    """
+    from langchain_community.embeddings import BedrockEmbeddings
+    from langchain_community.vectorstores import FAISS
+
+    start = time.perf_counter()
+    model_id = bedrock_client.TITAN_EMBED_MODEL_ID
+    settings = {"model_id": model_id, "chunk_size": chunk_size, "overlap": overlap}
+    manifest = None if rebuild else load_manifest(index_dir)
+    if manifest is not None and manifest.get("settings") != settings:
+        print("Index settings changed, rebuilding")
+        manifest = None
+    old_files = manifest["files"] if manifest else {}
+
+    stats = {"added": 0, "changed": 0, "deleted": 0, "unchanged": 0, "chunks_added": 0, "chunks_removed": 0}
+    files = {}
+    texts, metadatas, ids, stale_ids = [], [], [], []
+    for source, path in iter_documents(source_dir):
+        sha = file_sha256(path)
+        old = old_files.get(source)
+        if old is not None and old["sha256"] == sha:
+            files[source] = old
+            stats["unchanged"] += 1
+            continue
+        stats["changed" if old is not None else "added"] += 1
+        if old is not None:
+            stale_ids.extend(old["ids"])
+        chunk_ids = []
+        for i, (chunk, metadata) in enumerate(iter_chunks(source, path, chunk_size, overlap)):
+            # IDs follow the source path, since identical files in two places are separate
+            # documents; the content hash only tells whether a file changed
+            chunk_id = f"{source}#{i}"
+            texts.append(chunk)
+            metadatas.append(metadata)
+            ids.append(chunk_id)
+            chunk_ids.append(chunk_id)
+        files[source] = {"sha256": sha, "ids": chunk_ids}
+    for source, old in old_files.items():
+        if source not in files:
+            stats["deleted"] += 1
+            stale_ids.extend(old["ids"])
+
+    embeddings = embeddings or BedrockEmbeddings(client=bedrock_client.get_client("bedrock-runtime"), model_id=model_id)
+    vectors, stats["embedded"] = [], 0
+    store = EmbeddingCache(cache_path)
+    try:
+        if texts:
+            cached = CachedEmbeddings(embeddings, model_id, store=store, max_entries=0)
+            vectors, stats["embedded"] = embed_texts(texts, cached, batch_size, max_workers)
+    finally:
+        store.close()
+
+    if manifest is None:
+        if not texts:
+            raise ValueError(f"No documents to index in {source_dir}")
+        vectorstore = FAISS.from_embeddings(list(zip(texts, vectors)), embeddings, metadatas=metadatas, ids=ids)
+    else:
+        if not texts and not stale_ids:
+            stats["seconds"] = time.perf_counter() - start
+            print(f"Index {index_dir} is up to date")
+            return stats
+        vectorstore = FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
+        if stale_ids:
+            vectorstore.delete(stale_ids)
+        if texts:
+            vectorstore.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+    stats["chunks_added"] = len(texts)
+    stats["chunks_removed"] = len(stale_ids)
+
+    save_index(vectorstore, index_dir, {"settings": settings, "files": files})
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="directory of PDF, Markdown and text documents")
+    parser.add_argument("--index", default="local_index", help="FAISS index directory")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="SQLite embedding cache")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="maximum characters per chunk")
+    parser.add_argument("--overlap", type=int, default=100, help="characters shared by consecutive chunks")
+    parser.add_argument("--batch-size", type=int, default=32, help="texts per embedding batch")
+    parser.add_argument("--workers", type=int, default=4, help="maximum concurrent embedding calls")
+    parser.add_argument("--rebuild", action="store_true", help="build a new index instead of updating")
+    args = parser.parse_args()
+
+    stats = build_index(
+        args.source,
+        args.index,
+        cache_path=args.cache,
+        chunk_size=args.chunk_size,
+        overlap=args.overlap,
+        batch_size=args.batch_size,
+        max_workers=args.workers,
+        rebuild=args.rebuild,
+    )
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+
+
+def normalize_text(text):
+    """
+    Collapses whitespace, so texts that differ only in spacing share one embedding.
+
+    Args:
+        text (str): The text to embed.
+
+    Returns:
+        str: The normalized text, which is also the text sent to the model.
+    """
+    return " ".join(text.split())
+
+
+def text_hash(text, model_id, kind="document"):
+    """
+    Hashes a normalized text together with the embedding model that embeds it.
+
+    Args:
+        text (str): The embedded text.
+        model_id (str): The embedding model ID, so that switching models never reuses stale vectors.
+        kind (str): 'document' or 'query'. Asymmetric models embed the same text differently
+            as a query, so queries get keys of their own. Document keys leave the kind out,
+            so the vectors of existing caches stay valid.
+
+    Returns:
+        str: The SHA-256 hex digest.
+    """
+    prefix = model_id if kind == "document" else f"{model_id}\n{kind}"
+    return hashlib.sha256(f"{prefix}\n{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent cache of embedding vectors in a SQLite file, keyed by text hash.
+
+    Vectors are stored as float32 blobs. The cache can be shared by threads;
+    SQLite serializes the writes.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): The SQLite file, created if it does not exist.
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (hash TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._conn.commit()
+
+    def get_many(self, hashes):
+        """
+        Looks up the vectors of several texts.
+
+        Args:
+            hashes (list): Text hashes from text_hash.
+
+        Returns:
+            dict: Hash to vector, for the hashes that are cached.
+        """
+        found = {}
+        hashes = list(hashes)
+        with self._lock:
+            # SQLite limits the number of bound parameters per statement
+            for i in range(0, len(hashes), 500):
+                batch = hashes[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE hash IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+        return found
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items):
+        """
+        Stores vectors.
+
+        Args:
+            items (dict): Hash to vector.
+        """
+        rows = [(key, array("f", vector).tobytes()) for key, vector in items.items()]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (hash, vector) VALUES (?, ?)", rows)
+            self._conn.commit()
+
+    def put(self, key, vector):
+        self.put_many({key: vector})
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper with an in-memory LRU in front of a persistent EmbeddingCache.
+
+    Lookups go to memory first, then to SQLite, and only then to the wrapped
+    embeddings. The same cache file can be shared by the query path and the
+    index builder. Queries and documents are embedded by the matching method of
+    the wrapped embeddings and cached under separate keys, since asymmetric models
+    embed them differently. Hits are credited with the average latency of an
+    embedding call as saved time.
+    """
+
+    def __init__(self, embeddings, model_id, store=None, max_entries=1024, default_embed_seconds=0.1):
+        """
+        Args:
+            embeddings: The wrapped langchain embeddings, e.g. BedrockEmbeddings.
+            model_id (str): The embedding model ID, part of every cache key.
+            store (EmbeddingCache): Optional persistent tier.
+            max_entries (int): Maximum vectors kept in memory before the least recently used is evicted.
+            default_embed_seconds (float): Latency credited per hit until an embedding call has been timed.
+        """
+        self.embeddings = embeddings
+        self.model_id = model_id
+        self.store = store
+        self.max_entries = max_entries
+        self.default_embed_seconds = default_embed_seconds
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "embed_seconds": 0.0, "saved_seconds": 0.0}
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _average_embed_seconds(self):
+        misses = self._stats["misses"]
+        return self._stats["embed_seconds"] / misses if misses else self.default_embed_seconds
+
+    def lookup(self, keys):
+        """
+        Looks up several cache keys in memory and then, in one query, on disk.
+
+        Args:
+            keys (list): Keys from text_hash.
+
+        Returns:
+            dict: Key to vector, for the keys that are cached.
+        """
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+            memory_hits = len(found)
+        missing = [key for key in keys if key not in found]
+        disk = self.store.get_many(missing) if self.store is not None and missing else {}
+        found.update(disk)
+        with self._lock:
+            for key, vector in disk.items():
+                self._remember(key, vector)
+            self._stats["memory_hits"] += memory_hits
+            self._stats["disk_hits"] += len(disk)
+            self._stats["saved_seconds"] += (memory_hits + len(disk)) * self._average_embed_seconds()
+        return found
+
+    def embed_documents(self, texts):
+        """
+        Embeds texts, calling the wrapped embeddings only for texts that are not cached.
+
+        Args:
+            texts (list): The texts to embed.
+
+        Returns:
+            list: The vectors, in the order of texts.
+        """
+        return self._embed(texts, "document", self.embeddings.embed_documents)
+
+    def embed_query(self, text):
+        return self._embed([text], "query", lambda texts: [self.embeddings.embed_query(texts[0])])[0]
+
+    def _embed(self, texts, kind, embed_fn):
+        texts = [normalize_text(text) for text in texts]
+        keys = [text_hash(text, self.model_id, kind) for text in texts]
+        vectors = self.lookup(list(OrderedDict.fromkeys(keys)))
+        missing = OrderedDict((key, text) for key, text in zip(keys, texts) if key not in vectors)
+        if missing:
+            start = time.perf_counter()
+            embedded = dict(zip(missing, embed_fn(list(missing.values()))))
+            seconds = time.perf_counter() - start
+            if self.store is not None:
+                self.store.put_many(embedded)
+            vectors.update(embedded)
+            with self._lock:
+                for key, vector in embedded.items():
+                    self._remember(key, vector)
+                self._stats["misses"] += len(embedded)
+                self._stats["embed_seconds"] += seconds
+        return [vectors[key] for key in keys]
+
+    def stats(self):
+        """
+        Returns hit and miss counters for the cache.
+
+        Returns:
+            dict: Memory and disk hits, misses, hit rate, seconds spent embedding misses
+            and the estimated embedding seconds saved by hits.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["hits"] = hits
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        return stats
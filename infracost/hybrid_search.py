@@ -0,0 +1,211 @@
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+
+# AWS names such as "RDS Proxy" or "S3" keep their digits; everything is matched lower-cased
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Words that appear in nearly every passage add posting-list work without helping the ranking
+STOPWORDS = frozenset(
+    "a an and are as at be by can do for from how i in is it of on or should that the this to use what when "
+    "which with you your".split()
+)
+
+
+def tokenize(text):
+    """
+    Splits text into lower-cased lexical terms, without stopwords.
+
+    Args:
+        text (str): The text to split.
+
+    Returns:
+        list: The terms in order.
+    """
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    In-memory inverted index scored with Okapi BM25.
+
+    Documents are addressed by their position in the list the index was built
+    from, which for `HybridIndex` is the FAISS vector position.
+    """
+
+    def __init__(self, texts, k1=1.2, b=0.75):
+        """
+        Args:
+            texts (list): The document texts.
+            k1 (float): Term frequency saturation.
+            b (float): Document length normalization.
+        """
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)
+        self.doc_lengths = []
+        for doc_id, text in enumerate(texts):
+            terms = tokenize(text)
+            self.doc_lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                self.postings[term].append((doc_id, tf))
+        self.avg_length = sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 0.0
+        n = len(self.doc_lengths)
+        self.idf = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5)) for term, docs in self.postings.items()
+        }
+
+    def search(self, query, k=10):
+        """
+        Scores the documents containing any of the query terms.
+
+        Args:
+            query (str): The query text.
+            k (int): Number of results.
+
+        Returns:
+            list: (document position, score) pairs, best first.
+        """
+        scores = defaultdict(float)
+        k1, b, avg_length = self.k1, self.b, self.avg_length or 1.0
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, tf in self.postings[term]:
+                norm = k1 * (1 - b + b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] += idf * tf * (k1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+def reciprocal_rank_fusion(rankings, k=60, weights=None):
+    """
+    Fuses ranked lists with reciprocal rank fusion.
+
+    Args:
+        rankings (list): Ranked lists of document positions, best first.
+        k (int): Rank offset, larger values flatten the contribution of the top ranks.
+        weights (list): Optional weight per ranking.
+
+    Returns:
+        list: (document position, fused score) pairs, best first.
+    """
+    weights = weights or [1.0] * len(rankings)
+    scores = defaultdict(float)
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += weight / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+def maximal_marginal_relevance(candidates, vectors, k, lambda_mult=0.5):
+    """
+    Reorders candidates to balance relevance against redundancy (MMR).
+
+    Relevance is the candidate's position in the fused ranking, scaled to [0, 1],
+    so that lexical-only hits are not penalized for a weak embedding match;
+    redundancy is the highest cosine similarity to an already selected vector.
+
+    Args:
+        candidates (list): Document positions in fused rank order.
+        vectors (dict): Document position to embedding vector, a list or numpy array.
+        k (int): Number of documents to select.
+        lambda_mult (float): 1.0 ranks by relevance only, 0.0 by diversity only.
+
+    Returns:
+        list: The selected document positions.
+    """
+    import numpy as np
+
+    if not candidates:
+        return []
+    n = len(candidates)
+    relevance = 1.0 - np.arange(n) / n
+    # Unit rows, so one matrix-vector product gives the cosine similarity to a selected
+    # document; candidates without a vector keep a zero row and never look redundant
+    with_vector = [i for i, doc_id in enumerate(candidates) if doc_id in vectors]
+    if not with_vector:
+        return list(candidates[:k])
+    rows = np.array([vectors[candidates[i]] for i in with_vector], dtype=np.float32)
+    norms = np.linalg.norm(rows, axis=1, keepdims=True)
+    matrix = np.zeros((n, rows.shape[1]), dtype=np.float32)
+    matrix[with_vector] = np.divide(rows, norms, out=np.zeros_like(rows), where=norms > 0)
+
+    # Highest similarity of each candidate to the selected ones, updated as they are picked
+    redundancy = np.zeros(n)
+    available = np.ones(n, dtype=bool)
+    selected = []
+    while len(selected) < min(k, n):
+        scores = np.where(available, lambda_mult * relevance - (1 - lambda_mult) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(candidates[best])
+        available[best] = False
+        redundancy = np.maximum(redundancy, matrix @ matrix[best])
+    return selected
+
+
+class HybridIndex:
+    """
+    A FAISS vector store with a BM25 index over the same documents.
+
+    The lexical index is built from the FAISS docstore when the index is
+    loaded, so it always matches the vectors and needs no extra files.
+    Attribute access falls through to the vector store, so existing callers
+    of `similarity_search` keep working.
+    """
+
+    def __init__(self, vectorstore):
+        """
+        Args:
+            vectorstore: A langchain FAISS vector store.
+        """
+        self.vectorstore = vectorstore
+        self.documents = [
+            vectorstore.docstore.search(docstore_id)
+            for _, docstore_id in sorted(vectorstore.index_to_docstore_id.items())
+        ]
+        self.lexical = BM25Index([doc.page_content for doc in self.documents])
+
+    def __getattr__(self, name):
+        return getattr(self.vectorstore, name)
+
+    def search(self, query, k=4, mode="hybrid", fetch_k=20, rrf_k=60, mmr_lambda=0.5):
+        """
+        Retrieves documents for a query.
+
+        Args:
+            query (str): The query text.
+            k (int): Number of documents to return.
+            mode (str): 'hybrid' fuses vector and BM25 rankings, 'vector' or 'lexical' use one of them.
+            fetch_k (int): Candidates taken from each ranking before fusion and MMR.
+            rrf_k (int): Rank offset of reciprocal rank fusion.
+            mmr_lambda (float): Relevance/diversity trade-off of the MMR pass, or None to skip it.
+
+        Returns:
+            list: The documents, best first.
+        """
+        if mode not in ("hybrid", "vector", "lexical"):
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        fetch_k = max(fetch_k, k)
+        rankings = []
+        query_vector = None
+        if mode in ("hybrid", "vector"):
+            embed = self.vectorstore.embedding_function
+            query_vector = embed.embed_query(query) if hasattr(embed, "embed_query") else embed(query)
+            distances, positions = self.vectorstore.index.search(_as_matrix(query_vector), fetch_k)
+            rankings.append([int(p) for p in positions[0] if p >= 0])
+        if mode in ("hybrid", "lexical"):
+            rankings.append([doc_id for doc_id, _ in self.lexical.search(query, fetch_k)])
+
+        candidates = [doc_id for doc_id, _ in reciprocal_rank_fusion(rankings, k=rrf_k)]
+        if mmr_lambda is not None and query_vector is not None and len(candidates) > k:
+            vectors = {doc_id: self.vectorstore.index.reconstruct(doc_id) for doc_id in candidates}
+            candidates = maximal_marginal_relevance(candidates, vectors, k, mmr_lambda)
+        return [self.documents[doc_id] for doc_id in candidates[:k]]
+
+
+def _as_matrix(vector):
+    import numpy as np
+
+    return np.array([vector], dtype=np.float32)
@@ -1,11 +1,17 @@
+import deadline
 import tools
+import tracing
 
 
 def handler(event, context):
-    # Print the received event to the logs
-    print("Received event: ")
-    print(event)
+    # Every invocation emits per-stage metrics; sampled invocations also log their spans
+    with tracing.trace(event.get("apiPath"), session_id=event.get("sessionId")):
+        # Stages run against the remaining Lambda time, less a reserve to return the response
+        with deadline.scope_from_context(context):
+            return handle_event(event, context)
 
+
+def handle_event(event, context):
     # Initialize response code to None
     response_code = None
 
@@ -16,33 +22,41 @@ def handler(event, context):
     inputText = event["inputText"]
     httpMethod = event["httpMethod"]
 
-    print(f"inputText: {inputText}")
-
     # Get the query value from the parameters
     query = parameters[0]["value"]
-    print(f"Query: {query}")
 
-    # Check the api path to determine which tool function to call
-    if api_path == "/query_well_arch_framework":
-        # Call the aws_well_arch_tool from the tools module with the query
-        body = tools.aws_well_arch_tool(query)
-        # Create a response body with the result
-        response_body = {"application/json": {"body": str(body)}}
-        response_code = 200
-    elif api_path == "/gen_code":
-        # Call the code_gen_tool from the tools module with the query
-        body = tools.code_gen_tool(query)
-        # Create a response body with the result
+    # Log the request without its content unless TRACE_REDACT=false
+    tracing.log("Received event", action_group=action, http_method=httpMethod,
+                payload={"input_text": inputText, "query": query})
+
+    try:
+        # Check the api path to determine which tool function to call
+        if api_path == "/query_well_arch_framework":
+            # Call the aws_well_arch_tool from the tools module with the query
+            body = tools.aws_well_arch_tool(query)
+            # Create a response body with the result
+            response_body = {"application/json": {"body": str(body)}}
+            response_code = 200
+        elif api_path == "/gen_code":
+            # Call the code_gen_tool from the tools module with the query
+            body = tools.code_gen_tool(query)
+            # Create a response body with the result
+            response_body = {"application/json": {"body": str(body)}}
+            response_code = 200
+        else:
+            # If the api path is not recognized, return an error message
+            body = {"{}::{} is not a valid api, try another one.".format(action, api_path)}
+            response_code = 400
+            response_body = {"application/json": {"body": str(body)}}
+    except TimeoutError as e:
+        # Out of time: answer with what was generated so far rather than letting Lambda kill the invocation
+        tracing.log("Deadline exceeded", stage=getattr(e, "stage", None), partial_chars=len(getattr(e, "partial", "")))
+        body = deadline.partial_answer(e)
         response_body = {"application/json": {"body": str(body)}}
         response_code = 200
-    else:
-        # If the api path is not recognized, return an error message
-        body = {"{}::{} is not a valid api, try another one.".format(action, api_path)}
-        response_code = 400
-        response_body = {"application/json": {"body": str(body)}}
 
-    # Print the response body to the logs
-    print(f"Response body: {response_body}")
+    # Log the response size, not the generated content
+    tracing.log("Response", status=response_code, payload={"body": body})
 
     # Create a dictionary containing the response details
     action_response = {
@@ -0,0 +1,232 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import tracing
+
+# Files written by FAISS.save_local; a change to any of them means a new index
+INDEX_FILES = ("index.faiss", "index.pkl")
+
+# Written by build_index after the index files, with the hash of each of them
+MANIFEST_NAME = "build_manifest.json"
+
+# Attempts of the first load while build_index is replacing the index files
+FIRST_LOAD_ATTEMPTS = 50
+FIRST_LOAD_RETRY_SECONDS = 0.1
+
+
+def index_signature(path):
+    """
+    Returns a cheap fingerprint of an on-disk index.
+
+    Args:
+        path (str): The index directory.
+
+    Returns:
+        tuple: (file name, inode, mtime_ns, size) for each index file that exists.
+    """
+    signature = []
+    for name in INDEX_FILES:
+        file_path = os.path.join(path, name)
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            continue
+        signature.append((name, stat.st_ino, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def index_file_hashes(path):
+    """
+    Returns the SHA-256 of each index file that exists.
+
+    Args:
+        path (str): The index directory.
+
+    Returns:
+        dict: The hex digest per file name.
+    """
+    hashes = {}
+    for name in INDEX_FILES:
+        digest = hashlib.sha256()
+        try:
+            with open(os.path.join(path, name), "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+        except FileNotFoundError:
+            continue
+        hashes[name] = digest.hexdigest()
+    return hashes
+
+
+def index_matches_manifest(path):
+    """
+    Tells whether the index files all belong to the build recorded in the build manifest.
+
+    build_index replaces the index files one rename at a time and writes the manifest
+    last, so while it runs the files can mix two builds: a new FAISS index with the old
+    docstore maps vector IDs to the wrong documents.
+
+    Args:
+        path (str): The index directory.
+
+    Returns:
+        bool: False if the files do not match the manifest. True if they do, or if the
+        index has no manifest with file hashes, e.g. because it was not built by build_index.
+    """
+    try:
+        with open(os.path.join(path, MANIFEST_NAME), "r") as f:
+            expected = json.load(f).get("index_files")
+    except (FileNotFoundError, ValueError):
+        return True
+    return not expected or index_file_hashes(path) == expected
+
+
+def index_memory_bytes(vectorstore, path):
+    """
+    Estimates the memory footprint of a loaded index.
+
+    Args:
+        vectorstore: The loaded vector store.
+        path (str): The index directory.
+
+    Returns:
+        int: The size of the FAISS vectors (float32) when available, otherwise the size on disk.
+    """
+    index = getattr(vectorstore, "index", None)
+    if index is not None and hasattr(index, "ntotal") and hasattr(index, "d"):
+        docstore_bytes = 0
+        pkl_path = os.path.join(path, "index.pkl")
+        if os.path.exists(pkl_path):
+            docstore_bytes = os.path.getsize(pkl_path)
+        return index.ntotal * index.d * 4 + docstore_bytes
+    return sum(size for *_, size in index_signature(path))
+
+
+class IndexRegistry:
+    """
+    Process-wide registry of loaded vector indexes.
+
+    Each index is loaded once and shared by every invocation in the process.
+    When the files on disk change, the next `get` reloads the index while other
+    callers keep using the previous one, then swaps the reference atomically.
+    A load is only kept if the files match their build manifest and did not change
+    while they were read; otherwise the previous index stays until the next check.
+    """
+
+    def __init__(self, loader, check_interval=5.0):
+        """
+        Args:
+            loader (callable): Function that loads and returns the index stored at a path.
+            check_interval (float): Minimum seconds between checks of the files on disk.
+        """
+        self.loader = loader
+        self.check_interval = check_interval
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _load(self, path):
+        # Returns None if the files are being replaced by a build
+        signature = index_signature(path)
+        if not index_matches_manifest(path):
+            return None
+        start = time.perf_counter()
+        vectorstore = self.loader(path)
+        load_seconds = time.perf_counter() - start
+        if index_signature(path) != signature:
+            return None
+        entry = {
+            "vectorstore": vectorstore,
+            "signature": signature,
+            "checked": time.monotonic(),
+            "loaded_at": time.time(),
+            "load_seconds": load_seconds,
+            "memory_bytes": index_memory_bytes(vectorstore, path),
+            "loads": 1,
+            "reloading": False,
+        }
+        tracing.log("Loaded index", path=path, load_seconds=load_seconds, memory_bytes=entry["memory_bytes"])
+        return entry
+
+    def get(self, path):
+        """
+        Returns the loaded index for a path, loading or hot-swapping it if needed.
+
+        Args:
+            path (str): The index directory.
+
+        Returns:
+            The loaded vector store.
+        """
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None:
+                # The first load blocks other callers, there is nothing to serve yet
+                for _ in range(FIRST_LOAD_ATTEMPTS):
+                    entry = self._load(path)
+                    if entry is not None:
+                        break
+                    time.sleep(FIRST_LOAD_RETRY_SECONDS)
+                else:
+                    raise RuntimeError(f"Index {path} does not match its build manifest")
+                self._entries[path] = entry
+                return entry["vectorstore"]
+            now = time.monotonic()
+            if entry["reloading"] or now - entry["checked"] < self.check_interval:
+                return entry["vectorstore"]
+            entry["checked"] = now
+            signature = index_signature(path)
+            if signature == entry["signature"]:
+                return entry["vectorstore"]
+            entry["reloading"] = True
+
+        # Reload outside the lock so in-flight requests keep using the old index
+        try:
+            new_entry = self._load(path)
+        except Exception as e:
+            tracing.log("Reloading index failed, keeping the previous one", path=path, error=type(e).__name__,
+                        detail=str(e)[-500:])
+            with self._lock:
+                entry["reloading"] = False
+            return entry["vectorstore"]
+        if new_entry is None:
+            # A build is replacing the files; the next check tries again
+            tracing.log("Index is being replaced, keeping the previous one", path=path)
+            with self._lock:
+                entry["reloading"] = False
+            return entry["vectorstore"]
+        new_entry["loads"] = entry["loads"] + 1
+        with self._lock:
+            self._entries[path] = new_entry
+        return new_entry["vectorstore"]
+
+    def evict(self, path):
+        """
+        Drops a loaded index so the next `get` loads it again.
+
+        Args:
+            path (str): The index directory.
+        """
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def stats(self):
+        """
+        Returns load statistics for every registered index.
+
+        Returns:
+            dict: Per path, the load time in seconds, estimated memory in bytes,
+            number of loads and the wall-clock time of the last load.
+        """
+        with self._lock:
+            return {
+                path: {
+                    "load_seconds": entry["load_seconds"],
+                    "memory_bytes": entry["memory_bytes"],
+                    "loads": entry["loads"],
+                    "loaded_at": entry["loaded_at"],
+                }
+                for path, entry in self._entries.items()
+            }
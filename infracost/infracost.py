@@ -1,59 +1,76 @@
+import json
 import os
-import subprocess
 import boto3
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from infracost_projects import prepare_projects, render_table, run_projects
+from s3_sync import sync_prefix
+import tracing
+
+# Number of parallel downloads when syncing the Terraform code from S3
+SYNC_WORKERS = int(os.environ.get("SYNC_WORKERS", "16"))
+
+# Reused across warm invocations, with a connection per download worker
+s3 = None
+
+def get_s3_client():
+    global s3
+    if s3 is None:
+        s3 = boto3.client('s3', config=Config(max_pool_connections=SYNC_WORKERS))
+    return s3
+
 def lambda_handler(event, context):
-    # Download file from S3
-    s3 = boto3.client('s3')
+    # Sync files from S3; unchanged files already in /tmp on a warm container are kept
+    s3 = get_s3_client()
     bucket_name = 'vedmich-2024-04-16'
     evaluate_folder_name = 'iac-code'
     local_dir = '/tmp/infracost-evaluate'
+    projects_dir = '/tmp/infracost-projects'
+    work_dir = '/tmp/infracost-run'
     # iac-cost
-    # Create the local directory if it doesn't exist
-    os.makedirs(local_dir, exist_ok=True)
-    
-    
-    ## get latest created file - last modied. 
-    
-    # List objects in the S3 folder
-    objects = s3.list_objects_v2(Bucket=bucket_name, Prefix=evaluate_folder_name)
-    
-    # Download each file in the folder
-    for obj in objects['Contents']:
-        file_key = obj['Key']
-        if not file_key.endswith('/'):  # Skip folders
-            local_file_path = os.path.join(local_dir, os.path.basename(file_key))
-            s3.download_file(bucket_name, file_key, local_file_path)
-
-
-    # Run Infracost CLI command
-    infracost_cmd = f"infracost breakdown --path /tmp/infracost-evaluate > /tmp/result.txt"
-    try:
-        subprocess.run(infracost_cmd, shell=True, check=True)
-    except subprocess.CalledProcessError as e:
-        # Read the result file even if the command returns a non-zero exit code
-        with open('/tmp/result.txt', 'r') as f:
-            result = f.read()
-        print(f"Infracost command returned non-zero exit code: {e.returncode}")
-        print(f"Result: {result}")
-    else:
-        with open('/tmp/result.txt', 'r') as f:
-            result = f.read()
-        print(f"Result: {result}")
+    sync_prefix(s3, bucket_name, evaluate_folder_name, local_dir, max_workers=SYNC_WORKERS)
+
+
+    # Each generated stack gets its own project, and one Infracost run prices them all in parallel
+    projects = prepare_projects(local_dir, projects_dir)
+    if not projects:
+        return {
+            'statusCode': 200,
+            'body': 'No Terraform files to estimate'
+        }
+    breakdown, per_project, breakdown_path = run_projects(projects, work_dir)
+    result = render_table(breakdown_path)
+    tracing.log("Infracost result", payload={"result": result})
 
     # Generate timestamp-based file name
     timestamp = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
     result_file_name = f"cost-evaluation-{timestamp}.txt"
     
-    # Upload result file to S3 under the "cost-result" folder
+    # Upload the table, and the JSON breakdown of every stack, under the "cost-result" folder
     result_bucket = 'vedmich-2024-04-16'
     result_folder = 'cost-result'
     s3_result_key = os.path.join(result_folder, result_file_name)
-    s3.upload_file('/tmp/result.txt', result_bucket, s3_result_key)
-
+    with ThreadPoolExecutor(max_workers=SYNC_WORKERS) as executor:
+        uploads = [executor.submit(
+            s3.put_object, Bucket=result_bucket, Key=s3_result_key,
+            Body=result.encode('utf-8'), ContentType="text/plain",
+        )]
+        for name, project_breakdown in per_project.items():
+            uploads.append(executor.submit(
+                s3.put_object, Bucket=result_bucket, Key=f"{result_folder}/{timestamp}/{name}.json",
+                Body=json.dumps(project_breakdown).encode('utf-8'), ContentType="application/json",
+            ))
+        for upload in uploads:
+            upload.result()
 
+    totals = {name: project_breakdown["totalMonthlyCost"] for name, project_breakdown in per_project.items()}
     return {
         'statusCode': 200,
-        'body': 'Infracost result uploaded to S3'
+        'body': json.dumps({
+            'message': 'Infracost result uploaded to S3',
+            'projects': totals,
+            'totalMonthlyCost': breakdown.get('totalMonthlyCost'),
+        })
     }
\ No newline at end of file
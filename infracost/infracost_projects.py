@@ -0,0 +1,162 @@
+import json
+import os
+import shutil
+import subprocess
+
+import tracing
+
+# Projects Infracost evaluates at the same time, one per core by default
+INFRACOST_PARALLELISM = int(os.environ.get("INFRACOST_PARALLELISM", str(os.cpu_count() or 1)))
+
+
+def project_name(file_name):
+    # 'iac_20240416_120000_ab12cd34.tf' -> 'iac_20240416_120000_ab12cd34'
+    return os.path.splitext(os.path.basename(file_name))[0]
+
+
+def prepare_projects(source_dir, projects_dir):
+    """
+    Gives every Terraform file of a directory its own Infracost project directory.
+
+    Files are hard-linked where possible, so preparing the projects copies no data.
+    Project directories of files that no longer exist are removed.
+
+    Args:
+        source_dir (str): Directory with one generated Terraform file per stack.
+        projects_dir (str): Directory to create the project directories in.
+
+    Returns:
+        dict: The project directory per project name, sorted by name.
+    """
+    os.makedirs(projects_dir, exist_ok=True)
+    projects = {}
+    for file_name in sorted(os.listdir(source_dir)):
+        if not file_name.endswith(".tf"):
+            continue
+        name = project_name(file_name)
+        project_dir = os.path.join(projects_dir, name)
+        os.makedirs(project_dir, exist_ok=True)
+        source = os.path.join(source_dir, file_name)
+        target = os.path.join(project_dir, "main.tf")
+        if os.path.exists(target):
+            os.remove(target)
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+        projects[name] = project_dir
+
+    for name in os.listdir(projects_dir):
+        path = os.path.join(projects_dir, name)
+        if name not in projects and os.path.isdir(path):
+            shutil.rmtree(path)
+    return projects
+
+
+def write_config(projects, path):
+    """
+    Writes an Infracost config file that evaluates every project in one run.
+
+    Args:
+        projects (dict): The project directory per project name.
+        path (str): Path of the config file.
+    """
+    # JSON strings are valid YAML scalars, so names and paths need no further escaping
+    lines = ["version: 0.1", "projects:"]
+    for name, project_dir in projects.items():
+        lines.append(f"  - path: {json.dumps(project_dir)}")
+        lines.append(f"    name: {json.dumps(name)}")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def split_projects(breakdown, projects):
+    """
+    Splits a multi-project Infracost JSON breakdown into one breakdown per project.
+
+    Args:
+        breakdown (dict): The parsed output of `infracost breakdown --config-file ... --format json`.
+        projects (dict): The project directory per project name.
+
+    Returns:
+        dict: A single-project breakdown, in the same layout, per project name.
+    """
+    names_by_path = {os.path.normpath(project_dir): name for name, project_dir in projects.items()}
+    results = {}
+    for project in breakdown.get("projects") or []:
+        name = project.get("name")
+        if name not in projects:
+            name = names_by_path.get(os.path.normpath((project.get("metadata") or {}).get("path", "")), name)
+        results[name] = {
+            "currency": breakdown.get("currency", "USD"),
+            "projects": [project],
+            "totalMonthlyCost": (project.get("breakdown") or {}).get("totalMonthlyCost"),
+        }
+    return results
+
+
+def run_projects(projects, work_dir, parallelism=None, timeout=None):
+    """
+    Estimates several Terraform projects with a single `infracost breakdown` run.
+
+    Infracost is called directly, without a shell, and evaluates up to `parallelism`
+    projects at the same time.
+
+    Args:
+        projects (dict): The project directory per project name, e.g. from prepare_projects.
+        work_dir (str): Directory for the config file and the combined JSON output.
+        parallelism (int): Projects evaluated at the same time, defaults to INFRACOST_PARALLELISM.
+        timeout (float): Seconds the run may take, or None.
+
+    Returns:
+        tuple: The combined breakdown, the breakdown per project name, and the path of the combined JSON file.
+
+    Raises:
+        RuntimeError: If Infracost did not return JSON.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    config_path = os.path.join(work_dir, "infracost.yml")
+    output_path = os.path.join(work_dir, "breakdown.json")
+    write_config(projects, config_path)
+    env = dict(os.environ, INFRACOST_PARALLELISM=str(parallelism or INFRACOST_PARALLELISM))
+    completed = subprocess.run(
+        ["infracost", "breakdown", "--config-file", config_path, "--format", "json", "--no-color"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        env=env,
+        timeout=timeout,
+    )
+    if completed.returncode != 0:
+        tracing.log("Infracost command failed", returncode=completed.returncode,
+                    payload={"stderr": completed.stderr[-2000:]})
+    try:
+        breakdown = json.loads(completed.stdout)
+    except ValueError:
+        raise RuntimeError(f"Infracost did not return JSON: {completed.stderr.strip()}")
+    with open(output_path, "w") as f:
+        f.write(completed.stdout)
+    return breakdown, split_projects(breakdown, projects), output_path
+
+
+def render_table(breakdown_path, timeout=None):
+    """
+    Renders an Infracost JSON breakdown as the usual table, without pricing anything again.
+
+    Args:
+        breakdown_path (str): Path of the JSON breakdown.
+        timeout (float): Seconds the command may take, or None.
+
+    Returns:
+        str: The table.
+    """
+    completed = subprocess.run(
+        ["infracost", "output", "--path", breakdown_path, "--format", "table", "--no-color"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        timeout=timeout,
+    )
+    if completed.returncode != 0:
+        tracing.log("Infracost output failed", returncode=completed.returncode)
+    return completed.stdout or completed.stderr
@@ -0,0 +1,130 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+
+
+def manifest_path_for(local_dir):
+    # Kept next to the directory, not inside it, so Infracost never sees it
+    return os.path.normpath(local_dir) + ".manifest.json"
+
+
+def load_manifest(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_manifest(path, manifest):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+
+def list_objects(s3, bucket, prefix):
+    """
+    Lists every object under a prefix, following pagination.
+
+    Args:
+        s3: The S3 client.
+        bucket (str): The bucket name.
+        prefix (str): The key prefix.
+
+    Returns:
+        list: The listed objects, without folder placeholders.
+    """
+    objects = []
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            if not obj["Key"].endswith("/"):  # Skip folders
+                objects.append(obj)
+    return objects
+
+
+def download(s3, bucket, key, local_file_path):
+    # Download to a temporary name first so a failed download never leaves a truncated file
+    tmp_path = local_file_path + ".part"
+    s3.download_file(bucket, key, tmp_path)
+    os.replace(tmp_path, local_file_path)
+
+
+def sync_prefix(s3, bucket, prefix, local_dir, max_workers=8):
+    """
+    Mirrors an S3 prefix into a local directory.
+
+    Objects whose ETag and size match the local manifest, and whose local copy
+    still exists, are skipped. Changed and new objects are downloaded with
+    bounded concurrency, and local files that are no longer in S3 are removed.
+    Like the original handler, objects are stored flat by their base name.
+
+    Args:
+        s3: The S3 client. Its connection pool should allow `max_workers` connections.
+        bucket (str): The bucket name.
+        prefix (str): The key prefix to mirror.
+        local_dir (str): The local directory.
+        max_workers (int): Maximum number of concurrent downloads.
+
+    Returns:
+        dict: Number of downloaded, skipped and removed files, downloaded bytes and elapsed seconds.
+    """
+    start = time.perf_counter()
+    os.makedirs(local_dir, exist_ok=True)
+    manifest_path = manifest_path_for(local_dir)
+    manifest = load_manifest(manifest_path)
+
+    wanted = {}
+    for obj in list_objects(s3, bucket, prefix):
+        wanted[os.path.basename(obj["Key"])] = obj
+
+    to_download = []
+    skipped = 0
+    for name, obj in wanted.items():
+        entry = manifest.get(name)
+        local_file_path = os.path.join(local_dir, name)
+        if (
+            entry is not None
+            and entry["key"] == obj["Key"]
+            and entry["etag"] == obj["ETag"]
+            and entry["size"] == obj["Size"]
+            and os.path.exists(local_file_path)
+            and os.path.getsize(local_file_path) == obj["Size"]
+        ):
+            skipped += 1
+        else:
+            to_download.append((name, obj))
+
+    removed = 0
+    for name in os.listdir(local_dir):
+        if name not in wanted:
+            os.remove(os.path.join(local_dir, name))
+            removed += 1
+    new_manifest = {name: entry for name, entry in manifest.items() if name in wanted}
+
+    def fetch(item):
+        name, obj = item
+        download(s3, bucket, obj["Key"], os.path.join(local_dir, name))
+        return name, obj
+
+    downloaded_bytes = 0
+    if to_download:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for name, obj in executor.map(fetch, to_download):
+                new_manifest[name] = {"key": obj["Key"], "etag": obj["ETag"], "size": obj["Size"]}
+                downloaded_bytes += obj["Size"]
+    save_manifest(manifest_path, new_manifest)
+
+    stats = {
+        "downloaded": len(to_download),
+        "skipped": skipped,
+        "removed": removed,
+        "bytes": downloaded_bytes,
+        "seconds": time.perf_counter() - start,
+    }
+    tracing.log("Synced prefix", bucket=bucket, prefix=prefix, local_dir=local_dir, **stats)
+    return stats
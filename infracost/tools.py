@@ -1,112 +1,111 @@
 import json
-
-import boto3
-from langchain_community.embeddings import BedrockEmbeddings
-from langchain_community.vectorstores import FAISS
-
-
-
-bedrock_runtime = boto3.client(
-    service_name="bedrock-runtime",
-    region_name="us-west-2",
-)
-
-def call_claude_sonnet(prompt):
-
-    prompt_config = {
-        "anthropic_version": "bedrock-2023-05-31",
-        "max_tokens": 4096,
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                ],
-            }
-        ],
-    }
-
-    body = json.dumps(prompt_config)
-
-    modelId = "anthropic.claude-3-sonnet-20240229-v1:0"
-    accept = "application/json"
-    contentType = "application/json"
-
-    response = bedrock_runtime.invoke_model(
-        body=body, modelId=modelId, accept=accept, contentType=contentType
-    )
-    response_body = json.loads(response.get("body").read())
-
-    results = response_body.get("content")[0].get("text")
-    return results
-
-def claude_prompt_format(prompt: str) -> str:
-    # Add headers to start and end of prompt
-    return "\n\nHuman: " + prompt + "\n\nAssistant:"
-
-def call_claude(prompt):
-    prompt_config = {
-        "prompt": claude_prompt_format(prompt),
-        "max_tokens_to_sample": 4096,
-        "temperature": 0.7,
-        "top_k": 250,
-        "top_p": 0.5,
-        "stop_sequences": [],
-    }
-
-    body = json.dumps(prompt_config)
-
-    modelId = "anthropic.claude-v2"
-    accept = "application/json"
-    contentType = "application/json"
-
-    response = bedrock_runtime.invoke_model(
-        body=body, modelId=modelId, accept=accept, contentType=contentType
-    )
-    response_body = json.loads(response.get("body").read())
-
-    results = response_body.get("completion")
-    return results
-
-
-# Call Titan model
-def call_titan(prompt):
-    prompt_config = {
-        "inputText": prompt,
-        "textGenerationConfig": {
-            "maxTokenCount": 4096,
-            "stopSequences": [],
-            "temperature": 0.7,
-            "topP": 1,
-        },
-    }
-
-    body = json.dumps(prompt_config)
-
-    modelId = "amazon.titan-text-lite-v1"
-    accept = "application/json"
-    contentType = "application/json"
-
-    response = bedrock_runtime.invoke_model(
-        body=body, modelId=modelId, accept=accept, contentType=contentType
-    )
-    response_body = json.loads(response.get("body").read())
-
-    print(response_body)
-
-    results = response_body.get("results")[0].get("outputText")
-    return results
-
-
-def aws_well_arch_tool(query):
+import os
+
+# bedrock_client, deadline, tracing, cost_breakdown and model_router are shared with the
+# root handler; the build copies them next to this file, see "Shared Bedrock Client" in the README
+import bedrock_client
+import deadline
+import tracing
+from cost_breakdown import aggregate_breakdown, format_cost_summary
+from hybrid_search import HybridIndex
+from index_registry import IndexRegistry
+from model_router import ModelRouter
+
+# Defaults of aws_well_arch_tool retrieval, each can be overridden per call.
+# RETRIEVAL_MODE is 'hybrid' (BM25 + FAISS), 'vector' or 'lexical'; set
+# RETRIEVAL_MMR_LAMBDA to 'none' to skip the diversity pass.
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "hybrid")
+RETRIEVAL_K = int(os.environ.get("RETRIEVAL_K", "4"))
+RETRIEVAL_FETCH_K = int(os.environ.get("RETRIEVAL_FETCH_K", "20"))
+# Candidates fetched per retriever when the invocation is short on time
+RETRIEVAL_FETCH_K_LOW_TIME = int(os.environ.get("RETRIEVAL_FETCH_K_LOW_TIME", "8"))
+_mmr_lambda = os.environ.get("RETRIEVAL_MMR_LAMBDA", "0.5")
+RETRIEVAL_MMR_LAMBDA = None if _mmr_lambda.lower() == "none" else float(_mmr_lambda)
+
+# Query embeddings are cached in memory and in a SQLite file that survives warm
+# invocations; point it at the cache of build_index.py to share vectors with it.
+QUERY_EMBEDDING_CACHE_PATH = os.environ.get("QUERY_EMBEDDING_CACHE_PATH", "/tmp/embedding-cache.sqlite")
+QUERY_EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get("QUERY_EMBEDDING_CACHE_MAX_ENTRIES", "1024"))
+
+# Picks the model of each tool call, see MODEL_ROUTES; its stats() report latency and cost per tier
+model_router = ModelRouter()
+
+# Created with the first index load, see query_embedding_stats()
+query_embeddings = None
+
+
+class TracedEmbeddings:
+    # Records each call to the wrapped embeddings, i.e. each cache miss, as an 'embedding' span
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def embed_documents(self, texts):
+        with tracing.span("embedding", texts=len(texts)):
+            return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        with tracing.span("embedding", texts=1):
+            return self.embeddings.embed_query(text)
+
+
+def get_query_embeddings():
+    # One cached embeddings object per process, shared by every index load
+    global query_embeddings
+    if query_embeddings is None:
+        from embedding_cache import CachedEmbeddings, EmbeddingCache
+        from langchain_community.embeddings import BedrockEmbeddings
+
+        model_id = bedrock_client.TITAN_EMBED_MODEL_ID
+        query_embeddings = CachedEmbeddings(
+            TracedEmbeddings(BedrockEmbeddings(client=bedrock_client.get_client("bedrock-runtime"), model_id=model_id)),
+            model_id,
+            store=EmbeddingCache(QUERY_EMBEDDING_CACHE_PATH) if QUERY_EMBEDDING_CACHE_PATH else None,
+            max_entries=QUERY_EMBEDDING_CACHE_MAX_ENTRIES,
+        )
+    return query_embeddings
+
+
+def query_embedding_stats():
+    # Hits, misses and embedding seconds saved by the query embedding cache
+    return query_embeddings.stats() if query_embeddings is not None else {}
+
+
+def load_faiss_index(path):
+    # Loaded once per process by the index registry, together with its embeddings client.
+    # langchain and FAISS are imported here so /gen_code cold starts do not pay for them.
+    from langchain_community.vectorstores import FAISS
+
+    # The BM25 index is built from the same docstore, so it is swapped together with the vectors.
+    with tracing.span("index.load", path=path) as span:
+        index = HybridIndex(FAISS.load_local(path, get_query_embeddings(), allow_dangerous_deserialization=True))
+        span.set(documents=len(index.documents))
+    return index
+
+
+# Warm indexes shared across invocations; reloaded when the files on disk change
+index_registry = IndexRegistry(load_faiss_index)
+
+
+def aws_well_arch_tool(query, mode=None, k=None, mmr_lambda=RETRIEVAL_MMR_LAMBDA):
     """
     Use this tool for any AWS related question to help customers understand best practices on building on AWS. It will use the relevant context from the AWS Well-Architected Framework to answer the customer's query. The input is the customer's question. The tool returns an answer for the customer using the relevant context.
     """
 
-    # Find docs
-    embeddings = BedrockEmbeddings()
-    vectorstore = FAISS.load_local("local_index", embeddings, allow_dangerous_deserialization=True)
-    docs = vectorstore.similarity_search(query)
+    # Find docs: exact service names and acronyms come from BM25, paraphrases from FAISS
+    vectorstore = index_registry.get("local_index")
+    deadline.check("retrieval.search")
+    k = k or RETRIEVAL_K
+    fetch_k = deadline.scaled(RETRIEVAL_FETCH_K, max(k, RETRIEVAL_FETCH_K_LOW_TIME))
+    with tracing.span("retrieval.search", mode=mode or RETRIEVAL_MODE, fetch_k=fetch_k) as span:
+        docs = vectorstore.search(
+            query,
+            k=k,
+            mode=mode or RETRIEVAL_MODE,
+            fetch_k=fetch_k,
+            mmr_lambda=mmr_lambda,
+        )
+        span.set(documents=len(docs))
+    tracing.log("Query embedding cache", **query_embedding_stats())
     context = ""
 
     doc_sources_string = ""
@@ -121,8 +120,8 @@ def aws_well_arch_tool(query):
     Question: {query}
     Answer:"""
 
-    generated_text = call_claude_sonnet(prompt)
-    print(generated_text)
+    # A fast model answers first; unusable answers are escalated to the strong one
+    generated_text = model_router.generate("well_arch", prompt)
 
     resp_string = (
         generated_text
@@ -132,18 +131,37 @@ def aws_well_arch_tool(query):
     return resp_string
 
 
+def code_gen_tool_stream(prompt):
+    """
+    Streaming version of code_gen_tool. Yields the generated code in chunks as the model produces it.
+    """
+    prompt_ending = " Just return the code, do not provide an explanation."
+    return model_router.stream("code_gen", prompt + prompt_ending)
+
+
 def code_gen_tool(prompt):
     """
     Use this tool only when you need to generate code based on a customers's request. The input is the customer's question. The tool returns code that the customer can use.
     """
-    prompt_ending = " Just return the code, do not provide an explanation."
-    generated_text = call_claude_sonnet(prompt + prompt_ending)
+    generated_text = bedrock_client.collect_stream(code_gen_tool_stream(prompt))
     return generated_text
 
-def estimate_chost(prompt):
+def estimate_chost(prompt, narrative=False):
     """
     Use this tool only when you need to say how much will be cost infrastucture on AWS, split on areas based on type services provide. The tool returns price per AWS service, and total summ of the whole infrastucture.
     """
+    # Infracost JSON output (--format json) is aggregated in code, no model call needed
+    try:
+        breakdown = json.loads(prompt)
+    except ValueError:
+        breakdown = None
+    if isinstance(breakdown, dict) and "projects" in breakdown:
+        summary = format_cost_summary(aggregate_breakdown(breakdown))
+        if not narrative:
+            return summary
+        prompt = summary + "\n"
+
+    # Table output, or a narrative on top of the aggregated costs
     prompt_ending = "Above is an estimation on the cost of infrastructure in AWS cloud, analyze and give the result - how much each service will cost. For example, if there will be several items of RDS costs, you should specify the total amount, you do not need to give all calculations, just the name of the service and its cost per month. This should be done for all services. And also in the end to present the total cost for the whole infrastructure. "
-    generated_text = call_claude_sonnet(prompt + prompt_ending)
+    generated_text = model_router.generate("cost_narrative" if narrative else "cost_summary", prompt + prompt_ending)
     return generated_text
@@ -0,0 +1,147 @@
+import json
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import deadline
+import tracing
+
+# Job states, in the order a job goes through them
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class InMemoryJobStore:
+    """
+    Keeps jobs in the memory of this process. Jobs are lost when the container is recycled.
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def save(self, job):
+        with self._lock:
+            self._jobs[job["job_id"]] = dict(job)
+
+    def load(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+
+class S3JobStore:
+    """
+    Keeps each job as a JSON object in S3, so any container can report its status.
+    """
+
+    def __init__(self, s3_getter, bucket, prefix="jobs/"):
+        """
+        Args:
+            s3_getter (callable): Function returning an S3 client, or a stand-in with put_object and get_object.
+            bucket (str): The S3 bucket.
+            prefix (str): The key prefix of the job objects.
+        """
+        self.s3_getter = s3_getter
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def save(self, job):
+        self.s3_getter().put_object(
+            Bucket=self.bucket,
+            Key=f"{self.prefix}{job['job_id']}.json",
+            Body=json.dumps(job).encode("utf-8"),
+            ContentType="application/json",
+        )
+
+    def load(self, job_id):
+        from botocore.exceptions import ClientError
+
+        try:
+            response = self.s3_getter().get_object(Bucket=self.bucket, Key=f"{self.prefix}{job_id}.json")
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None
+            raise
+        return json.loads(response["Body"].read())
+
+
+class JobRunner:
+    """
+    Runs long tool calls on a worker pool and records their progress in a job store.
+
+    A job function is called with its arguments and a `progress` keyword argument,
+    which it calls with the name of each stage it starts.
+    """
+
+    def __init__(self, store, max_workers=2, timeout=None):
+        """
+        Args:
+            store: The job store, e.g. InMemoryJobStore or S3JobStore.
+            max_workers (int): Jobs that run at the same time; others wait in the queue.
+            timeout (float): Deadline of each job in seconds, or None for no deadline.
+        """
+        self.store = store
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+
+    def submit(self, name, fn, *args, **kwargs):
+        """
+        Queues a job and returns without waiting for it.
+
+        Args:
+            name (str): The job type, used as the trace route, e.g. '/iac_estimate_job'.
+            fn (callable): The job function.
+            *args, **kwargs: Arguments of the job function.
+
+        Returns:
+            dict: The queued job, with its `job_id`.
+        """
+        now = time.time()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "name": name,
+            "status": QUEUED,
+            "stage": None,
+            "created_at": now,
+            "updated_at": now,
+            "result": None,
+            "error": None,
+        }
+        self.store.save(job)
+        self._executor.submit(self._run, dict(job), fn, args, kwargs)
+        return job
+
+    def status(self, job_id):
+        """
+        Looks up a job.
+
+        Args:
+            job_id (str): The ID returned by submit.
+
+        Returns:
+            dict: The job with its status, current stage and, once finished, its result or error. None if unknown.
+        """
+        return self.store.load(job_id)
+
+    def _update(self, job, **fields):
+        job.update(fields, updated_at=time.time())
+        self.store.save(job)
+
+    def _run(self, job, fn, args, kwargs):
+        # Each job is its own trace, with its own deadline: the submitting invocation has returned
+        with tracing.trace(job["name"], job_id=job["job_id"]), deadline.scope(self.timeout):
+            self._update(job, status=RUNNING)
+            try:
+                result = fn(*args, progress=lambda stage: self._update(job, stage=stage), **kwargs)
+            except Exception as e:
+                tracing.log("Job failed", job_id=job["job_id"], error=type(e).__name__,
+                            traceback=traceback.format_exc()[-2000:])
+                message = deadline.partial_answer(e) if isinstance(e, TimeoutError) else f"{type(e).__name__}: {e}"
+                self._update(job, status=FAILED, error=message)
+                return
+            self._update(job, status=SUCCEEDED, stage=None, result=result)
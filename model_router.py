@@ -0,0 +1,225 @@
+import os
+import re
+import threading
+import time
+
+import bedrock_client
+import deadline
+import tracing
+
+# Models behind each tier. Any text model supported by bedrock_client.generate works,
+# e.g. MODEL_TIER_FAST=amazon.titan-text-lite-v1.
+MODEL_TIERS = {
+    "fast": os.environ.get("MODEL_TIER_FAST", bedrock_client.HAIKU_MODEL_ID),
+    "strong": os.environ.get("MODEL_TIER_STRONG", bedrock_client.SONNET_MODEL_ID),
+}
+
+# A route set to 'cascade' asks the fast tier first and escalates to the strong tier
+# when the answer looks unusable, see escalation_reason()
+CASCADE = "cascade"
+
+# Tier of each tool call. Override single routes with e.g. MODEL_ROUTES="code_gen=strong,well_arch=fast".
+DEFAULT_ROUTES = {
+    "answer_query": "strong",
+    "iac_gen": "strong",
+    "iac_plan": "fast",
+    "iac_module": "strong",
+    "well_arch": CASCADE,
+    "code_gen": "fast",
+    "cost_summary": "fast",
+    "cost_narrative": "fast",
+}
+MODEL_ROUTES = os.environ.get("MODEL_ROUTES", "")
+
+# Prompts longer than this skip the fast tier of a cascade, they rarely fit its strengths
+CASCADE_MAX_INPUT_TOKENS = int(os.environ.get("CASCADE_MAX_INPUT_TOKENS", "6000"))
+
+# Fast answers shorter than this are escalated
+CASCADE_MIN_ANSWER_CHARS = int(os.environ.get("CASCADE_MIN_ANSWER_CHARS", "40"))
+
+# Phrases of a model that could not answer
+UNSURE_ANSWER = re.compile(
+    r"\b(i (do not|don't) know|i'm not sure|i am not sure|i (cannot|can't) (answer|help|determine)"
+    r"|(not enough|insufficient) (context|information))\b",
+    re.IGNORECASE,
+)
+
+
+def parse_routes(value):
+    """
+    Parses route overrides of the form 'route=tier,route=tier'.
+
+    Args:
+        value (str): The overrides, e.g. from MODEL_ROUTES.
+
+    Returns:
+        dict: Tier per route.
+    """
+    routes = {}
+    for item in value.split(","):
+        if "=" in item:
+            route, tier = item.split("=", 1)
+            routes[route.strip()] = tier.strip()
+    return routes
+
+
+def escalation_reason(result, min_chars=CASCADE_MIN_ANSWER_CHARS):
+    """
+    Decides whether a fast-tier answer should be redone by the strong tier.
+
+    Bedrock returns no token probabilities, so the answer itself is checked: it must
+    not be cut off at max_tokens, too short, or say that the model does not know.
+
+    Args:
+        result (dict): The response, as returned by bedrock_client.generate.
+        min_chars (int): Minimum answer length.
+
+    Returns:
+        str: Why the answer is escalated, or None to keep it.
+    """
+    text = result["text"].strip()
+    if result["truncated"]:
+        return "truncated"
+    if len(text) < min_chars:
+        return "short"
+    if UNSURE_ANSWER.search(text):
+        return "unsure"
+    return None
+
+
+class ModelRouter:
+    """
+    Picks the model tier for each tool call and accounts latency and cost per tier.
+    """
+
+    def __init__(self, tiers=None, routes=None, max_cascade_input_tokens=CASCADE_MAX_INPUT_TOKENS,
+                 min_answer_chars=CASCADE_MIN_ANSWER_CHARS):
+        """
+        Args:
+            tiers (dict): Model ID per tier, defaults to MODEL_TIERS.
+            routes (dict): Tier or 'cascade' per route, defaults to DEFAULT_ROUTES with MODEL_ROUTES applied.
+            max_cascade_input_tokens (int): Longer prompts of a cascade go straight to the strong tier.
+            min_answer_chars (int): Shorter fast-tier answers of a cascade are escalated.
+        """
+        self.tiers = dict(MODEL_TIERS if tiers is None else tiers)
+        self.routes = dict(DEFAULT_ROUTES, **parse_routes(MODEL_ROUTES)) if routes is None else dict(routes)
+        self.max_cascade_input_tokens = max_cascade_input_tokens
+        self.min_answer_chars = min_answer_chars
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def tier_for(self, route):
+        # Routes without a setting get the strong tier, as every call did before routing
+        tier = self.routes.get(route, "strong")
+        if tier != CASCADE and tier not in self.tiers:
+            raise ValueError(f"Unknown model tier {tier!r} for route {route!r}")
+        return tier
+
+    def generate(self, route, prompt, max_tokens=4096, **params):
+        """
+        Answers a prompt with the tier of its route.
+
+        Args:
+            route (str): The tool call, e.g. 'code_gen'.
+            prompt (str): The prompt to send to the model.
+            max_tokens (int): Maximum number of tokens to generate.
+            **params: Request parameters, see bedrock_client.generate.
+
+        Returns:
+            str: The response from the model.
+        """
+        return self._route(route, prompt, max_tokens, params)["text"]
+
+    def stream(self, route, prompt, max_tokens=4096, usage=None, **params):
+        """
+        Streaming version of generate. A cascade has to see the whole fast answer
+        before it can be kept, so it is returned as a single chunk.
+
+        Args:
+            usage (dict): If given, filled with the input_tokens and output_tokens of the
+                response, and whether it was `truncated` at max_tokens.
+
+        Yields:
+            str: Text chunks of the response.
+        """
+        tier = self.tier_for(route)
+        if tier == CASCADE:
+            result = self._route(route, prompt, max_tokens, params)
+            if usage is not None:
+                usage.update(truncated=result["truncated"], input_tokens=result["input_tokens"],
+                             output_tokens=result["output_tokens"])
+            yield result["text"]
+            return
+        call_usage = {"input_tokens": 0, "output_tokens": 0, "truncated": False}
+        start = time.monotonic()
+        try:
+            yield from bedrock_client.stream_generate(self.tiers[tier], prompt, max_tokens, call_usage, **params)
+        finally:
+            self._account(tier, time.monotonic() - start, call_usage["input_tokens"], call_usage["output_tokens"])
+            if usage is not None:
+                usage.update(call_usage)
+
+    def _route(self, route, prompt, max_tokens, params):
+        # Returns the result of the call kept for the route, see bedrock_client.generate
+        tier = self.tier_for(route)
+        with tracing.span("model.route", route=route, tier=tier) as span:
+            if tier != CASCADE:
+                return self._call(tier, prompt, max_tokens, params)
+            if bedrock_client.estimate_tokens(prompt) > self.max_cascade_input_tokens:
+                span.set(tier="strong")
+                return self._call("strong", prompt, max_tokens, params)
+
+            result = self._call("fast", prompt, max_tokens, params)
+            reason = escalation_reason(result, self.min_answer_chars)
+            # Without time for a second call the fast answer is better than none
+            if reason is None or deadline.short_on_time():
+                span.set(tier="fast")
+                return result
+            span.set(tier="strong", escalated=reason)
+            with self._lock:
+                self._tier_stats("fast")["escalations"] += 1
+            try:
+                return self._call("strong", prompt, max_tokens, params)
+            except deadline.DeadlineExceeded:
+                span.set(tier="fast")
+                return result
+
+    def _call(self, tier, prompt, max_tokens, params):
+        start = time.monotonic()
+        result = bedrock_client.generate(self.tiers[tier], prompt, max_tokens, **params)
+        self._account(tier, time.monotonic() - start, result["input_tokens"], result["output_tokens"])
+        return result
+
+    def _tier_stats(self, tier):
+        return self._stats.setdefault(tier, {
+            "calls": 0,
+            "escalations": 0,
+            "total_latency": 0.0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "cost": 0.0,
+        })
+
+    def _account(self, tier, latency, input_tokens, output_tokens):
+        cost = bedrock_client.model_cost(self.tiers[tier], input_tokens, output_tokens)
+        with self._lock:
+            stats = self._tier_stats(tier)
+            stats["calls"] += 1
+            stats["total_latency"] += latency
+            stats["input_tokens"] += input_tokens
+            stats["output_tokens"] += output_tokens
+            stats["cost"] += cost
+
+    def stats(self):
+        """
+        Returns per-tier statistics.
+
+        Returns:
+            dict: Per tier, its model ID, calls, escalations to the strong tier, total and
+            average latency in seconds, input and output tokens and their cost in USD.
+        """
+        with self._lock:
+            stats = {tier: dict(values, model_id=self.tiers[tier]) for tier, values in self._stats.items()}
+        for values in stats.values():
+            values["avg_latency"] = values["total_latency"] / values["calls"] if values["calls"] else 0.0
+        return stats
@@ -0,0 +1,137 @@
+import queue
+import threading
+import time
+
+import deadline
+import tracing
+
+# S3 rejects multipart parts smaller than 5 MiB, except for the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+_END = object()
+
+# Seconds between checks of the stop event while the queue is full
+_PUT_POLL_SECONDS = 0.1
+
+
+def _read_ahead(chunks):
+    """
+    Iterates a stream on a daemon thread, so that its reader can give up on a stalled stream.
+
+    The queue holds a single item, so the thread reads at most one chunk ahead of
+    the consumer and a fast stream is never buffered in memory as a whole.
+
+    Args:
+        chunks (iterable): The stream, e.g. a model response stream.
+
+    Returns:
+        tuple: A queue of (chunk, error) pairs ending with the _END chunk, and an event
+        that stops the reading thread and closes the stream once its current read returns.
+    """
+    items = queue.Queue(maxsize=1)
+    stop = threading.Event()
+
+    def put(item):
+        # Waits for the consumer, unless it gave up and will never take the item
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=_PUT_POLL_SECONDS)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def read():
+        try:
+            for chunk in chunks:
+                if not put((chunk, None)):
+                    break
+            put((_END, None))
+        except BaseException as e:
+            put((None, e))
+        finally:
+            # Closing the model stream releases its rate limiter reservation
+            close = getattr(chunks, "close", None)
+            if stop.is_set() and close is not None:
+                close()
+
+    threading.Thread(target=tracing.bind(deadline.bind(read)), name="upload-reader", daemon=True).start()
+    return items, stop
+
+
+def upload_stream(s3, bucket, key, chunks, part_size=MIN_PART_SIZE, timeout=None, content_type="text/plain"):
+    """
+    Uploads a stream of text chunks to S3 without ever exposing a partial object.
+
+    At most one part is buffered in memory. Parts are uploaded while the stream is
+    still running, but S3 parts are at least 5 MiB, so typical outputs such as a
+    generated Terraform stack of a few KB fit in one part and are written with a
+    single PutObject once the stream ends. Larger streams use a multipart upload.
+    If the stream fails, times out or is abandoned, the multipart upload is aborted
+    so that no partial object is ever visible.
+
+    The timeout also applies while waiting for the next chunk: the stream is read
+    on a separate thread, so a stalled model stream cannot hold the upload past it.
+
+    Args:
+        s3: The S3 client.
+        bucket (str): The bucket name.
+        key (str): The object key.
+        chunks (iterable): The text chunks, e.g. a model response stream.
+        part_size (int): Bytes buffered before a part is uploaded, at least 5 MiB.
+        timeout (float): Optional number of seconds after which the upload is abandoned.
+        content_type (str): The content type of the object.
+
+    Returns:
+        int: The number of bytes uploaded.
+    """
+    part_size = max(part_size, MIN_PART_SIZE)
+    start = time.monotonic()
+    buffer = bytearray()
+    upload_id = None
+    parts = []
+    total = 0
+
+    def upload_part(data):
+        response = s3.upload_part(
+            Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=len(parts) + 1, Body=bytes(data)
+        )
+        parts.append({"PartNumber": len(parts) + 1, "ETag": response["ETag"]})
+
+    items, stop = _read_ahead(chunks)
+    try:
+        while True:
+            wait = None if timeout is None else timeout - (time.monotonic() - start)
+            try:
+                if wait is not None and wait <= 0:
+                    raise queue.Empty
+                chunk, error = items.get(timeout=wait)
+            except queue.Empty:
+                raise TimeoutError(f"Upload of s3://{bucket}/{key} timed out after {timeout}s")
+            if error is not None:
+                raise error
+            if chunk is _END:
+                break
+            data = chunk.encode("utf-8")
+            buffer += data
+            total += len(data)
+            while len(buffer) >= part_size:
+                if upload_id is None:
+                    upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key, ContentType=content_type)["UploadId"]
+                upload_part(buffer[:part_size])
+                del buffer[:part_size]
+
+        if upload_id is None:
+            s3.put_object(Bucket=bucket, Key=key, Body=bytes(buffer), ContentType=content_type)
+            return total
+        if buffer or not parts:
+            upload_part(buffer)
+        s3.complete_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts})
+        return total
+    except BaseException:
+        if upload_id is not None:
+            tracing.log("Aborting multipart upload", bucket=bucket, key=key)
+            s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+    finally:
+        stop.set()
@@ -0,0 +1,340 @@
+"""
+Long-running HTTP server for the agent action group.
+
+Serves the routes of index.handler and infracost/index.handler from one asyncio
+process. Tool calls run on a bounded thread pool, since boto3 is blocking.
+Identical requests that arrive while one is in flight wait for its result
+instead of calling Bedrock again, and requests beyond the pool and its queue
+are turned away with 503 so that clients back off.
+
+The server has no authentication and listens on localhost unless --host says
+otherwise.
+
+Usage:
+    python server.py --port 8080
+    python server.py --host 0.0.0.0 --port 8080    # e.g. in a container behind a load balancer
+    curl 'localhost:8080/answer_query?query=What+is+RDS+Proxy%3F'
+    curl -X POST localhost:8080/gen_code -d '{"query": "Upload a file to S3 in Python"}'
+
+A Bedrock Agent action group event POSTed to any path is answered in the
+format of index.handler.
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import bedrock_client
+import deadline
+import tracing
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Tool calls running at the same time. Each needs a connection of the shared
+# boto3 clients, so the default matches their pool size.
+SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS", str(bedrock_client.MAX_POOL_CONNECTIONS)))
+
+# Requests waiting for a worker. Beyond this the server answers 503 right away.
+SERVER_MAX_QUEUE = int(os.environ.get("SERVER_MAX_QUEUE", "200"))
+
+# Deadline of a request from the moment it is accepted, see deadline.py
+SERVER_REQUEST_TIMEOUT = float(os.environ.get("SERVER_REQUEST_TIMEOUT", "840"))
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+               500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+def load_infracost_tools():
+    """
+    Imports infracost/tools.py as the module 'infracost_tools'.
+
+    Both handlers have a module called tools, so the infracost one is loaded under
+    another name. Its own directory is appended to sys.path for its local imports.
+
+    Returns:
+        module: The infracost tools module.
+    """
+    infracost_dir = os.path.join(ROOT_DIR, "infracost")
+    if infracost_dir not in sys.path:
+        sys.path.append(infracost_dir)
+    spec = importlib.util.spec_from_file_location("infracost_tools", os.path.join(infracost_dir, "tools.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["infracost_tools"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def build_routes(tools, infracost_tools):
+    """
+    Maps each API path to its tool call.
+
+    Args:
+        tools: The root tools module.
+        infracost_tools: The infracost tools module.
+
+    Returns:
+        dict: Per path, the `call` taking the query and session ID, whether identical
+        requests are coalesced, and whether the session ID is part of what makes them identical.
+    """
+    return {
+        "/answer_query": {"call": lambda query, session_id: tools.answer_query(query), "coalesce": True, "session": False},
+        # Every generation writes a new file for its session, so none are shared
+        "/iac_gen": {"call": tools.iac_gen_tool, "coalesce": False, "session": True},
+        "/iac_estimate_tool": {"call": tools.iac_estimate_tool, "coalesce": True, "session": True},
+        "/iac_estimate_job": {"call": tools.submit_iac_estimate, "coalesce": False, "session": True},
+        "/iac_estimate_job_status": {"call": lambda query, session_id: tools.iac_estimate_status(query),
+                                     "coalesce": True, "session": False},
+        "/query_well_arch_framework": {"call": lambda query, session_id: infracost_tools.aws_well_arch_tool(query),
+                                       "coalesce": True, "session": False},
+        "/gen_code": {"call": lambda query, session_id: infracost_tools.code_gen_tool(query),
+                      "coalesce": True, "session": False},
+    }
+
+
+class ActionGroupServer:
+    """
+    Runs tool calls for HTTP requests with single-flight coalescing and backpressure.
+    """
+
+    def __init__(self, routes, workers=SERVER_WORKERS, max_queue=SERVER_MAX_QUEUE,
+                 request_timeout=SERVER_REQUEST_TIMEOUT):
+        """
+        Args:
+            routes (dict): The routes, see build_routes.
+            workers (int): Tool calls running at the same time.
+            max_queue (int): Tool calls waiting for a worker before requests are rejected.
+            request_timeout (float): Seconds a request may take from the moment it is accepted.
+        """
+        self.routes = routes
+        self.workers = workers
+        self.max_queue = max_queue
+        self.request_timeout = request_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tool")
+        self._in_flight = {}
+        self._pending = 0
+        self._stats = {"requests": 0, "coalesced": 0, "rejected": 0, "errors": 0}
+
+    def _run(self, path, call, query, session_id, accepted):
+        # Runs on a worker thread, so the trace and deadline are set up here
+        timeout = self.request_timeout - (time.monotonic() - accepted)
+        with tracing.trace(path, session_id=session_id), deadline.scope(max(0.0, timeout)):
+            try:
+                return str(call(query, session_id))
+            except TimeoutError as e:
+                tracing.log("Deadline exceeded", stage=getattr(e, "stage", None))
+                return deadline.partial_answer(e)
+
+    async def call(self, path, query, session_id=None):
+        """
+        Answers one request.
+
+        Args:
+            path (str): The API path.
+            query (str): The query parameter.
+            session_id (str): The agent session ID.
+
+        Returns:
+            tuple: The HTTP status and the response body text.
+        """
+        self._stats["requests"] += 1
+        route = self.routes.get(path)
+        if route is None:
+            return 404, f"{path} is not a valid API, try another one."
+
+        key = (path, query.strip(), session_id if route["session"] else None)
+        if route["coalesce"] and key in self._in_flight:
+            # The same request is running: share its result instead of calling Bedrock again
+            self._stats["coalesced"] += 1
+            return await asyncio.shield(self._in_flight[key])
+
+        if self._pending >= self.workers + self.max_queue:
+            self._stats["rejected"] += 1
+            return 503, "The server is busy, please retry later."
+
+        self._pending += 1
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, self._run, path, route["call"], query, session_id, time.monotonic())
+        task = asyncio.ensure_future(self._finish(future))
+        if route["coalesce"]:
+            # Dropped once the call finishes, even if the client that started it went away
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._in_flight.pop(key) if self._in_flight.get(key) is done else None)
+        return await asyncio.shield(task)
+
+    async def _finish(self, future):
+        try:
+            return 200, await future
+        except Exception as e:
+            self._stats["errors"] += 1
+            tracing.log("Request failed", error=type(e).__name__, detail=str(e)[-500:])
+            return 500, f"{type(e).__name__}: {e}"
+        finally:
+            self._pending -= 1
+
+    def stats(self):
+        """
+        Returns request counters.
+
+        Returns:
+            dict: Requests, coalesced and rejected requests, errors, and tool calls
+            currently running or queued.
+        """
+        return dict(self._stats, pending=self._pending, in_flight=len(self._in_flight))
+
+    async def handle_connection(self, reader, writer):
+        # HTTP/1.1 with keep-alive; one request at a time per connection
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                status, payload, keep_alive = await self.respond(request)
+                writer.write(encode_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, request):
+        """
+        Turns a parsed HTTP request into a tool call.
+
+        Args:
+            request (dict): The method, path, query parameters, headers and body.
+
+        Returns:
+            tuple: The HTTP status, the JSON payload and whether to keep the connection open.
+        """
+        keep_alive = request["headers"].get("connection", "").lower() != "close"
+        if "error" in request:
+            return request["error"], {"error": STATUS_TEXT[request["error"]]}, False
+        path = request["path"]
+        if path == "/health":
+            return 200, {"status": "ok", **self.stats()}, keep_alive
+
+        try:
+            body = json.loads(request["body"]) if request["body"] else {}
+        except ValueError:
+            return 400, {"error": "The request body is not JSON."}, keep_alive
+        if isinstance(body, dict) and "apiPath" in body:
+            # A Bedrock Agent event, answered like index.handler
+            event = body
+            try:
+                query = event["parameters"][0]["value"]
+            except (KeyError, IndexError, TypeError):
+                return 400, {"error": "The event has no query parameter."}, keep_alive
+            status, text = await self.call(event["apiPath"], query, event.get("sessionId"))
+            return status, {
+                "messageVersion": "1.0",
+                "response": {
+                    "actionGroup": event.get("actionGroup"),
+                    "apiPath": event["apiPath"],
+                    "httpMethod": event.get("httpMethod"),
+                    "httpStatusCode": status,
+                    "responseBody": {"application/json": {"body": text}},
+                },
+            }, keep_alive
+
+        params = request["params"]
+        body = body if isinstance(body, dict) else {}
+        query = body.get("query", params.get("query", [None])[0])
+        session_id = body.get("sessionId", params.get("sessionId", [None])[0])
+        if query is None:
+            return 400, {"error": "Missing the query parameter."}, keep_alive
+        status, text = await self.call(path, query, session_id)
+        return status, {"body": text}, keep_alive
+
+
+async def read_request(reader):
+    """
+    Reads one HTTP request.
+
+    Args:
+        reader (asyncio.StreamReader): The connection.
+
+    Returns:
+        dict: The method, path, query parameters, lower-cased headers and body, or with
+        an `error` status if the request is malformed. None when the client closed the connection.
+    """
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        return {"error": 413, "headers": {}}
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _ = lines[0].split(" ", 2)
+    except ValueError:
+        return {"error": 400, "headers": {}}
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        return {"error": 400, "headers": headers}
+    if length > MAX_BODY_BYTES:
+        return {"error": 413, "headers": headers}
+    body = await reader.readexactly(length) if length else b""
+    url = urlsplit(target)
+    return {
+        "method": method,
+        "path": url.path,
+        "params": parse_qs(url.query),
+        "headers": headers,
+        "body": body.decode("utf-8") if body else "",
+    }
+
+
+def encode_response(status, payload, keep_alive):
+    body = json.dumps(payload, default=str).encode("utf-8")
+    headers = [
+        f"HTTP/1.1 {status} {STATUS_TEXT.get(status, 'OK')}",
+        "Content-Type: application/json",
+        f"Content-Length: {len(body)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    if status == 503:
+        headers.append("Retry-After: 1")
+    return ("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body
+
+
+async def serve(host, port, server):
+    listener = await asyncio.start_server(server.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+    tracing.log("Server started", host=host, port=port, workers=server.workers, max_queue=server.max_queue)
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="address to listen on; the server has no authentication, so only pass "
+                             "e.g. 0.0.0.0 behind a load balancer or network policy that restricts access")
+    parser.add_argument("--port", type=int, default=8080, help="port to listen on")
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="tool calls running at the same time")
+    parser.add_argument("--max-queue", type=int, default=SERVER_MAX_QUEUE, help="queued tool calls before answering 503")
+    args = parser.parse_args()
+
+    import tools
+
+    server = ActionGroupServer(build_routes(tools, load_infracost_tools()), workers=args.workers, max_queue=args.max_queue)
+    asyncio.run(serve(args.host, args.port, server))
+
+
+if __name__ == "__main__":
+    main()
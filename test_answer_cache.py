@@ -0,0 +1,36 @@
+import deadline
+import tools
+from answer_cache import AnswerCache
+from benchmarks import stubs
+
+QUERY = "How to configure e-commerce website?"
+
+
+def answer_with_cache(cache, seconds=None, response_text=None):
+    clients = stubs.install()
+    clients["bedrock-runtime"].response_text = response_text
+    tools.set_answer_cache(cache)
+    with deadline.scope(seconds):
+        return tools.answer_query(QUERY)
+
+
+def test_complete_answer_is_cached():
+    cache = AnswerCache()
+    answer = answer_with_cache(cache)
+
+    assert cache.get(QUERY, tools.knowledge_base_id)[0] == answer
+
+
+def test_answer_short_on_time_is_not_cached():
+    cache = AnswerCache()
+    answer_with_cache(cache, seconds=deadline.DEADLINE_LOW_SECONDS - 5)
+
+    assert cache.stats()["size"] == 0
+
+
+def test_answer_cut_off_at_max_tokens_is_not_cached():
+    cache = AnswerCache()
+    answer = answer_with_cache(cache, response_text="word " * 5000)
+
+    assert len(answer) < len("word " * 5000)
+    assert cache.stats()["size"] == 0
@@ -1,19 +1,78 @@
-import json
 import os
-import subprocess
-import boto3
+import json
+import shutil
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+import bedrock_client
+import deadline
+import tracing
+from answer_cache import AnswerCache
+from context_packing import ContextPacker
+from cost_breakdown import aggregate_breakdown, format_cost_summary, run_infracost_json
+from cost_cache import CostCache, TerraformHasher, cost_cache_key, infracost_version, terraform_content_hash
+from cost_diff import diff_breakdowns, format_cost_diff, merge_breakdowns, plan_incremental
+from iac_fanout import IncompleteStack, generate_stack
+from jobs import InMemoryJobStore, JobRunner, S3JobStore
+from model_router import ModelRouter
+from s3_stream_upload import upload_stream
+
 # Define the knowledge base ID
 knowledge_base_id = "EFSEVHIJBA"
 
-# Initialize Bedrock runtime clients
-bedrock_runtime = boto3.client('bedrock-runtime', 'us-west-2')
-bedrock_agent_runtime = boto3.client('bedrock-agent-runtime', 'us-west-2')
-
-def get_contexts(query, kbId, numberOfResults=5):
+# S3 locations of the generated Terraform code and cost estimations. Manifests map
+# a session to the Terraform file it generated last, so estimates never list iac-code.
+iac_bucket_name = "bedrock-agent-generate-iac-estimate-cost"
+iac_code_prefix = "iac-code/"
+iac_cost_prefix = "iac-cost/"
+iac_manifest_prefix = "iac-manifest/"
+iac_job_prefix = "iac-jobs/"
+
+# Cost estimates are aggregated in code; set IAC_ESTIMATE_NARRATIVE=true to also
+# have Claude explain the numbers, at the price of an extra model call.
+IAC_ESTIMATE_NARRATIVE = os.environ.get("IAC_ESTIMATE_NARRATIVE", "false").lower() == "true"
+
+# Repeat estimates of a session only re-estimate the resources changed since the last
+# one and report the cost change; set IAC_ESTIMATE_INCREMENTAL=false for full estimates
+IAC_ESTIMATE_INCREMENTAL = os.environ.get("IAC_ESTIMATE_INCREMENTAL", "true").lower() == "true"
+
+# Infracost results are cached by Terraform content hash and Infracost version in /tmp.
+# Set COST_CACHE_S3=true to share them between containers under iac-cost/cache/.
+COST_CACHE_S3 = os.environ.get("COST_CACHE_S3", "false").lower() == "true"
+
+# Cost estimate jobs (/iac_estimate_job) run on JOB_WORKERS threads. Their state is kept
+# in memory, or with JOB_STORE=s3 under iac-jobs/ so that any container can report it.
+JOB_STORE = os.environ.get("JOB_STORE", "memory")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_TIMEOUT_SECONDS = float(os.environ.get("JOB_TIMEOUT_SECONDS", "900"))
+
+# Terraform generations running longer than this are abandoned without leaving a partial file
+IAC_GEN_TIMEOUT_SECONDS = float(os.environ.get("IAC_GEN_TIMEOUT_SECONDS", "840"))
+
+# Terraform is generated per service in parallel after a planning call, see iac_fanout.py.
+# Set IAC_GEN_FANOUT=false to generate every stack with a single streamed call.
+IAC_GEN_FANOUT = os.environ.get("IAC_GEN_FANOUT", "true").lower() == "true"
+
+# Answer cache settings. Set ANSWER_CACHE_SIMILARITY (e.g. 0.95) to also serve
+# answers for near-identical questions; this costs one embedding call per miss.
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "256"))
+ANSWER_CACHE_TTL_SECONDS = int(os.environ.get("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_SIMILARITY = os.environ.get("ANSWER_CACHE_SIMILARITY")
+
+# Passages retrieved per question; fewer when the invocation is short on time
+CONTEXT_RESULTS = int(os.environ.get("CONTEXT_RESULTS", "5"))
+CONTEXT_RESULTS_LOW_TIME = int(os.environ.get("CONTEXT_RESULTS_LOW_TIME", "3"))
+
+# Retrieved passages are deduplicated and packed into this many input tokens, best score first
+CONTEXT_MAX_TOKENS = int(os.environ.get("CONTEXT_MAX_TOKENS", "2000"))
+CONTEXT_DEDUP_SIMILARITY = float(os.environ.get("CONTEXT_DEDUP_SIMILARITY", "0.8"))
+
+def retrieve_passages(query, kbId, numberOfResults=5):
     """
-    Retrieves contexts for a given query from the specified knowledge base.
+    Retrieves passages for a given query from the specified knowledge base, with their scores.
 
     Args:
         query (str): The natural language query.
@@ -21,108 +80,86 @@ def get_contexts(query, kbId, numberOfResults=5):
         numberOfResults (int): Number of results to retrieve (default is 5).
 
     Returns:
-        list: A list of contexts related to the query.
+        list: Dicts with the passage `text` and its retrieval `score`.
     """
-    # Retrieve contexts for the query from the knowledge base
-    results = bedrock_agent_runtime.retrieve(
-        retrievalQuery={'text': query},
-        knowledgeBaseId=kbId,
-        retrievalConfiguration={'vectorSearchConfiguration': {'numberOfResults': numberOfResults}}
-    )
-    
-    # Create a list to store the contexts
-    contexts = [retrievedResult['content']['text'] for retrievedResult in results['retrievalResults']]
-    
-    return contexts
+    deadline.check("kb.retrieve")
+    with tracing.span("kb.retrieve", results=numberOfResults):
+        results = bedrock_client.get_client('bedrock-agent-runtime').retrieve(
+            retrievalQuery={'text': query},
+            knowledgeBaseId=kbId,
+            retrievalConfiguration={'vectorSearchConfiguration': {'numberOfResults': numberOfResults}}
+        )
+    return [
+        {"text": retrievedResult['content']['text'], "score": retrievedResult.get('score')}
+        for retrievedResult in results['retrievalResults']
+    ]
 
-def call_claude_sonnet(prompt):
+def get_contexts(query, kbId, numberOfResults=5):
     """
-    Calls the Claude Sonnet model with a given prompt.
+    Retrieves contexts for a given query from the specified knowledge base.
 
     Args:
-        prompt (str): The prompt to send to the model.
+        query (str): The natural language query.
+        kbId (str): The knowledge base ID.
+        numberOfResults (int): Number of results to retrieve (default is 5).
 
     Returns:
-        str: The response from the model.
+        list: A list of contexts related to the query.
     """
-    prompt_config = {
-        "anthropic_version": "bedrock-2023-05-31",
-        "max_tokens": 4096,
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                ],
-            }
-        ],
-    }
-
-    body = json.dumps(prompt_config)
-    modelId = "anthropic.claude-3-sonnet-20240229-v1:0"
-    accept = "application/json"
-    contentType = "application/json"
-
-    response = bedrock_runtime.invoke_model(body=body, modelId=modelId, accept=accept, contentType=contentType)
-    response_body = json.loads(response.get("body").read())
+    return [passage["text"] for passage in retrieve_passages(query, kbId, numberOfResults)]
 
-    results = response_body.get("content")[0].get("text")
-    return results
+# Picks the model of each tool call, see MODEL_ROUTES; its stats() report latency and cost per tier
+model_router = ModelRouter()
 
-def claude_prompt_format(prompt: str) -> str:
-    """
-    Formats the prompt for the Claude model.
-
-    Args:
-        prompt (str): The original prompt.
+# Process-wide context packer; its stats() report the input tokens saved so far
+context_packer = ContextPacker(max_tokens=CONTEXT_MAX_TOKENS, similarity_threshold=CONTEXT_DEDUP_SIMILARITY)
 
-    Returns:
-        str: The formatted prompt.
-    """
-    return f"\n\nHuman: {prompt}\n\nAssistant:"
+# Process-wide answer cache, shared across warm invocations. Replace it with
+# set_answer_cache() or disable it with set_answer_cache(None).
+answer_cache = AnswerCache(
+    max_entries=ANSWER_CACHE_MAX_ENTRIES,
+    ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+    embed_fn=bedrock_client.call_titan_embeddings if ANSWER_CACHE_SIMILARITY else None,
+    similarity_threshold=float(ANSWER_CACHE_SIMILARITY) if ANSWER_CACHE_SIMILARITY else None,
+)
 
-def call_claude(prompt):
+def set_answer_cache(cache):
     """
-    Calls the Claude model with a formatted prompt.
+    Replaces the answer cache used by answer_query.
 
     Args:
-        prompt (str): The prompt to send to the model.
-
-    Returns:
-        str: The response from the model.
+        cache (AnswerCache): The cache to use, or None to disable caching.
     """
-    prompt_config = {
-        "prompt": claude_prompt_format(prompt),
-        "max_tokens_to_sample": 4096,
-        "temperature": 0.7,
-        "top_k": 250,
-        "top_p": 0.5,
-        "stop_sequences": [],
-    }
-
-    body = json.dumps(prompt_config)
-    modelId = "anthropic.claude-v2"
-    accept = "application/json"
-    contentType = "application/json"
-
-    response = bedrock_runtime.invoke_model(body=body, modelId=modelId, accept=accept, contentType=contentType)
-    response_body = json.loads(response.get("body").read())
+    global answer_cache
+    answer_cache = cache
 
-    results = response_body.get("completion")
-    return results
-
-def answer_query(user_input):
+def answer_query_stream(user_input):
     """
-    Answers a user query by retrieving context from Amazon Bedrock KnowledgeBases and calling an LLM.
+    Answers a user query like answer_query, streaming the answer as it is generated.
+    Repeated questions are served from the answer cache without calling Bedrock.
 
     Args:
         user_input (str): The natural language question.
 
-    Returns:
-        str: The answer to the question based on context from the Knowledge Bases.
+    Yields:
+        str: Text chunks of the answer to the question.
     """
-    # Retrieve contexts for the user input from Bedrock knowledge bases
-    userContexts = get_contexts(user_input, knowledge_base_id)
+    cache = answer_cache
+    embedding = None
+    if cache is not None:
+        cached_answer, embedding = cache.get(user_input, knowledge_base_id)
+        if cached_answer is not None:
+            tracing.log("Answer cache hit", **cache.stats())
+            yield cached_answer
+            return
+    start = time.monotonic()
+
+    # Retrieve passages for the user input from Bedrock knowledge bases and pack
+    # the best, distinct ones into the context token budget
+    short_on_time = deadline.short_on_time()
+    passages = retrieve_passages(user_input, knowledge_base_id, CONTEXT_RESULTS_LOW_TIME if short_on_time else CONTEXT_RESULTS)
+    userContexts, packing = context_packer.pack(passages)
+    tracing.log("Context packing", **packing)
 
     # Configure the prompt for the LLM
     prompt_data = """
@@ -140,113 +177,456 @@ def answer_query(user_input):
     """
     formatted_prompt_data = prompt_data.format(context_str=userContexts, query_str=user_input)
 
-    prompt = {
-        "anthropic_version": "bedrock-2023-05-31",
-        "max_tokens": 4096,
-        "temperature": 0.5,
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": formatted_prompt_data}
-                ]
-            }
-        ]
-    }
-    
-    json_prompt = json.dumps(prompt)
-    response = bedrock_runtime.invoke_model(body=json_prompt, modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-                                            accept="application/json", contentType="application/json")
-    response_body = json.loads(response.get('body').read())
-    answer = response_body['content'][0]['text']
-    
-    return answer
+    chunks = []
+    usage = {}
+    for chunk in model_router.stream("answer_query", formatted_prompt_data, 4096, usage=usage, temperature=0.5):
+        chunks.append(chunk)
+        yield chunk
+    answer = "".join(chunks)
+
+    # Only complete answers are cached. An abandoned stream never reaches this point, and
+    # an answer built from fewer passages or cut off at a deadline-capped max_tokens
+    # would be served to later callers that have time for the full one.
+    if short_on_time or usage.get("truncated"):
+        tracing.log("Answer not cached", short_on_time=short_on_time, truncated=bool(usage.get("truncated")))
+    elif cache is not None:
+        cache.put(user_input, knowledge_base_id, answer, cost_seconds=time.monotonic() - start, embedding=embedding)
+
+def answer_query(user_input):
+    """
+    Answers a user query by retrieving context from Amazon Bedrock KnowledgeBases and calling an LLM.
+    Repeated questions are served from the answer cache without calling Bedrock.
+
+    Args:
+        user_input (str): The natural language question.
+
+    Returns:
+        str: The answer to the question based on context from the Knowledge Bases.
+    """
+    return bedrock_client.collect_stream(answer_query_stream(user_input))
+
+def iac_manifest_key(session_id=None):
+    """
+    Returns the S3 key of the manifest pointing to the latest Terraform file of a session.
+
+    Args:
+        session_id (str): The agent session ID, or None for the latest file of any session.
+
+    Returns:
+        str: The manifest key.
+    """
+    return f"{iac_manifest_prefix}{session_id or 'latest'}.json"
+
+def write_iac_manifest(s3, s3_path, session_id=None, content_hash=None):
+    """
+    Points the session manifest, and the global latest manifest, at a generated Terraform file.
+
+    Args:
+        s3: The S3 client.
+        s3_path (str): The key of the generated Terraform file.
+        session_id (str): The agent session ID.
+        content_hash (str): The hash of the normalized Terraform code, used to look up cached estimates.
+    """
+    manifest = json.dumps({"key": s3_path, "sha256": content_hash, "created": datetime.now().isoformat()})
+    keys = [iac_manifest_key(None)]
+    if session_id:
+        keys.insert(0, iac_manifest_key(session_id))
+    for key in keys:
+        s3.put_object(Bucket=iac_bucket_name, Key=key, Body=manifest.encode('utf-8'), ContentType="application/json")
+
+def find_latest_iac(s3, session_id=None):
+    """
+    Resolves the latest generated Terraform file with a single GET of its manifest.
+
+    A session only ever sees its own manifest: the global one belongs to whichever
+    session generated last. Without a session ID, the global manifest is used, with a
+    paginated listing of the iac-code prefix for files generated before manifests existed.
+
+    Args:
+        s3: The S3 client.
+        session_id (str): The agent session ID.
+
+    Returns:
+        dict: The manifest, with the key of the latest Terraform file and, if known, its content hash.
+        None if the session has not generated any Terraform code yet.
+
+    Raises:
+        FileNotFoundError: If no session ID is given and no Terraform code exists at all.
+    """
+    from botocore.exceptions import ClientError
+
+    try:
+        response = s3.get_object(Bucket=iac_bucket_name, Key=iac_manifest_key(session_id))
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+            raise
+    else:
+        return json.loads(response["Body"].read())
+    if session_id:
+        return None
+
+    tracing.log("No IaC manifest found, listing the iac-code prefix")
+    latest = None
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=iac_bucket_name, Prefix=iac_code_prefix):
+        for obj in page.get('Contents', []):
+            if obj['Key'].endswith('/'):
+                continue
+            if latest is None or obj['LastModified'] > latest['LastModified']:
+                latest = obj
+    if latest is None:
+        raise FileNotFoundError(f"No Terraform code found in s3://{iac_bucket_name}/{iac_code_prefix}")
+    return {"key": latest['Key']}
+
+def find_latest_iac_key(s3, session_id=None):
+    """
+    Resolves the key of the latest generated Terraform file.
+
+    Args:
+        s3: The S3 client.
+        session_id (str): The agent session ID.
+
+    Returns:
+        str: The key of the latest Terraform file.
 
-def iac_gen_tool(prompt):
+    Raises:
+        FileNotFoundError: If no Terraform code was generated yet.
+    """
+    manifest = find_latest_iac(s3, session_id)
+    if manifest is None:
+        raise FileNotFoundError(f"No Terraform code generated in session {session_id}")
+    return manifest["key"]
+
+# Process-wide cache of Infracost results
+cost_cache = CostCache(
+    s3_getter=(lambda: bedrock_client.get_client('s3')) if COST_CACHE_S3 else None,
+    bucket=iac_bucket_name,
+    prefix=f"{iac_cost_prefix}cache/",
+)
+
+# Runs the S3 upload of a cost estimate while the narrative is written
+background = ThreadPoolExecutor(max_workers=4, thread_name_prefix="background")
+
+def iac_gen_tool(prompt, session_id=None):
     """
     Generates Infrastructure as Code (IaC) scripts based on a customer's request.
 
     Args:
         prompt (str): The customer's request.
+        session_id (str): The agent session ID, used to find this file again in iac_estimate_tool.
 
     Returns:
         str: The S3 path where the generated IaC code is saved.
     """
     prompt_ending = "Act as a DevOps Engineer. Carefully analyze the customer requirements provided and identify all AWS services and integrations needed for the solution. Generate the Terraform code required to provision and configure each AWS service, writing the code step-by-step. Provide only the final Terraform code, without any additional comments, explanations, markdown formatting, or special symbols."
-    generated_text = call_claude_sonnet(prompt + prompt_ending)
     
     # Save to S3
-    s3 = boto3.client('s3')
-    bucket_name = "bedrock-agent-generate-iac-estimate-cost"
-    prefix = "iac-code/"
+    s3 = bedrock_client.get_client('s3')
+    bucket_name = iac_bucket_name
+    prefix = iac_code_prefix
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"iac_{timestamp}.tf"
+    # The random suffix keeps files generated in the same second apart
+    filename = f"iac_{timestamp}_{uuid.uuid4().hex[:8]}.tf"
     s3_path = f"{prefix}{filename}"
     
-    # Write the Terraform code to a BytesIO object and upload it to S3
-    from io import BytesIO
-    file_buffer = BytesIO(generated_text.encode('utf-8'))
-    s3.upload_fileobj(file_buffer, bucket_name, s3_path)
+    # Stacks of several services are generated module by module and merged first.
+    # Single-service requests stream the Terraform code into S3 as the model writes it.
+    # Either way the code is hashed on the way, and a failed or timed-out generation,
+    # including one that runs into the invocation deadline, leaves no object behind.
+    timeout = deadline.budget(IAC_GEN_TIMEOUT_SECONDS, "iac_gen")
+    expires = None if timeout is None else time.monotonic() + timeout
+    stack = None
+    if IAC_GEN_FANOUT:
+        try:
+            stack = generate_stack(prompt, model_router, timeout=timeout)
+        except IncompleteStack as e:
+            # The merged stack would miss resources, so the whole stack is generated in one call
+            tracing.log("Falling back to single-call generation", reason=str(e))
+    chunks = [stack] if stack is not None else model_router.stream("iac_gen", prompt + prompt_ending)
+    hasher = TerraformHasher()
+    def hashed(chunks):
+        for chunk in chunks:
+            hasher.update(chunk)
+            yield chunk
+    # The upload gets what the fan-out left of the same budget, not a fresh one
+    remaining = None if expires is None else max(0.0, expires - time.monotonic())
+    upload_stream(s3, bucket_name, s3_path, hashed(chunks), timeout=remaining)
+    write_iac_manifest(s3, s3_path, session_id, hasher.hexdigest())
     
     return f"File saved to S3 bucket {bucket_name} at {s3_path}"
 
-def iac_estimate_tool(prompt):
+def cost_baseline_key(session_id):
+    """
+    Returns the S3 key of the last cost estimate of a session, the baseline of incremental estimates.
+
+    Args:
+        session_id (str): The agent session ID.
+
+    Returns:
+        str: The S3 key of the baseline.
+    """
+    return f"{iac_cost_prefix}baseline/{session_id}.json"
+
+def load_cost_baseline(s3, session_id):
+    """
+    Loads the last cost estimate of a session.
+
+    Args:
+        s3: The S3 client.
+        session_id (str): The agent session ID.
+
+    Returns:
+        dict: The S3 key of the estimated Terraform code, its content hash and the Infracost JSON, or None if there is none.
+    """
+    from botocore.exceptions import ClientError
+
+    try:
+        response = s3.get_object(Bucket=iac_bucket_name, Key=cost_baseline_key(session_id))
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+            raise
+        return None
+    return json.loads(response["Body"].read())
+
+def load_baseline_terraform(s3, baseline):
+    """
+    Loads the Terraform code a baseline estimated.
+
+    Args:
+        s3: The S3 client.
+        baseline (dict): The result of load_cost_baseline.
+
+    Returns:
+        str: The Terraform code, or None if the file no longer exists.
+    """
+    from botocore.exceptions import ClientError
+
+    # Baselines written before they referred to the generated file carry the code itself
+    if "terraform" in baseline:
+        return baseline["terraform"]
+    try:
+        response = s3.get_object(Bucket=iac_bucket_name, Key=baseline["key"])
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+            raise
+        return None
+    return response["Body"].read().decode('utf-8')
+
+def save_cost_baseline(s3, session_id, terraform_key, content_hash, breakdown_json):
+    """
+    Stores a cost estimate as the baseline of the next incremental estimate of the session.
+
+    Generated files are never overwritten, so the baseline refers to the estimated
+    code by its key and estimates served from the cache need not download it.
+
+    Args:
+        s3: The S3 client.
+        session_id (str): The agent session ID.
+        terraform_key (str): The S3 key of the estimated Terraform code.
+        content_hash (str): The content hash of the code.
+        breakdown_json (str): The Infracost JSON of the estimate.
+    """
+    baseline = {"key": terraform_key, "sha256": content_hash, "breakdown_json": breakdown_json}
+    s3.put_object(Bucket=iac_bucket_name, Key=cost_baseline_key(session_id),
+                  Body=json.dumps(baseline).encode('utf-8'), ContentType="application/json")
+
+def iac_estimate_tool(prompt, session_id=None, narrative=None, progress=None, incremental=None):
     """
     Estimates the cost of an AWS infrastructure using Infracost.
 
+    The monthly cost per service and the total are aggregated from the Infracost
+    JSON output in code. A model-written narrative is only added on request.
+
+    When the session was estimated before, only the resources changed since then are
+    estimated again, and the cost change is reported along with the new total.
+
     Args:
         prompt (str): The customer's request.
+        session_id (str): The agent session ID whose latest Terraform file is estimated.
+        narrative (bool): Whether to add an LLM explanation of the costs. Defaults to IAC_ESTIMATE_NARRATIVE.
+        progress (callable): Called with the name of each stage as it starts, used by estimate jobs.
+        incremental (bool): Whether to compare with the last estimate of the session. Defaults to IAC_ESTIMATE_INCREMENTAL.
 
     Returns:
-        str: The cost estimation.
+        str: The cost estimation, or the cost change since the last estimate.
     """
-    prompt_ending = "Given the estimated costs for an AWS cloud infrastructure, provide a breakdown of the monthly cost for each service. For services with multiple line items (e.g., RDS), aggregate the costs into a single total for that service. Present the cost analysis as a list, with each service and its corresponding monthly cost. Finally, include the total monthly cost for the entire infrastructure."
+    if narrative is None:
+        narrative = IAC_ESTIMATE_NARRATIVE
+    if incremental is None:
+        incremental = IAC_ESTIMATE_INCREMENTAL
+    # Baselines are kept per session, estimates without one always cover the whole code
+    incremental = incremental and session_id is not None
+    progress = progress or (lambda stage: None)
+    prompt_ending = "Above is the estimated monthly cost of an AWS cloud infrastructure per service, already aggregated. Do not recalculate the numbers. Briefly explain the main cost drivers and suggest how the customer could reduce the cost."
+    diff_prompt_ending = "Above is how the estimated monthly cost of an AWS cloud infrastructure changed with the latest revision of its Terraform code, already calculated. Do not recalculate the numbers. Briefly explain what drives the change and suggest how the customer could reduce the cost."
     
     # Get terraform code from S3
-    s3 = boto3.client('s3')
-    bucket_name = "bedrock-agent-generate-iac-estimate-cost"
-    prefix_code = "iac-code"
-    prefix_cost = "iac-cost"
+    s3 = bedrock_client.get_client('s3')
+    bucket_name = iac_bucket_name
+    prefix_cost = iac_cost_prefix
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"iac_cost_{timestamp}.tf"
     local_dir = '/tmp/infracost-evaluate'
     
-    # Create the local directory if it doesn't exist
-    os.makedirs(local_dir, exist_ok=True)
-
-    # List objects in the S3 folder sorted by LastModified in descending order
-    objects = s3.list_objects_v2(Bucket=bucket_name, Prefix=prefix_code)
-    sorted_objects = sorted(objects['Contents'], key=lambda obj: obj['LastModified'], reverse=True)
-    
-    # Get the latest file key
-    latest_file_key = sorted_objects[0]['Key']
-    
-    # Download the latest file
-    local_file_path = os.path.join(local_dir, os.path.basename(latest_file_key))
-    s3.download_file(bucket_name, latest_file_key, local_file_path)
-    
-    # Generate timestamp-based file name
-    cost_filename = f"cost-evaluation-{timestamp}.txt"
-    cost_file_path = f"/tmp/{cost_filename}"
-    
-    # Run Infracost CLI command
-    infracost_cmd = f"infracost breakdown --path /tmp/infracost-evaluate > {cost_file_path}"
-    try:
-        subprocess.run(infracost_cmd, shell=True, check=True)
-    except subprocess.CalledProcessError as e:
-        # Read the result file even if the command returns a non-zero exit code
-        with open(cost_file_path, 'r') as f:
-            cost_file = f.read()
-        print(f"Infracost command returned non-zero exit code: {e.returncode}")
-        print(f"Result: {cost_file}")
+    # Get the latest file from the session manifest
+    progress("download")
+    manifest = find_latest_iac(s3, session_id)
+    if manifest is None:
+        return "No infrastructure code has been generated in this session yet. Generate the Terraform code first, then ask for its cost estimate."
+    latest_file_key = manifest["key"]
+    content_hash = manifest.get("sha256")
+    terraform_code = None
+    if content_hash is None:
+        # Older manifests and listed files carry no hash, download to compute it
+        terraform_code = s3.get_object(Bucket=bucket_name, Key=latest_file_key)["Body"].read().decode('utf-8')
+        content_hash = terraform_content_hash(terraform_code)
+    baseline = load_cost_baseline(s3, session_id) if incremental else None
+
+    # Repeat estimates of the same code are served from the cache without downloading
+    # the code or running Infracost, incremental or not
+    cache_key = cost_cache_key(content_hash, infracost_version())
+    cached = cost_cache.get(cache_key)
+    upload = None
+    if cached is not None:
+        breakdown_json = cached["breakdown_json"]
+        breakdown = json.loads(breakdown_json)
+        tracing.log("Cost cache hit", **cost_cache.stats())
+    elif baseline is not None and baseline["sha256"] == content_hash:
+        breakdown_json = baseline["breakdown_json"]
+        breakdown = json.loads(breakdown_json)
     else:
-        with open(cost_file_path, 'r') as f:
-            cost_file = f.read()
-        print(f"Result: {cost_file}")
-    
-    # Upload cost evaluation file to S3 under the "iac-cost" folder
-    s3_cost_result = os.path.join(prefix_cost, cost_filename)
-    s3.upload_file(cost_file_path, bucket_name, s3_cost_result)
+        # With a baseline, only the changed resources are estimated, together with the
+        # resources and shared blocks they refer to; the other costs come from the baseline
+        plan = None
+        if baseline is not None:
+            if terraform_code is None:
+                terraform_code = s3.get_object(Bucket=bucket_name, Key=latest_file_key)["Body"].read().decode('utf-8')
+            baseline_terraform = load_baseline_terraform(s3, baseline)
+            if baseline_terraform is not None:
+                plan = plan_incremental(baseline_terraform, terraform_code)
+
+        # Each Terraform file is estimated in its own directory, so files from earlier
+        # invocations on a warm container are not mixed into the estimate. A reduced
+        # project gets a private directory: it is not the code its content hash names.
+        os.makedirs(local_dir, exist_ok=True)
+        if plan is not None:
+            project_dir = tempfile.mkdtemp(prefix="incremental-", dir=local_dir)
+        else:
+            project_dir = os.path.join(local_dir, content_hash)
+            os.makedirs(project_dir, exist_ok=True)
+        local_file_path = os.path.join(project_dir, "main.tf")
+        if plan is not None:
+            with open(local_file_path, 'w') as f:
+                f.write(plan["terraform"])
+        elif terraform_code is None:
+            s3.download_file(bucket_name, latest_file_key, local_file_path)
+        else:
+            with open(local_file_path, 'w') as f:
+                f.write(terraform_code)
+
+        # Run Infracost CLI command with JSON output, killed at the invocation deadline
+        progress("infracost")
+        deadline.check("infracost")
+        start = time.monotonic()
+        if plan is None:
+            # Failed runs raise, so a parseable error report is never cached as the estimate
+            breakdown, breakdown_json = run_infracost_json(project_dir)
+            cost_cache.put(cache_key, breakdown_json, time.monotonic() - start)
+        else:
+            # Merged breakdowns are built from the baseline, so they are never cached
+            # as the exact estimate of the full code
+            try:
+                partial = run_infracost_json(project_dir)[0] if plan["changed"] else None
+            finally:
+                shutil.rmtree(project_dir, ignore_errors=True)
+            breakdown = merge_breakdowns(json.loads(baseline["breakdown_json"]), partial, plan)
+            breakdown_json = json.dumps(breakdown)
+            tracing.log("Incremental estimate", resources=plan["resources"], changed=len(plan["changed"]),
+                        context=len(plan["context"]), removed=len(plan["removed"]))
+
+        # Upload the Infracost JSON to S3 under the "iac-cost" folder, in the background:
+        # nothing below depends on it, so it overlaps with the narrative
+        progress("upload")
+        s3_cost_result = f"{prefix_cost}cost-evaluation-{timestamp}.json"
+        upload = background.submit(
+            tracing.bind(deadline.bind(s3.put_object)),
+            Bucket=bucket_name, Key=s3_cost_result, Body=breakdown_json.encode('utf-8'), ContentType="application/json",
+        )
+
+    # This estimate becomes the baseline of the next one
+    saved = None
+    if incremental and (baseline is None or baseline["sha256"] != content_hash):
+        saved = background.submit(tracing.bind(deadline.bind(save_cost_baseline)),
+                                  s3, session_id, latest_file_key, content_hash, breakdown_json)
+
+    # Aggregate the costs per service, or report only what changed since the baseline:
+    # the narrative then explains a few lines instead of every service
+    if baseline is not None:
+        summary = format_cost_diff(diff_breakdowns(json.loads(baseline["breakdown_json"]), breakdown))
+        prompt_ending = diff_prompt_ending
+    else:
+        summary = format_cost_summary(aggregate_breakdown(breakdown))
+    tracing.log("Cost estimate", payload={"summary": summary})
     
-    generated_text = call_claude_sonnet(cost_file + prompt + prompt_ending)
-    return generated_text
\ No newline at end of file
+    try:
+        # The narrative is skipped when there is no time left for it, the summary is complete without it
+        if not narrative:
+            return summary
+        if deadline.short_on_time():
+            tracing.log("Cost narrative skipped", remaining=deadline.remaining())
+            return summary
+        progress("narrative")
+        generated_text = model_router.generate("cost_narrative", summary + "\n" + prompt + prompt_ending)
+        return summary + "\n\n" + generated_text
+    finally:
+        # The estimate is only reported once the result is stored
+        for pending in (upload, saved):
+            if pending is not None:
+                pending.result()
+
+def make_job_store():
+    """
+    Creates the job store selected by JOB_STORE.
+
+    Returns:
+        InMemoryJobStore or S3JobStore.
+    """
+    if JOB_STORE == "s3":
+        return S3JobStore(lambda: bedrock_client.get_client('s3'), iac_bucket_name, iac_job_prefix)
+    return InMemoryJobStore()
+
+# Process-wide runner of cost estimate jobs
+job_runner = JobRunner(make_job_store(), max_workers=JOB_WORKERS, timeout=JOB_TIMEOUT_SECONDS)
+
+def submit_iac_estimate(prompt, session_id=None):
+    """
+    Starts a cost estimation job and returns without waiting for it.
+
+    The job estimates the latest Terraform file of the session like iac_estimate_tool.
+    Poll its status with iac_estimate_status.
+
+    Args:
+        prompt (str): The customer's request.
+        session_id (str): The agent session ID whose latest Terraform file is estimated.
+
+    Returns:
+        str: JSON with the `job_id` and its `status`.
+    """
+    job = job_runner.submit("/iac_estimate_job", iac_estimate_tool, prompt, session_id)
+    tracing.log("Job submitted", job_id=job["job_id"])
+    return json.dumps({"job_id": job["job_id"], "status": job["status"]})
+
+def iac_estimate_status(job_id):
+    """
+    Reports the status of a cost estimation job.
+
+    Args:
+        job_id (str): The ID returned by submit_iac_estimate.
+
+    Returns:
+        str: JSON with the job `status` (queued, running, succeeded or failed), its current
+        `stage`, and once finished the cost estimation as `result` or the `error`.
+    """
+    job = job_runner.status(job_id.strip())
+    if job is None:
+        return json.dumps({"job_id": job_id, "status": "unknown"})
+    return json.dumps({key: job[key] for key in ("job_id", "status", "stage", "result", "error")})
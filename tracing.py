@@ -0,0 +1,276 @@
+import contextlib
+import json
+import os
+import random
+import threading
+import time
+
+# Fraction of invocations whose individual spans are logged. The per-stage
+# metrics are emitted for every invocation, they are one log line each.
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0.1"))
+
+# Set TRACE_METRICS=false to stop emitting CloudWatch embedded metric format lines
+TRACE_METRICS = os.environ.get("TRACE_METRICS", "true").lower() == "true"
+TRACE_NAMESPACE = os.environ.get("TRACE_NAMESPACE", "BedrockAgentIaC")
+
+# Queries, prompts and answers are logged as their length only. Set
+# TRACE_REDACT=false to log them, cut to TRACE_MAX_VALUE_CHARS, when debugging.
+TRACE_REDACT = os.environ.get("TRACE_REDACT", "true").lower() == "true"
+TRACE_MAX_VALUE_CHARS = int(os.environ.get("TRACE_MAX_VALUE_CHARS", "200"))
+
+_local = threading.local()
+
+
+class Span:
+    """
+    A timed stage of an invocation. Attributes can be added while it runs.
+    """
+
+    def __init__(self, name, parent=None, **attributes):
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+class Trace:
+    """
+    The spans of one handler invocation.
+    """
+
+    def __init__(self, route, sampled, **attributes):
+        self.route = route
+        self.sampled = sampled
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.spans = []
+
+
+def current_trace():
+    return getattr(_local, "trace", None)
+
+
+def _stack():
+    # Open spans of this thread; threads sharing a trace through bind() each have their own
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def redact(value):
+    """
+    Redacts a payload value for logging.
+
+    Args:
+        value: The value to log, e.g. a query or a model response.
+
+    Returns:
+        The value's length when TRACE_REDACT is set, otherwise the value cut to TRACE_MAX_VALUE_CHARS.
+    """
+    text = value if isinstance(value, str) else json.dumps(value, default=str)
+    if TRACE_REDACT:
+        return f"<{len(text)} chars>"
+    return text if len(text) <= TRACE_MAX_VALUE_CHARS else text[:TRACE_MAX_VALUE_CHARS] + "..."
+
+
+def log(message, payload=None, **fields):
+    """
+    Writes one structured JSON log line.
+
+    Args:
+        message (str): What happened.
+        payload (dict): Fields holding user or model content, passed through redact.
+        **fields: Fields logged as they are.
+    """
+    record = {"message": message}
+    trace = current_trace()
+    if trace is not None:
+        record["route"] = trace.route
+    record.update(fields)
+    for key, value in (payload or {}).items():
+        record[key] = redact(value)
+    print(json.dumps(record, default=str))
+
+
+@contextlib.contextmanager
+def trace(route, sample_rate=None, **attributes):
+    """
+    Traces one handler invocation. Spans opened in this thread while it is active are
+    collected, then emitted as metrics and, if the invocation is sampled, as a span log.
+
+    Args:
+        route (str): The API path, used as the metrics dimension.
+        sample_rate (float): Overrides TRACE_SAMPLE_RATE for this invocation.
+        **attributes: Fields added to the span log, e.g. the session ID.
+
+    Yields:
+        Trace: The active trace.
+    """
+    rate = TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+    previous, previous_stack = current_trace(), getattr(_local, "stack", None)
+    _local.trace = Trace(route, random.random() < rate, **attributes)
+    _local.stack = []
+    try:
+        yield _local.trace
+    finally:
+        active, _local.trace, _local.stack = _local.trace, previous, previous_stack
+        emit(active)
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """
+    Times a stage of the current invocation. Outside of a trace the span is not recorded.
+
+    Args:
+        name (str): The stage name, e.g. 'kb.retrieve'.
+        **attributes: Fields recorded with the span, e.g. the number of results.
+
+    Yields:
+        Span: The span, whose set() adds attributes such as token counts.
+    """
+    trace = current_trace()
+    stack = _stack()
+    current = Span(name, stack[-1].name if trace and stack else None, **attributes)
+    if trace is None:
+        yield current
+        return
+    stack.append(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.set(error=type(e).__name__)
+        raise
+    finally:
+        current.duration = time.perf_counter() - current.start
+        stack.remove(current)
+        trace.spans.append(current)
+
+
+def record_span(name, seconds, **attributes):
+    """
+    Records a stage that was timed elsewhere, e.g. a model stream that ended in a generator.
+
+    Args:
+        name (str): The stage name.
+        seconds (float): How long the stage took.
+        **attributes: Fields recorded with the span.
+    """
+    trace = current_trace()
+    if trace is None:
+        return
+    stack = _stack()
+    current = Span(name, stack[-1].name if stack else None, **attributes)
+    current.start -= seconds
+    current.duration = seconds
+    trace.spans.append(current)
+
+
+def bind(fn):
+    """
+    Binds a function to the current trace, for work handed to another thread.
+
+    The other thread gets a span stack of its own, starting at the span open when
+    bind is called, so spans running in parallel never become each other's parents.
+
+    Args:
+        fn (callable): The function to run in the other thread.
+
+    Returns:
+        callable: A function that runs fn with the caller's trace active.
+    """
+    bound = current_trace()
+    stack = _stack()
+    parent = stack[-1:] if bound is not None else []
+
+    def run(*args, **kwargs):
+        previous, previous_stack = current_trace(), getattr(_local, "stack", None)
+        _local.trace, _local.stack = bound, list(parent)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.trace, _local.stack = previous, previous_stack
+    return run
+
+
+def _before_call(model, context, **kwargs):
+    context["trace_start"] = time.perf_counter()
+
+
+def _after_call(model, context, http_response=None, exception=None, **kwargs):
+    start = context.pop("trace_start", None)
+    if start is None:
+        return
+    attributes = {"status": getattr(http_response, "status_code", None)}
+    if exception is not None:
+        attributes["error"] = type(exception).__name__
+    record_span(f"aws.{model.service_model.service_name}.{model.name}", time.perf_counter() - start, **attributes)
+
+
+def instrument_client(client):
+    """
+    Records a span for every API call made with a boto3 client, e.g. 'aws.s3.GetObject'.
+
+    Args:
+        client: The boto3 client. Clients without botocore events, such as stubs, are left as they are.
+    """
+    events = getattr(getattr(client, "meta", None), "events", None)
+    if events is None:
+        return
+    events.register("before-call", _before_call)
+    events.register("after-call", _after_call)
+    events.register("after-call-error", _after_call)
+
+
+def emit(trace):
+    """
+    Writes the metrics of a finished trace in CloudWatch embedded metric format and,
+    if it is sampled, its spans as a JSON log line.
+
+    Args:
+        trace (Trace): The finished trace.
+    """
+    duration = time.perf_counter() - trace.start
+    stages = {}
+    tokens = {"InputTokens": 0, "OutputTokens": 0}
+    for current in trace.spans:
+        stages[current.name] = stages.get(current.name, 0.0) + current.duration * 1000
+        tokens["InputTokens"] += current.attributes.get("input_tokens", 0)
+        tokens["OutputTokens"] += current.attributes.get("output_tokens", 0)
+
+    if TRACE_METRICS:
+        metrics = [{"Name": "Duration", "Unit": "Milliseconds"}]
+        metrics += [{"Name": name, "Unit": "Milliseconds"} for name in stages]
+        metrics += [{"Name": name, "Unit": "Count"} for name in tokens]
+        record = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{"Namespace": TRACE_NAMESPACE, "Dimensions": [["Route"]], "Metrics": metrics}],
+            },
+            "Route": trace.route,
+            "Duration": duration * 1000,
+        }
+        record.update((name, round(ms, 3)) for name, ms in stages.items())
+        record.update(tokens)
+        print(json.dumps(record))
+
+    if trace.sampled:
+        spans = [
+            {
+                "name": current.name,
+                "parent": current.parent,
+                "start_ms": round((current.start - trace.start) * 1000, 3),
+                "duration_ms": round(current.duration * 1000, 3),
+                **current.attributes,
+            }
+            for current in sorted(trace.spans, key=lambda s: s.start)
+        ]
+        record = {"message": "Trace", "route": trace.route, "duration_ms": round(duration * 1000, 3)}
+        record.update(trace.attributes)
+        record["spans"] = spans
+        print(json.dumps(record, default=str))